@@ -108,6 +108,8 @@ class ContextService(mitogen.service.Service):
     the connection parameters (sharding).
     """
     max_interpreters = int(os.getenv('MITOGEN_MAX_INTERPRETERS', '20'))
+    fork_pool_size = int(os.getenv('MITOGEN_FORK_POOL_SIZE', '0'))
+    fork_freeze_gc = bool(os.getenv('MITOGEN_FORK_FREEZE_GC'))
 
     def __init__(self, *args, **kwargs):
         super(ContextService, self).__init__(*args, **kwargs)
@@ -272,6 +274,16 @@ class ContextService(mitogen.service.Service):
         for fullname in self.ALWAYS_PRELOAD:
             self.router.responder.forward_module(context, fullname)
 
+    def _get_fork_preload(self):
+        """
+        When the fork parent freezes its heap before forking, have it import
+        :attr:`ALWAYS_PRELOAD`, so the modules are shared by every child rather
+        than imported, and copied, by each of them.
+        """
+        if self.fork_freeze_gc:
+            return self.ALWAYS_PRELOAD
+        return ()
+
     _candidate_temp_dirs = None
 
     def _get_candidate_temp_dirs(self):
@@ -334,6 +346,9 @@ class ContextService(mitogen.service.Service):
             ansible_mitogen.target.init_child,
             log_level=LOG.getEffectiveLevel(),
             candidate_temp_dirs=self._get_candidate_temp_dirs(),
+            fork_pool_size=self.fork_pool_size,
+            fork_freeze_gc=self.fork_freeze_gc,
+            fork_preload=self._get_fork_preload(),
         )
 
         if os.environ.get('MITOGEN_DUMP_THREAD_STACKS'):
@@ -85,6 +85,10 @@ MAKE_TEMP_FAILED_MSG = (
 #: the target Python interpreter before it executes any code or imports.
 _fork_parent = None
 
+#: In the fork parent, set by init_fork_parent() to a :class:`mitogen.fork.Pool`
+#: of children prepared ahead of use by create_fork_child().
+_fork_pool = None
+
 #: Set by init_child() to a list of candidate $variable-expanded and
 #: tilde-expanded directory paths that may be usable as a temporary directory.
 _candidate_temp_dirs = None
@@ -277,7 +281,8 @@ def reset_temp_dir(econtext):
 
 
 @mitogen.core.takes_econtext
-def init_child(econtext, log_level, candidate_temp_dirs):
+def init_child(econtext, log_level, candidate_temp_dirs, fork_pool_size=0,
+               fork_freeze_gc=False, fork_preload=()):
     """
     Called by ContextService immediately after connection; arranges for the
     (presently) spotless Python interpreter to be forked, where the newly
@@ -293,6 +298,15 @@ def init_child(econtext, log_level, candidate_temp_dirs):
     :param list[str] candidate_temp_dirs:
         List of $variable-expanded and tilde-expanded directory names to add to
         candidate list of temporary directories.
+    :param int fork_pool_size:
+        If nonzero, number of children the fork parent should keep ready for
+        :func:`create_fork_child`.
+    :param bool fork_freeze_gc:
+        If :data:`True`, the fork parent calls :func:`mitogen.fork.freeze_gc`
+        once its modules are imported, before forking any children.
+    :param list[str] fork_preload:
+        Names of modules the fork parent should import, so that children
+        inherit them.
 
     :returns:
         Dict like::
@@ -312,6 +326,12 @@ def init_child(econtext, log_level, candidate_temp_dirs):
     global _fork_parent
     mitogen.parent.upgrade_router(econtext)
     _fork_parent = econtext.router.fork()
+    if fork_pool_size or fork_freeze_gc or fork_preload:
+        _fork_parent.call_no_reply(init_fork_parent,
+            pool_size=fork_pool_size,
+            freeze_gc=fork_freeze_gc,
+            preload=fork_preload,
+        )
     reset_temp_dir(econtext)
 
     # Copying the master's log level causes log messages to be filtered before
@@ -327,6 +347,36 @@ def init_child(econtext, log_level, candidate_temp_dirs):
     }
 
 
+@mitogen.core.takes_econtext
+def init_fork_parent(pool_size, freeze_gc, preload, econtext):
+    """
+    Called in the fork parent by init_child() to import the modules in
+    `preload`, if `freeze_gc` is :data:`True`, freeze the resulting heap so
+    every child shares it, and if `pool_size` is nonzero, arrange for that
+    many children to be forked ahead of time with their temporary directory
+    already created, so that :func:`create_fork_child` need not wait for them.
+    """
+    global _fork_pool
+    mitogen.parent.upgrade_router(econtext)
+    for fullname in preload:
+        try:
+            __import__(fullname)
+        except ImportError:
+            LOG.debug('init_fork_parent: cannot preload %r', fullname,
+                      exc_info=True)
+
+    # Frozen once, rather than before every fork, so garbage later created
+    # by this long-lived process can still be collected.
+    if freeze_gc:
+        mitogen.fork.freeze_gc()
+    if pool_size:
+        _fork_pool = mitogen.fork.Pool(
+            router=econtext.router,
+            size=pool_size,
+            on_start=reset_temp_dir,
+        )
+
+
 @mitogen.core.takes_econtext
 def create_fork_child(econtext):
     """
@@ -335,8 +385,11 @@ def create_fork_child(econtext):
     prepared.
     """
     mitogen.parent.upgrade_router(econtext)
-    context = econtext.router.fork()
-    context.call(reset_temp_dir)
+    if _fork_pool is not None:
+        context = _fork_pool.get()
+    else:
+        context = econtext.router.fork()
+        context.call(reset_temp_dir)
     LOG.debug('create_fork_child() -> %r', context)
     return context
 
@@ -39,6 +39,7 @@ import fcntl
 import imp
 import itertools
 import logging
+import marshal
 import os
 import signal
 import socket
@@ -89,6 +90,7 @@ LOAD_MODULE = 107
 FORWARD_MODULE = 108
 DETACHING = 109
 CALL_SERVICE = 110
+PICKLE_PROTOCOL = 111
 IS_DEAD = 999
 
 try:
@@ -144,7 +146,43 @@ if sys.version_info < (2, 5):
 #: writing small trailer chunks.
 CHUNK_SIZE = 131072
 
+#: :data:`True` if the interpreter provides :class:`bytearray`,
+#: :class:`memoryview` and :func:`struct.unpack_from`, allowing
+#: :class:`Stream` to receive into a single preallocated buffer and parse
+#: messages in place. Python 2.4-2.6 lack one or more of these.
+try:
+    memoryview(bytearray())
+    HAVE_MEMORYVIEW = hasattr(struct, 'unpack_from')
+except NameError:
+    HAVE_MEMORYVIEW = False
+
+# os.readv() and os.writev() appeared in Python 3.3.
+_readv = getattr(os, 'readv', None)
+_writev = getattr(os, 'writev', None)
+
+#: Maximum number of buffers accepted by a single :func:`os.writev` call.
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = -1
+if IOV_MAX < 1:
+    # POSIX minimum (_XOPEN_IOV_MAX).
+    IOV_MAX = 16
+
+# os.eventfd() appeared in Python 3.10, and exists only on Linux.
+_eventfd = getattr(os, 'eventfd', None)
+
+#: Identifies the bytecode this interpreter executes: its magic number, and
+#: its optimization level, which changes the code generated for ``assert``
+#: and docstrings. Children send it with each :data:`GET_MODULE` request, and
+#: only accept precompiled code from their parent carrying an identical tag.
+BYTECODE_TAG = u'%d-%d' % (
+    struct.unpack('<I', imp.get_magic())[0],
+    getattr(getattr(sys, 'flags', None), 'optimize', 0),
+)
+
 _tls = threading.local()
+_object_new = object.__new__
 
 
 if __name__ == 'mitogen.core':
@@ -181,13 +219,24 @@ class LatchError(Error):
 
 class Blob(BytesType):
     """A serializable bytes subclass whose content is summarized in repr()
-    output, making it suitable for logging binary data."""
+    output, making it suitable for logging binary data. When serialized using
+    pickle protocol 5 or above, blobs of at least :attr:`OOB_MIN_SIZE` bytes
+    are passed out-of-band, avoiding a copy into the pickle stream."""
+
+    #: Size in bytes beyond which protocol 5 out-of-band buffers are used.
+    OOB_MIN_SIZE = 4096
+
     def __repr__(self):
         return '[blob: %d bytes]' % len(self)
 
     def __reduce__(self):
         return (Blob, (BytesType(self),))
 
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5 and len(self) >= self.OOB_MIN_SIZE:
+            return (Blob, (pickle.PickleBuffer(self),))
+        return self.__reduce__()
+
 
 class Secret(UnicodeType):
     """A serializable unicode subclass whose content is masked in repr()
@@ -298,13 +347,26 @@ def listen(obj, name, func):
     signals.setdefault(name, []).append(func)
 
 
+def unlisten(obj, name, func):
+    """
+    Remove `func` from the functions invoked when the named signal is fired
+    by `obj`, as registered by :func:`listen`.
+
+    :raises ValueError:
+        `func` was not registered.
+    """
+    signals = vars(obj).get('_signals', {})
+    signals.get(name, []).remove(func)
+
+
 def fire(obj, name, *args, **kwargs):
     """
     Arrange for `func(*args, **kwargs)` to be invoked for every function
     registered for the named signal on `obj`.
     """
     signals = vars(obj).get('_signals', {})
-    return [func(*args, **kwargs) for func in signals.get(name, ())]
+    # Copy, as functions may be unregistered while the signal is firing.
+    return [func(*args, **kwargs) for func in list(signals.get(name, ()))]
 
 
 def takes_econtext(func):
@@ -487,25 +549,179 @@ else:
     _Unpickler = pickle.Unpickler
 
 
+#: Sentinel stored in :attr:`Message._unpickled` until :meth:`Message.unpickle`
+#: has been called.
+_NOT_UNPICKLED = object()
+
+#: Prefix of message data consisting of a protocol 5 pickle and the
+#: out-of-band buffers it references, encoded as `prefix, count, count *
+#: length, buffers.., pickle`. It resembles the start of a pickle with an
+#: unsupported protocol version, so that it fails cleanly if unpickled directly.
+_OOB_PREFIX = struct.pack('>BB', 0x80, 0xb5)
+_OOB_PREFIX_LEN = len(_OOB_PREFIX)
+
+
+def _dumps(obj, protocol):
+    """
+    Pickle `obj` using `protocol`, returning a list of buffers whose
+    concatenation is the message data. For protocol 5 and above, buffers
+    exported out-of-band are framed following the pickle rather than copied
+    into it, and the list is `[header, buffers.., pickle]`. Otherwise it
+    contains only the pickle.
+    """
+    if protocol < 5:
+        return [pickle.dumps(obj, protocol=protocol)]
+
+    buffers = []
+    s = pickle.dumps(obj, protocol=protocol, buffer_callback=buffers.append)
+    if not buffers:
+        return [s]
+
+    views = [buf.raw() for buf in buffers]
+    hdr = _OOB_PREFIX + struct.pack('>%dL' % (1 + len(views),), len(views),
+                                    *[len(view) for view in views])
+    return [hdr] + views + [s]
+
+
+def _slice_bits(bits, size):
+    """
+    Yield lists of memoryviews over the buffers in `bits`, each describing the
+    next `size` bytes of their concatenation, or fewer for the final list.
+    """
+    piece = []
+    room = size
+    for bit in bits:
+        view = memoryview(bit)
+        offset = 0
+        while offset < len(view):
+            n = min(room, len(view) - offset)
+            piece.append(view[offset:offset+n])
+            offset += n
+            room -= n
+            if not room:
+                yield piece
+                piece = []
+                room = size
+    if piece:
+        yield piece
+
+
+def _split_oob(data):
+    """
+    Split `data` produced by :func:`_dumps` into the pickle and a list of
+    out-of-band buffers. Both reference `data` rather than copying it.
+    """
+    view = memoryview(data)
+    offset = _OOB_PREFIX_LEN + 4
+    if len(data) < offset:
+        raise ValueError('truncated out-of-band header')
+    count, = struct.unpack_from('>L', data, _OOB_PREFIX_LEN)
+    if len(data) < (offset + 4*count):
+        raise ValueError('truncated out-of-band header')
+    lengths = struct.unpack_from('>%dL' % (count,), data, offset)
+    offset += 4 * count
+    buffers = []
+    for length in lengths:
+        if len(data) < (offset + length):
+            raise ValueError('truncated out-of-band buffer')
+        buffers.append(view[offset:offset+length])
+        offset += length
+    return view[offset:], buffers
+
+
 class Message(object):
-    dst_id = None
-    src_id = None
-    auth_id = None
-    handle = None
-    reply_to = None
-    data = b('')
-    _unpickled = object()
+    __slots__ = ('dst_id', 'src_id', 'auth_id', 'handle', 'reply_to', '_data',
+                 '_bits', 'router', 'receiver', 'more', 'priority',
+                 '_unpickled')
+
+    def __init__(self, dst_id=None, src_id=None, auth_id=None, handle=None,
+                 reply_to=None, data=b(''), router=None, receiver=None,
+                 more=False, priority=False):
+        if src_id is None:
+            src_id = mitogen.context_id
+        if auth_id is None:
+            auth_id = mitogen.context_id
+        self.dst_id = dst_id
+        self.src_id = src_id
+        self.auth_id = auth_id
+        self.handle = handle
+        self.reply_to = reply_to
+        self._data = data
+        self._bits = None
+        self.router = router
+        self.receiver = receiver
+        self.more = more
+        self.priority = priority
+        self._unpickled = _NOT_UNPICKLED
+        assert isinstance(data, BytesType)
+
+    @classmethod
+    def _new(cls, dst_id, src_id, auth_id, handle, reply_to, data, router,
+             more=False, priority=False):
+        """
+        Construct a message from every header field, skipping the defaults and
+        type check of :meth:`__init__`. Used for messages parsed by
+        :class:`Stream`, where `data` is already known to be bytes.
+        """
+        self = _object_new(cls)
+        self.dst_id = dst_id
+        self.src_id = src_id
+        self.auth_id = auth_id
+        self.handle = handle
+        self.reply_to = reply_to
+        self._data = data
+        self._bits = None
+        self.router = router
+        self.receiver = None
+        self.more = more
+        self.priority = priority
+        self._unpickled = _NOT_UNPICKLED
+        return self
+
+    def _get_data(self):
+        data = self._data
+        if data is None:
+            # _bits is left in place, so a concurrent reader never sees both
+            # unset, and the stream can still queue the buffers without a copy.
+            data = self._data = b('').join(self._bits)
+        return data
 
-    router = None
-    receiver = None
+    def _set_data(self, data):
+        self._data = data
+        self._bits = None
+
+    #: The message body. For messages whose pickle references out-of-band
+    #: buffers, this joins them into a new string on first access.
+    data = property(_get_data, _set_data)
+
+    def _set_bits(self, bits):
+        """
+        Set the message body to the concatenation of the buffers in `bits`,
+        as returned by :func:`_dumps`, without joining them.
+        """
+        if len(bits) == 1:
+            self.data = bits[0]
+        else:
+            self._data = None
+            self._bits = bits
 
-    def __init__(self, **kwargs):
-        self.src_id = mitogen.context_id
-        self.auth_id = mitogen.context_id
-        vars(self).update(kwargs)
-        assert isinstance(self.data, BytesType)
+    def _data_len(self):
+        """
+        Return the length of the message body, without joining out-of-band
+        buffers.
+        """
+        bits = self._bits
+        if bits is None:
+            return len(self._data)
+        return sum(len(bit) for bit in bits)
 
     def _unpickle_context(self, context_id, name):
+        if self.src_id == mitogen.context_id and self.router:
+            # Pickled by this process: return the instance the router
+            # registered, so listeners on it see its 'disconnect' signal.
+            context = self.router._context_by_id.get(context_id)
+            if context is not None:
+                return context
         return _unpickle_context(self.router, context_id, name)
 
     def _unpickle_sender(self, context_id, dst_handle):
@@ -546,23 +762,35 @@ class Message(object):
         return cls(reply_to=IS_DEAD, **kwargs)
 
     @classmethod
-    def pickled(cls, obj, **kwargs):
-        self = cls(**kwargs)
+    def pickled(cls, obj, protocol=2, **kwargs):
+        """
+        Construct a message whose data is `obj` serialized using pickle
+        `protocol`. The default protocol 2 is understood by every Python
+        version, higher protocols should only be used as indicated by
+        :meth:`Router.get_pickle_protocol`.
+        """
         try:
-            self.data = pickle.dumps(obj, protocol=2)
+            bits = _dumps(obj, protocol)
         except pickle.PicklingError:
             e = sys.exc_info()[1]
-            self.data = pickle.dumps(CallError(e), protocol=2)
+            bits = _dumps(CallError(e), protocol)
+        self = cls(**kwargs)
+        self._set_bits(bits)
         return self
 
     def reply(self, msg, router=None, **kwargs):
+        router = self.router or router
         if not isinstance(msg, Message):
-            msg = Message.pickled(msg)
+            protocol = 2
+            if router:
+                protocol = router.get_pickle_protocol(self.src_id)
+            msg = Message.pickled(msg, protocol=protocol)
         msg.dst_id = self.src_id
         msg.handle = self.reply_to
-        vars(msg).update(kwargs)
+        for key, value in kwargs.items():
+            setattr(msg, key, value)
         if msg.handle:
-            (self.router or router).route(msg)
+            router.route(msg)
         else:
             LOG.debug('Message.reply(): discarding due to zero handle: %r', msg)
 
@@ -578,11 +806,21 @@ class Message(object):
             raise ChannelError(ChannelError.remote_msg)
 
         obj = self._unpickled
-        if obj is Message._unpickled:
-            fp = BytesIO(self.data)
-            unpickler = _Unpickler(fp, **self.UNPICKLER_KWARGS)
-            unpickler.find_global = self._find_global
+        if obj is _NOT_UNPICKLED:
             try:
+                bits = self._bits
+                kwargs = self.UNPICKLER_KWARGS
+                if bits is not None:
+                    data = bits[-1]
+                    kwargs = dict(kwargs, buffers=bits[1:-1])
+                else:
+                    data = self.data
+                    if data[:_OOB_PREFIX_LEN] == _OOB_PREFIX:
+                        data, buffers = _split_oob(data)
+                        kwargs = dict(kwargs, buffers=buffers)
+                fp = BytesIO(data)
+                unpickler = _Unpickler(fp, **kwargs)
+                unpickler.find_global = self._find_global
                 # Must occur off the broker thread.
                 obj = unpickler.load()
                 self._unpickled = obj
@@ -599,7 +837,8 @@ class Message(object):
     def __repr__(self):
         return 'Message(%r, %r, %r, %r, %r, %r..%d)' % (
             self.dst_id, self.src_id, self.auth_id, self.handle,
-            self.reply_to, (self.data or '')[:50], len(self.data)
+            self.reply_to, (self._bits or (self._data,))[0][:50],
+            self._data_len()
         )
 
 
@@ -619,10 +858,21 @@ class Sender(object):
         _vv and IOLOG.debug('%r.close()', self)
         self.context.send(Message.dead(handle=self.dst_handle))
 
-    def send(self, data):
-        """Send `data` to the remote."""
+    def send(self, data, block=False, timeout=None):
+        """Send `data` to the remote. See :meth:`Router.route` for the
+        meaning of `block` and `timeout`."""
         _vv and IOLOG.debug('%r.send(%r..)', self, repr(data)[:100])
-        self.context.send(Message.pickled(data, handle=self.dst_handle))
+        self.context.send(
+            Message.pickled(
+                data,
+                handle=self.dst_handle,
+                protocol=self.context.router.get_pickle_protocol(
+                    self.context.context_id
+                ),
+            ),
+            block=block,
+            timeout=timeout,
+        )
 
 
 def _unpickle_sender(router, context_id, dst_handle):
@@ -633,12 +883,16 @@ def _unpickle_sender(router, context_id, dst_handle):
     return Sender(Context(router, context_id), dst_handle)
 
 
+def _is_dead(msg):
+    return msg.is_dead
+
+
 class Receiver(object):
     notify = None
     raise_channelerror = True
 
     def __init__(self, router, handle=None, persist=True,
-                 respondent=None, policy=None):
+                 respondent=None, policy=None, fragments=False):
         self.router = router
         self.handle = handle  # Avoid __repr__ crash in add_handler()
         self._latch = Latch()  # Must exist prior to .add_handler()
@@ -648,6 +902,7 @@ class Receiver(object):
             policy=policy,
             persist=persist,
             respondent=respondent,
+            fragments=fragments,
         )
 
     def __repr__(self):
@@ -673,16 +928,36 @@ class Receiver(object):
     def empty(self):
         return self._latch.empty()
 
+    def _throw_dead(self, msg):
+        if msg.src_id == mitogen.context_id:
+            raise ChannelError(ChannelError.local_msg)
+        else:
+            raise ChannelError(ChannelError.remote_msg)
+
     def get(self, timeout=None, block=True, throw_dead=True):
         _vv and IOLOG.debug('%r.get(timeout=%r, block=%r)', self, timeout, block)
         msg = self._latch.get(timeout=timeout, block=block)
         if msg.is_dead and throw_dead:
-            if msg.src_id == mitogen.context_id:
-                raise ChannelError(ChannelError.local_msg)
-            else:
-                raise ChannelError(ChannelError.remote_msg)
+            self._throw_dead(msg)
         return msg
 
+    def get_many(self, max_items=None, timeout=None, block=True,
+                 throw_dead=True):
+        """
+        Like :meth:`get`, but return a list of up to `max_items` messages, or
+        every queued message if :data:`None`, using :meth:`Latch.get_many`.
+
+        A dead message ends the list. Unless it is first, it is left queued,
+        to be returned by the next call.
+        """
+        _vv and IOLOG.debug('%r.get_many(max_items=%r, timeout=%r, block=%r)',
+                            self, max_items, timeout, block)
+        msgs = self._latch.get_many(max_items, timeout=timeout, block=block,
+                                    until=_is_dead)
+        if msgs[0].is_dead and throw_dead:
+            self._throw_dead(msgs[0])
+        return msgs
+
     def __iter__(self):
         while True:
             msg = self.get(throw_dead=False)
@@ -703,15 +978,256 @@ class Channel(Sender, Receiver):
         )
 
 
+_sha1 = None
+
+
+def _import_sha1():
+    """
+    Import the SHA-1 implementation used by :func:`module_digest`. This costs
+    milliseconds, so is done only by its users, and must be done before its
+    first use on the broker thread: on Python 2, importing there deadlocks
+    with a thread holding the import lock while awaiting a module.
+    """
+    global _sha1
+    if _sha1 is None:
+        try:
+            from hashlib import sha1
+        except ImportError:
+            from sha import new as sha1
+        _sha1 = sha1
+
+
+def module_digest(compressed):
+    """
+    Return the hex SHA-1 digest of a module's compressed source, by which
+    :class:`ModuleCache` and the parent identify its content.
+    """
+    _import_sha1()
+    return _sha1(compressed).hexdigest()
+
+
+def parse_module_request(data):
+    """
+    Parse the body of a :data:`GET_MODULE` request, returning `(fullnames,
+    tag, digests)`, where `tag` is the requester's :data:`BYTECODE_TAG`, or
+    :data:`None` if it was not sent, and `digests` maps names of modules the
+    requester has cached to their :func:`module_digest`. An empty digest
+    indicates a cached copy the requester could not use.
+    """
+    fullnames = []
+    tag = None
+    digests = {}
+    for item in data.decode('utf-8').split(u'\x00'):
+        if item.startswith(u'@'):
+            tag = item[1:]
+        elif item.startswith(u'#'):
+            fullname, _, digest = item[1:].partition(u':')
+            digests[fullname] = digest
+        else:
+            fullnames.append(item)
+    return fullnames, tag, digests
+
+
+class ModuleCache(object):
+    """
+    Persistent cache of modules received from the parent, allowing later
+    contexts on the same machine to skip downloading modules that have not
+    changed. Each module's compressed source is stored in a file named by the
+    module and its :func:`module_digest`, and verified against the digest
+    when read. Compiled code received alongside it is stored in a second file
+    whose name includes its :data:`BYTECODE_TAG`, prefixed by a digest of the
+    code and the source digest, so damaged code, or code belonging to other
+    source, is discarded and the source compiled instead.
+
+    The cache is trimmed when it is opened, deleting least recently used
+    files until it fits in `max_bytes`.
+
+    :param str path:
+        Directory to store modules in, created if it does not exist. It must
+        not be writable by other users.
+    :param int max_bytes:
+        Upper bound on the size of the directory, or :data:`None` to use
+        :attr:`max_bytes`.
+    """
+    #: Default upper bound on the size of the cache directory.
+    max_bytes = 32 * 1048576
+
+    #: Length of the hex digest stored ahead of compiled code.
+    CODE_HEADER_LEN = 40
+
+    def __init__(self, path, max_bytes=None):
+        self.path = os.path.expanduser(path)
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        #: Map of module name to digest of its most recently used copy.
+        self._digests = {}
+        _import_sha1()
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, int('0700', 8))
+        st = os.stat(self.path)
+        if st.st_uid != os.getuid() or st.st_mode & int('0022', 8):
+            raise OSError(errno.EPERM, 'writable by other users', self.path)
+        self._scan()
+
+    def __repr__(self):
+        return 'ModuleCache(%r)' % (self.path,)
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for filename in os.listdir(self.path):
+            try:
+                st = os.stat(os.path.join(self.path, filename))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+            total += st.st_size
+
+        entries.sort()
+        newest = {}
+        for mtime, size, filename in entries:
+            if total > self.max_bytes:
+                self._unlink(filename)
+                total -= size
+                continue
+            bits = filename.split('@')
+            if len(bits) == 2:
+                newest[bits[0]] = bits[1]
+
+        # Sorted by mtime, so the newest copy of each module wins.
+        self._digests = newest
+
+    def _unlink(self, filename):
+        try:
+            os.unlink(os.path.join(self.path, filename))
+        except OSError:
+            pass
+
+    def _read(self, filename):
+        path = os.path.join(self.path, filename)
+        fp = open(path, 'rb')
+        try:
+            data = fp.read()
+        finally:
+            fp.close()
+        # Record the use, so eviction prefers files that have gone unused.
+        os.utime(path, None)
+        return data
+
+    def _write(self, filename, data):
+        path = os.path.join(self.path, filename)
+        if os.path.exists(path):
+            return
+        tmp_path = os.path.join(self.path, '.%s.%d' % (filename, os.getpid()))
+        fp = open(tmp_path, 'wb')
+        try:
+            fp.write(data)
+        finally:
+            fp.close()
+        os.rename(tmp_path, path)
+
+    def _code_header(self, digest, code):
+        """
+        Return the header stored ahead of compiled `code` for the source
+        whose digest is `digest`.
+        """
+        return b(module_digest(b(digest) + code))
+
+    def _read_code(self, prefix, digest):
+        """
+        Return the verified compiled code stored for the source `prefix`
+        names, or :data:`None` if it is missing or damaged.
+        """
+        filename = '%s@%s' % (prefix, BYTECODE_TAG)
+        try:
+            data = self._read(filename)
+        except (IOError, OSError):
+            return None
+        code = data[self.CODE_HEADER_LEN:]
+        if data[:self.CODE_HEADER_LEN] != self._code_header(digest, code):
+            LOG.warning('%r: %r is damaged', self, filename)
+            self._unlink(filename)
+            return None
+        return code
+
+    def digests(self):
+        """
+        Return a copy of the map of module names to digests of the copies
+        that :meth:`get` will return.
+        """
+        return dict(self._digests)
+
+    def forget(self, fullname):
+        """
+        Stop offering the cached copy of `fullname`.
+        """
+        self._digests.pop(fullname, None)
+
+    def get(self, tup):
+        """
+        Given a tuple received from the parent whose compressed source was
+        omitted, return it with the source and any compiled code for our
+        :data:`BYTECODE_TAG` restored from the cache, or :data:`None` if the
+        cached copy is missing or damaged.
+        """
+        fullname = tup[0]
+        digest = self._digests.get(fullname)
+        if not digest:
+            return None
+
+        prefix = '%s@%s' % (fullname, digest)
+        try:
+            compressed = self._read(prefix)
+            if module_digest(compressed) != digest:
+                LOG.warning('%r: %r is damaged', self, prefix)
+                return None
+            tup = tup[:3] + (Blob(compressed),) + tup[4:5]
+            code = self._read_code(prefix, digest)
+            if code is not None:
+                tup += ((BYTECODE_TAG, Blob(code)),)
+        except (IOError, OSError):
+            e = sys.exc_info()[1]
+            LOG.debug('%r: reading %r: %s', self, prefix, e)
+            return None
+        return tup
+
+    def put(self, tup):
+        """
+        Store the compressed source and any compiled code in a tuple received
+        from the parent.
+        """
+        fullname = tup[0]
+        digest = module_digest(tup[3])
+        prefix = '%s@%s' % (fullname, digest)
+        try:
+            self._write(prefix, tup[3])
+            if len(tup) > 5 and tup[5]:
+                tag, code = tup[5]
+                self._write('%s@%s' % (prefix, tag),
+                            self._code_header(digest, code) + code)
+        except (IOError, OSError):
+            e = sys.exc_info()[1]
+            LOG.debug('%r: writing %r: %s', self, prefix, e)
+            return
+        self._digests[fullname] = digest
+
+
 class Importer(object):
     """
     Import protocol implementation that fetches modules from the parent
     process.
 
     :param context: Context to communicate via.
+    :param ModuleCache module_cache:
+        If not :data:`None`, cache in which modules received from the parent
+        are stored, and from which unchanged modules are loaded.
     """
-    def __init__(self, router, context, core_src, whitelist=(), blacklist=()):
+    def __init__(self, router, context, core_src, whitelist=(), blacklist=(),
+                 module_cache=None):
         self._context = context
+        self._module_cache = module_cache
+        # Set once the cache's digests have been sent with a request.
+        self._digests_sent = False
         self._present = {'mitogen': [
             'compat',
             'debug',
@@ -851,41 +1367,153 @@ class Importer(object):
         if msg.is_dead:
             return
 
-        tup = msg.unpickle()
-        fullname = tup[0]
-        _v and LOG.debug('Importer._on_load_module(%r)', fullname)
+        # A single module's tuple, or a list of them sent in one bundle.
+        tups = msg.unpickle()
+        if isinstance(tups, tuple):
+            tups = [tups]
+
+        if self._module_cache:
+            tups = self._restore_cached(tups)
 
+        callbacks = []
         self._lock.acquire()
         try:
-            self._cache[fullname] = tup
-            callbacks = self._callbacks.pop(fullname, [])
+            for tup in tups:
+                fullname = tup[0]
+                _v and LOG.debug('Importer._on_load_module(%r)', fullname)
+                self._cache[fullname] = tup
+                callbacks.extend(self._callbacks.pop(fullname, []))
         finally:
             self._lock.release()
 
         for callback in callbacks:
             callback()
 
+    def _restore_cached(self, tups):
+        """
+        Return `tups` with the source of modules the parent omitted because we
+        reported them cached restored from :attr:`_module_cache`, storing any
+        other modules received in it. Modules whose cached copy is unusable are
+        requested again in full, and left out of the result.
+        """
+        restored = []
+        stale = []
+        for tup in tups:
+            if tup[2] is None:
+                restored.append(tup)  # Negative response.
+            elif tup[3] is None:
+                cached = self._module_cache.get(tup)
+                if cached is None:
+                    self._module_cache.forget(tup[0])
+                    stale.append(tup[0])
+                else:
+                    restored.append(cached)
+            else:
+                self._module_cache.put(tup)
+                restored.append(tup)
+
+        if stale:
+            LOG.debug('%r: requesting %r again', self, stale)
+            digests = dict((fullname, u'') for fullname in stale)
+            self._context.send(
+                Message(data=self._make_request(stale, digests),
+                        handle=GET_MODULE)
+            )
+        return restored
+
+    def _make_request(self, fullnames, digests=None):
+        """
+        Return the body of a :data:`GET_MODULE` request for `fullnames`: the
+        names separated by NUL, followed by our :data:`BYTECODE_TAG`, and
+        with the first request, the digests of any cached modules.
+        """
+        items = list(fullnames)
+        items.append(u'@' + BYTECODE_TAG)
+        if digests is None and self._module_cache and not self._digests_sent:
+            digests = self._module_cache.digests()
+            self._digests_sent = True
+        for fullname, digest in (digests or {}).items():
+            items.append(u'#%s:%s' % (fullname, digest))
+        return u'\x00'.join(items).encode('utf-8')
+
     def _request_module(self, fullname, callback):
+        self._request_modules([fullname], callback)
+
+    def _request_modules(self, fullnames, callback):
+        """
+        Arrange for `callback` to be invoked once every module in `fullnames`
+        is present in the cache, requesting any neither present nor already
+        in flight using a single GET_MODULE message.
+        """
         self._lock.acquire()
         try:
-            present = fullname in self._cache
-            if not present:
-                funcs = self._callbacks.get(fullname)
-                if funcs is not None:
-                    _v and LOG.debug('_request_module(%r): in flight', fullname)
-                    funcs.append(callback)
-                else:
-                    _v and LOG.debug('_request_module(%r): new request', fullname)
-                    self._callbacks[fullname] = [callback]
+            wanted = [name for name in fullnames if name not in self._cache]
+            if wanted:
+                remaining = [len(wanted)]
+                def on_present():
+                    # Only invoked by _on_load_module() on the broker thread.
+                    remaining[0] -= 1
+                    if not remaining[0]:
+                        callback()
+
+                missing = []
+                for fullname in wanted:
+                    funcs = self._callbacks.get(fullname)
+                    if funcs is None:
+                        funcs = self._callbacks[fullname] = []
+                        missing.append(fullname)
+                    funcs.append(on_present)
+
+                if missing:
+                    _v and LOG.debug('_request_modules(%r): new request',
+                                     missing)
                     self._context.send(
-                        Message(data=b(fullname), handle=GET_MODULE)
+                        Message(data=self._make_request(missing),
+                                handle=GET_MODULE)
                     )
         finally:
             self._lock.release()
 
-        if present:
+        if not wanted:
             callback()
 
+    def _is_remote(self, fullname, local):
+        """
+        Return :data:`True` if `fullname` would be imported from the parent,
+        caching the result for top-level packages in the dict `local`.
+        """
+        pkgname, _, suffix = fullname.rpartition('.')
+        if pkgname in self._present:
+            return suffix in self._present[pkgname]
+
+        top = fullname.partition('.')[0]
+        if top not in local:
+            mod = sys.modules.get(top)
+            if mod is None:
+                local[top] = self.find_module(top) is not self
+            else:
+                local[top] = getattr(mod, '__loader__', None) is not self
+        return not local[top]
+
+    def _prefetch(self, related):
+        """
+        Before a module executes, request in one round-trip every module it
+        is known to import that is not yet loaded, requested, or available
+        locally, rather than discovering each as the import statements run.
+        """
+        local = {}
+        wanted = [
+            fullname
+            for fullname in related
+            if fullname not in sys.modules
+            and fullname not in self._cache
+            and fullname not in self._callbacks
+            and not is_blacklisted_import(self, fullname)
+            and self._is_remote(fullname, local)
+        ]
+        if wanted:
+            self._request_modules(wanted, lambda: None)
+
     def load_module(self, fullname):
         fullname = to_text(fullname)
         _v and LOG.debug('Importer.load_module(%r)', fullname)
@@ -914,14 +1542,30 @@ class Importer(object):
             # 2.x requires __package__ to be exactly a string.
             mod.__package__ = mod.__package__.encode()
 
-        source = self.get_source(fullname)
-        code = compile(source, mod.__file__, 'exec', 0, 1)
+        self._prefetch(ret[4] or ())
+        code = self._get_code(fullname, ret, mod.__file__)
         if PY3:
             exec(code, vars(mod))
         else:
             exec('exec code in vars(mod)')
         return mod
 
+    def _get_code(self, fullname, tup, filename):
+        """
+        Return the code object for `fullname`, from the bytecode accompanying
+        its source if that was compiled for an interpreter like ours,
+        otherwise by compiling the source.
+        """
+        if len(tup) > 5 and tup[5] and tup[5][0] == BYTECODE_TAG:
+            try:
+                return marshal.loads(zlib.decompress(tup[5][1]))
+            except (EOFError, TypeError, ValueError, zlib.error):
+                LOG.warning('%r: discarding bad bytecode for %r',
+                            self, fullname)
+
+        source = self.get_source(fullname)
+        return compile(source, filename, 'exec', 0, 1)
+
     def get_filename(self, fullname):
         if fullname in self._cache:
             path = self._cache[fullname][2]
@@ -971,6 +1615,11 @@ class LogHandler(logging.Handler):
 class Side(object):
     _fork_refs = weakref.WeakValueDictionary()
 
+    #: :data:`True` if the last read or write was short or would have blocked,
+    #: indicating the kernel buffer was exhausted. Edge-triggered pollers use
+    #: this to decide whether readiness must be rechecked after a wake.
+    would_block = False
+
     def __init__(self, stream, fd, cloexec=True, keep_alive=True, blocking=False):
         self.stream = stream
         self.fd = fd
@@ -1004,18 +1653,73 @@ class Side(object):
         s, disconnected = io_op(os.read, self.fd, n)
         if disconnected:
             return b('')
+        self.would_block = len(s) < n
         return s
 
+    def readinto(self, view):
+        """
+        Like :meth:`read`, but fill the writeable buffer `view` rather than
+        allocating a new string. On Python 3.3+ :func:`os.readv` is used so the
+        kernel copies directly into `view`, otherwise the result of an
+        :func:`os.read` of at most :data:`CHUNK_SIZE` bytes is copied into
+        it.
+
+        :returns:
+            Number of bytes read, or 0 to indicate disconnection was detected.
+        """
+        if self.closed:
+            return 0
+        if _readv:
+            want = len(view)
+            n, disconnected = io_op(_readv, self.fd, [view])
+        else:
+            want = min(len(view), CHUNK_SIZE)
+            s, disconnected = io_op(os.read, self.fd, want)
+            n = 0
+            if s:
+                n = len(s)
+                view[:n] = s
+        if disconnected:
+            return 0
+        self.would_block = n < want
+        return n
+
+    def _write(self, func, arg, size):
+        try:
+            written, disconnected = io_op(func, self.fd, arg)
+        except OSError:
+            e = sys.exc_info()[1]
+            if e.args[0] != errno.EAGAIN:
+                raise
+            self.would_block = True
+            return 0
+        if disconnected:
+            return None
+        self.would_block = written < size
+        return written
+
     def write(self, s):
+        """
+        Write as much of `s` as the descriptor will accept without blocking.
+
+        :returns:
+            Number of bytes written, 0 if the descriptor is not writeable, or
+            :data:`None` if disconnection was detected.
+        """
         if self.closed or self.fd is None:
             # Refuse to touch the handle after closed, it may have been reused
             # by another thread.
             return None
+        return self._write(os.write, s, len(s))
 
-        written, disconnected = io_op(os.write, self.fd, s)
-        if disconnected:
+    def writev(self, bufs):
+        """
+        Like :meth:`write`, but gather the sequence of buffers `bufs` using a
+        single :func:`os.writev` call. Only available on Python 3.3+.
+        """
+        if self.closed or self.fd is None:
             return None
-        return written
+        return self._write(_writev, bufs, sum(len(buf) for buf in bufs))
 
 
 class BasicStream(object):
@@ -1052,20 +1756,118 @@ class Stream(BasicStream):
     #: :data:`mitogen.parent_ids`.
     is_privileged = False
 
+    #: Highest pickle protocol the context on the other end of this stream is
+    #: known to understand. Starts at 2, which every supported Python version
+    #: can read, and is raised during bootstrap when both sides are capable of
+    #: more. See :data:`PICKLE_PROTOCOL`.
+    pickle_protocol = 2
+
+    #: :mod:`zlib` compression level applied to messages sent on this stream,
+    #: or 0 to disable compression. Compressed messages are flagged in their
+    #: header, and are decompressed by the receiving stream regardless of its
+    #: own setting.
+    compression_level = 0
+
+    #: Messages with data shorter than this are never compressed.
+    compression_threshold = 4096
+
+    #: Messages with data larger than this are split into fragments of at most
+    #: this size, which intermediate routers forward without reassembling, so
+    #: no hop need buffer a large message in one piece. See
+    #: :attr:`Message.more`. 0 disables fragmentation, except of messages too
+    #: large to be described by a single header. Values above
+    #: :attr:`LENGTH_MASK` are treated as :attr:`LENGTH_MASK`.
+    fragment_size = 8 * CHUNK_SIZE
+
+    #: Handles whose messages are always sent in the priority lane, in addition
+    #: to messages with :attr:`Message.priority` set. Every message to one of
+    #: these handles shares a lane, so they are never reordered among
+    #: themselves. Only small control messages that no other handle's messages
+    #: depend on belong here, since priority messages are exempt from flow
+    #: control, and overtake bulk messages queued before them on the same
+    #: stream. That excludes call replies, which must follow anything the call
+    #: sent using a :class:`Sender`, module payloads, and :data:`SHUTDOWN` and
+    #: :data:`DEL_ROUTE`, which must follow any messages already queued to, or
+    #: from, the context they refer to.
+    PRIORITY_HANDLES = frozenset([
+        ADD_ROUTE, PICKLE_PROTOCOL,
+    ])
+
+    #: Bytes of priority frames sent while bulk frames are waiting, after
+    #: which one bulk frame is sent, so bulk traffic is never starved.
+    PRIORITY_QUANTUM = 4 * CHUNK_SIZE
+
+    #: Once more than this many bytes are queued, the stream is
+    #: :attr:`congested`, and threads other than the broker that route
+    #: non-priority messages via it with `block=True` wait in
+    #: :meth:`Router.route` until it drains to :attr:`low_watermark`. 0
+    #: disables flow control.
+    high_watermark = 32 * 1048576
+
+    #: See :attr:`high_watermark` and :attr:`Router.max_queued_bytes`.
+    low_watermark = 8 * 1048576
+
     def __init__(self, router, remote_id, **kwargs):
         self._router = router
         self.remote_id = remote_id
         self.name = u'default'
         self.sent_modules = set(['mitogen', 'mitogen.core'])
+        #: :data:`BYTECODE_TAG` of the remote interpreter, once it is known
+        #: from a :data:`GET_MODULE` request it sent.
+        self.bytecode_tag = None
+        #: Map of module names to :func:`module_digest` of the copies cached
+        #: by the remote, as reported by its :data:`GET_MODULE` requests.
+        self.module_digests = {}
         self.construct(**kwargs)
-        self._input_buf = collections.deque()
         self._output_buf = collections.deque()
-        self._input_buf_len = 0
         self._output_buf_len = 0
+        #: Frames waiting to be moved to :attr:`_output_buf`, as `(size,
+        #: bufs)` tuples. The first lane holds priority frames.
+        self._lanes = (collections.deque(), collections.deque())
+        self._lane_bytes = [0, 0]
+        #: Bytes of priority frames moved since the last bulk frame.
+        self._priority_run = 0
+        #: Count of messages queued by :meth:`_send`.
+        self.tx_messages = 0
+        #: Count of messages queued in the priority lane by :meth:`_send`.
+        self.tx_priority = 0
+        #: :data:`True` while more than :attr:`high_watermark` bytes are
+        #: queued, until no more than :attr:`low_watermark` remain.
+        self.congested = False
+        #: Count of times a thread blocked in :meth:`Router.route` waiting for
+        #: this stream to drain.
+        self.tx_waits = 0
+        #: Count of write system calls made by :meth:`on_transmit`.
+        self.tx_syscalls = 0
+        #: Count of messages sent compressed by :meth:`_send`.
+        self.tx_compressed = 0
+        #: Bytes saved by compressing messages sent by :meth:`_send`.
+        self.tx_compression_saved = 0
+        #: Count of fragments queued by :meth:`_send` for messages larger than
+        #: :attr:`fragment_size`.
+        self.tx_fragments = 0
+        if self.zero_copy_receive:
+            self._input_buf = bytearray(self.INPUT_BUF_SIZE)
+            self._input_start = 0
+            self._input_end = 0
+        else:
+            self._input_buf = collections.deque()
+            self._input_buf_len = 0
 
     def construct(self):
         pass
 
+    #: If :data:`True`, receive into a single growable :class:`bytearray`,
+    #: parsing headers in place and copying each message body out exactly
+    #: once. Otherwise received chunks are accumulated in a
+    #: :class:`collections.deque` and joined for every message. Defaults to
+    #: :data:`True` when :data:`HAVE_MEMORYVIEW` is :data:`True`.
+    zero_copy_receive = HAVE_MEMORYVIEW
+
+    #: Initial size of the :attr:`zero_copy_receive` buffer, and the size it
+    #: shrinks back to once a large message has been consumed.
+    INPUT_BUF_SIZE = 2 * CHUNK_SIZE
+
     def _internal_receive(self, broker, buf):
         if self._input_buf and self._input_buf_len < 128:
             self._input_buf[0] += buf
@@ -1080,6 +1882,8 @@ class Stream(BasicStream):
         """Handle the next complete message on the stream. Raise
         :py:class:`StreamError` on failure."""
         _vv and IOLOG.debug('%r.on_receive()', self)
+        if self.zero_copy_receive:
+            return self._receive_into_buffer(broker)
 
         buf = self.receive_side.read()
         if not buf:
@@ -1090,22 +1894,89 @@ class Stream(BasicStream):
     HEADER_FMT = '>LLLLLL'
     HEADER_LEN = struct.calcsize(HEADER_FMT)
 
+    #: Bit set in the header's length field when the message data is
+    #: :mod:`zlib`-compressed. Lengths never reach it, or any other flag, as
+    #: :meth:`_send` splits messages into frames of at most
+    #: :attr:`LENGTH_MASK` bytes. :attr:`Router.max_message_size` does not
+    #: bound them, as it may exceed 2GiB.
+    COMPRESSED_FLAG = 0x80000000
+
+    #: Bit set in the header's length field when the message is a fragment
+    #: followed by at least one more. See :attr:`Message.more`.
+    MORE_FLAG = 0x40000000
+
+    #: Bit set in the header's length field when the message was sent in the
+    #: priority lane, so that it is also prioritized by later hops. See
+    #: :attr:`Message.priority`.
+    PRIORITY_FLAG = 0x20000000
+
+    #: Bits of the header's length field describing the length.
+    LENGTH_MASK = PRIORITY_FLAG - 1
+
+    def _check_size(self, broker, msg_len):
+        if msg_len > self._router.max_message_size:
+            LOG.error('Maximum message size exceeded (got %d, max %d)',
+                      msg_len, self._router.max_message_size)
+            self.on_disconnect(broker)
+            return False
+        return True
+
+    def _decompress(self, broker, data):
+        """
+        Return `data` decompressed, or :data:`None` after disconnecting the
+        stream if it is corrupt or would exceed
+        :attr:`Router.max_message_size` once decompressed.
+        """
+        max_size = self._router.max_message_size
+        try:
+            obj = zlib.decompressobj()
+            data = obj.decompress(data, max_size + 1)
+        except zlib.error:
+            LOG.error('%r: corrupt compressed message: %s',
+                      self, sys.exc_info()[1])
+            self.on_disconnect(broker)
+            return None
+        if not self._check_size(broker, len(data)):
+            return None
+        return data
+
+    def _compress(self, data):
+        """
+        Return `(data, flag)`, where `data` is compressed and `flag` is
+        :attr:`COMPRESSED_FLAG` if compression saves at least an eighth of its
+        size. Large payloads are first sampled at the fastest level, so data
+        that is already compressed, such as module source, costs little.
+        """
+        size = len(data)
+        if size > (4 * self.compression_threshold):
+            mid = size // 2
+            sample = data[mid:mid+self.compression_threshold]
+            if len(zlib.compress(sample, 1)) > (len(sample) - (len(sample)>>3)):
+                return data, 0
+
+        compressed = zlib.compress(data, self.compression_level)
+        if len(compressed) > (size - (size >> 3)):
+            return data, 0
+
+        self.tx_compressed += 1
+        self.tx_compression_saved += size - len(compressed)
+        return compressed, self.COMPRESSED_FLAG
+
     def _receive_one(self, broker):
         if self._input_buf_len < self.HEADER_LEN:
             return False
 
-        msg = Message()
-        msg.router = self._router
-        (msg.dst_id, msg.src_id, msg.auth_id,
-         msg.handle, msg.reply_to, msg_len) = struct.unpack(
+        (dst_id, src_id, auth_id,
+         handle, reply_to, msg_len) = struct.unpack(
             self.HEADER_FMT,
             self._input_buf[0][:self.HEADER_LEN],
         )
 
-        if msg_len > self._router.max_message_size:
-            LOG.error('Maximum message size exceeded (got %d, max %d)',
-                      msg_len, self._router.max_message_size)
-            self.on_disconnect(broker)
+        compressed = msg_len & self.COMPRESSED_FLAG
+        more = msg_len & self.MORE_FLAG
+        priority = msg_len & self.PRIORITY_FLAG
+        msg_len &= self.LENGTH_MASK
+        if not self._check_size(broker, msg_len):
             return False
 
         total_len = msg_len + self.HEADER_LEN
@@ -1128,50 +1999,335 @@ class Stream(BasicStream):
             prev_start = start
             start = 0
 
-        msg.data = b('').join(bits)
         self._input_buf.appendleft(buf[prev_start+len(bit):])
         self._input_buf_len -= total_len
+
+        data = b('').join(bits)
+        if compressed:
+            data = self._decompress(broker, data)
+            if data is None:
+                return False
+
+        msg = Message._new(dst_id, src_id, auth_id, handle, reply_to,
+                           data, self._router, more != 0, priority != 0)
+        self._router._async_route(msg, self)
+        return True
+
+    def _reserve_input(self, size):
+        """
+        Ensure at least `size` bytes are free following :attr:`_input_end`, by
+        moving any partial message to the start of the buffer, and growing it
+        if that is insufficient. Only the unconsumed partial message is ever
+        copied.
+        """
+        buf = self._input_buf
+        start = self._input_start
+        end = self._input_end
+        if (len(buf) - end) >= size:
+            return
+
+        pending = end - start
+        if (pending + size) > len(buf):
+            new = bytearray(pending + size)
+            new[:pending] = memoryview(buf)[start:end]
+            self._input_buf = new
+        elif pending:
+            view = memoryview(buf)
+            view[:pending] = view[start:end].tobytes()
+        self._input_start = 0
+        self._input_end = pending
+
+    def _receive_into_buffer(self, broker):
+        buf = self._input_buf
+        if self._input_start == self._input_end:
+            # Common case: previous read ended on a message boundary. Release
+            # any oversized buffer left behind by a large message.
+            self._input_start = self._input_end = 0
+            if len(buf) > self.INPUT_BUF_SIZE:
+                self._input_buf = buf = bytearray(self.INPUT_BUF_SIZE)
+        self._reserve_input(CHUNK_SIZE)
+
+        end = self._input_end
+        n = self.receive_side.readinto(memoryview(self._input_buf)[end:])
+        if not n:
+            return self.on_disconnect(broker)
+
+        self._input_end += n
+        while self._receive_one_from_buffer(broker):
+            pass
+
+    def _receive_one_from_buffer(self, broker):
+        start = self._input_start
+        avail = self._input_end - start
+        if avail < self.HEADER_LEN:
+            return False
+
+        buf = self._input_buf
+        (dst_id, src_id, auth_id,
+         handle, reply_to, msg_len) = struct.unpack_from(
+            self.HEADER_FMT, buf, start
+        )
+
+        compressed = msg_len & self.COMPRESSED_FLAG
+        more = msg_len & self.MORE_FLAG
+        priority = msg_len & self.PRIORITY_FLAG
+        msg_len &= self.LENGTH_MASK
+        if not self._check_size(broker, msg_len):
+            return False
+
+        total_len = msg_len + self.HEADER_LEN
+        if avail < total_len:
+            _vv and IOLOG.debug(
+                '%r: Input too short (want %d, got %d)',
+                self, msg_len, avail - self.HEADER_LEN
+            )
+            # Make room for the remainder now, so it is read in place rather
+            # than in CHUNK_SIZE pieces that are repeatedly shuffled.
+            self._reserve_input(total_len - avail)
+            return False
+
+        view = memoryview(buf)[start+self.HEADER_LEN:start+total_len]
+        self._input_start += total_len
+        if compressed:
+            # Python 2 zlib does not accept memoryview.
+            data = self._decompress(broker, (PY3 and view) or view.tobytes())
+            if data is None:
+                return False
+        else:
+            data = view.tobytes()
+
+        msg = Message._new(dst_id, src_id, auth_id, handle, reply_to,
+                           data, self._router, more != 0, priority != 0)
         self._router._async_route(msg, self)
         return True
 
     def pending_bytes(self):
         return self._output_buf_len
 
+    def pending_lanes(self):
+        """
+        Return `(priority_frames, priority_bytes, bulk_frames, bulk_bytes)`
+        describing frames queued in each lane that are not yet being written.
+        """
+        priority, bulk = self._lanes
+        return (len(priority), self._lane_bytes[0],
+                len(bulk), self._lane_bytes[1])
+
+    #: If :data:`True`, message headers and bodies are queued as separate
+    #: buffers, and as many as possible are flushed by a single
+    #: :func:`os.writev` call, bounded by :data:`IOV_MAX` and
+    #: :attr:`WRITEV_BUDGET`. Otherwise each message is copied into one
+    #: string along with its header, and written using one :func:`os.write`
+    #: call per :class:`Broker` loop iteration. Defaults to :data:`True` when
+    #: :func:`os.writev` is available.
+    vectored_transmit = _writev is not None
+
+    #: Number of bytes beyond which no further buffers are added to a single
+    #: :func:`os.writev` call. At least one buffer is always written. Also
+    #: the number of bytes moved from the lanes to :attr:`_output_buf` ahead
+    #: of writing, which bounds how long a priority frame waits behind bulk
+    #: frames.
+    WRITEV_BUDGET = 4 * CHUNK_SIZE
+
+    def _fill_output(self):
+        """
+        Move whole frames from the lanes to :attr:`_output_buf` until it holds
+        :attr:`WRITEV_BUDGET` bytes, preferring the priority lane until
+        :attr:`PRIORITY_QUANTUM` bytes were moved while bulk frames waited.
+        """
+        priority, bulk = self._lanes
+        lane_bytes = self._lane_bytes
+        staged = self._output_buf_len - lane_bytes[0] - lane_bytes[1]
+        while staged < self.WRITEV_BUDGET and (priority or bulk):
+            if priority and not (bulk and
+                                 self._priority_run >= self.PRIORITY_QUANTUM):
+                size, bufs = priority.popleft()
+                lane_bytes[0] -= size
+                self._priority_run += size
+            else:
+                size, bufs = bulk.popleft()
+                lane_bytes[1] -= size
+                self._priority_run = 0
+            self._output_buf.extend(bufs)
+            staged += size
+
     def on_transmit(self, broker):
         """Transmit buffered messages."""
         _vv and IOLOG.debug('%r.on_transmit()', self)
 
+        if self._lanes[0] or self._lanes[1]:
+            self._fill_output()
+
         if self._output_buf:
-            buf = self._output_buf.popleft()
-            written = self.transmit_side.write(buf)
-            if not written:
+            if self.vectored_transmit:
+                written = self._transmit_vectored()
+            else:
+                written = self._transmit_one()
+            self.tx_syscalls += 1
+            if written is None:
                 _v and LOG.debug('%r.on_transmit(): disconnection detected', self)
                 self.on_disconnect(broker)
                 return
-            elif written != len(buf):
-                self._output_buf.appendleft(BufferType(buf, written))
 
             _vv and IOLOG.debug('%r.on_transmit() -> len %d', self, written)
             self._output_buf_len -= written
+            self._router._queued_bytes -= written
+            if self.congested and self._output_buf_len <= self.low_watermark:
+                _v and LOG.debug('%r: no longer congested', self)
+                self.congested = False
+            if self._router._flow_waiters:
+                self._router._notify_writable()
 
-        if not self._output_buf:
+        if not self._output_buf_len:
             broker._stop_transmit(self)
 
+    def _transmit_one(self):
+        buf = self._output_buf.popleft()
+        written = self.transmit_side.write(buf)
+        if written is not None and written != len(buf):
+            if written:
+                buf = BufferType(buf, written)
+            self._output_buf.appendleft(buf)
+        return written
+
+    def _transmit_vectored(self):
+        bufs = []
+        size = 0
+        for buf in self._output_buf:
+            bufs.append(buf)
+            size += len(buf)
+            if size >= self.WRITEV_BUDGET or len(bufs) == IOV_MAX:
+                break
+
+        written = self.transmit_side.writev(bufs)
+        if written:
+            remain = written
+            while remain:
+                buf = self._output_buf[0]
+                if remain < len(buf):
+                    self._output_buf[0] = BufferType(buf, remain)
+                    break
+                remain -= len(buf)
+                self._output_buf.popleft()
+        return written
+
+    def _send_fragments(self, msg, size, lane):
+        """
+        Queue `msg` in `lane` as fragments of at most `size` bytes. When
+        :attr:`vectored_transmit` is enabled, fragments reference
+        :attr:`Message.data`, or its out-of-band buffers, rather than copying
+        it.
+        """
+        total = msg._data_len()
+        if msg._bits is not None and self.vectored_transmit:
+            pieces = _slice_bits(msg._bits, size)
+        else:
+            data = msg.data
+            if self.vectored_transmit:
+                data = memoryview(data)
+            pieces = (data[offset:offset+size]
+                      for offset in range(0, total, size))
+        offset = 0
+        for piece in pieces:
+            offset += size
+            more = msg.more or offset < total
+            self._send_frame(msg, piece, more, lane)
+            self.tx_fragments += 1
+
     def _send(self, msg):
         _vv and IOLOG.debug('%r._send(%r)', self, msg)
-        pkt = struct.pack(self.HEADER_FMT, msg.dst_id, msg.src_id,
+        lane = 1
+        if msg.priority or msg.handle in self.PRIORITY_HANDLES:
+            lane = 0
+            self.tx_priority += 1
+
+        size = min(self.fragment_size or self.LENGTH_MASK, self.LENGTH_MASK)
+        if msg._data_len() > size:
+            self._send_fragments(msg, size, lane)
+        else:
+            self._send_frame(msg, msg._bits or msg.data, msg.more, lane)
+        self.tx_messages += 1
+
+    def _send_frame(self, msg, data, more, lane):
+        """
+        Queue a frame whose body is `data`, or the concatenation of `data`
+        when it is a list of out-of-band pickle buffers. The buffers are
+        queued as they are, unless they must be joined to be compressed or
+        written by :meth:`_transmit_one`.
+        """
+        flag = 0
+        if isinstance(data, list):
+            oob = tuple(data)
+            length = sum(len(buf) for buf in oob)
+            if self.vectored_transmit and not (
+                    self.compression_level and
+                    length >= self.compression_threshold):
+                data = None
+            else:
+                data = b('').join(oob)
+        if data is not None:
+            if self.compression_level and \
+                    len(data) >= self.compression_threshold:
+                data, flag = self._compress(data)
+            length = len(data)
+        if more:
+            flag |= self.MORE_FLAG
+        if lane == 0:
+            flag |= self.PRIORITY_FLAG
+
+        hdr = struct.pack(self.HEADER_FMT, msg.dst_id, msg.src_id,
                           msg.auth_id, msg.handle, msg.reply_to or 0,
-                          len(msg.data)) + msg.data
+                          length | flag)
         if not self._output_buf_len:
             self._router.broker._start_transmit(self)
-        self._output_buf.append(pkt)
-        self._output_buf_len += len(pkt)
+        if data is None:
+            bufs = (hdr,) + oob
+        elif not self.vectored_transmit:
+            bufs = (hdr + data,)
+        elif data:
+            bufs = (hdr, data)
+        else:
+            # Empty buffers would cause writev() to return 0 when nothing
+            # else is queued, which is indistinguishable from disconnect.
+            bufs = (hdr,)
+
+        size = len(hdr) + length
+        self._output_buf_len += size
+        self._router._queued_bytes += size
+        if self.high_watermark and self._output_buf_len > self.high_watermark \
+                and not self.congested:
+            _v and LOG.debug('%r: congested, %d bytes queued',
+                             self, self._output_buf_len)
+            self.congested = True
+        if self._lanes[0] or self._lanes[1] or \
+                (self._output_buf_len - size) >= self.WRITEV_BUDGET:
+            self._lanes[lane].append((size, bufs))
+            self._lane_bytes[lane] += size
+        else:
+            # Fast path: nothing is waiting, so the frame need not be ordered.
+            self._output_buf.extend(bufs)
+            if lane == 0:
+                self._priority_run += size
+            else:
+                self._priority_run = 0
 
     def send(self, msg):
         """Send `data` to `handle`, and tell the broker we have output. May
         be called from any thread."""
         self._router.broker.defer(self._send, msg)
 
+    def on_disconnect(self, broker):
+        # Output that will never be written no longer counts towards
+        # Router.max_queued_bytes.
+        self._router._queued_bytes -= self._output_buf_len
+        self._output_buf_len = 0
+        self._output_buf.clear()
+        for lane in self._lanes:
+            lane.clear()
+        self._lane_bytes = [0, 0]
+        self.congested = False
+        super(Stream, self).on_disconnect(broker)
+
     def on_shutdown(self, broker):
         """Override BasicStream behaviour of immediately disconnecting."""
         _v and LOG.debug('%r.on_shutdown(%r)', self, broker)
@@ -1216,22 +2372,33 @@ class Context(object):
         self.send(msg)
         return receiver
 
-    def call_service_async(self, service_name, method_name, **kwargs):
-        _v and LOG.debug('%r.call_service_async(%r, %r, %r)',
-                         self, service_name, method_name, kwargs)
+    def _make_service_msg(self, service_name, method_name, kwargs):
         if isinstance(service_name, BytesType):
             service_name = service_name.encode('utf-8')
         elif not isinstance(service_name, UnicodeType):
             service_name = service_name.name()  # Service.name()
         tup = (service_name, to_text(method_name), Kwargs(kwargs))
-        msg = Message.pickled(tup, handle=CALL_SERVICE)
+        return Message.pickled(
+            tup,
+            handle=CALL_SERVICE,
+            protocol=self.router.get_pickle_protocol(self.context_id),
+        )
+
+    def call_service_async(self, service_name, method_name, **kwargs):
+        _v and LOG.debug('%r.call_service_async(%r, %r, %r)',
+                         self, service_name, method_name, kwargs)
+        msg = self._make_service_msg(service_name, method_name, kwargs)
         return self.send_async(msg)
 
-    def send(self, msg):
+    def send(self, msg, block=False, timeout=None, priority=False):
         """send `obj` to `handle`, and tell the broker we have output. May
-        be called from any thread."""
+        be called from any thread. See :meth:`Router.route` for the meaning of
+        `block` and `timeout`. If `priority` is :data:`True`,
+        :attr:`Message.priority` is set on `msg`."""
         msg.dst_id = self.context_id
-        self.router.route(msg)
+        if priority:
+            msg.priority = True
+        self.router.route(msg, block=block, timeout=timeout)
 
     def call_service(self, service_name, method_name, **kwargs):
         recv = self.call_service_async(service_name, method_name, **kwargs)
@@ -1307,6 +2474,85 @@ class Poller(object):
             yield self._wfds[fd]
 
 
+class PollPoller(Poller):
+    """
+    Poller based on :func:`select.poll`. Registration persists in the poll
+    object between calls, so unlike :class:`Poller`, loop cost does not
+    include rebuilding and rescanning three fd sets on every iteration, and
+    file descriptors numbered above `FD_SETSIZE` are supported.
+    """
+    # Mirror select()'s idea of readability and writability, so errors and
+    # hangups wake whichever side is registered rather than spinning. POLLNVAL
+    # means the fd was closed while still registered: wake its owner too, so
+    # its read or write fails with EBADF and the usual disconnect path runs.
+    _inmask = (getattr(select, 'POLLIN', 0) |
+               getattr(select, 'POLLHUP', 0) |
+               getattr(select, 'POLLERR', 0) |
+               getattr(select, 'POLLNVAL', 0))
+    _outmask = (getattr(select, 'POLLOUT', 0) |
+                getattr(select, 'POLLERR', 0) |
+                getattr(select, 'POLLNVAL', 0))
+
+    def __init__(self):
+        super(PollPoller, self).__init__()
+        self._pollobj = select.poll()
+
+    def _update(self, fd):
+        mask = (((fd in self._rfds) and select.POLLIN) |
+                ((fd in self._wfds) and select.POLLOUT))
+        if mask:
+            self._pollobj.register(fd, mask)
+        else:
+            try:
+                self._pollobj.unregister(fd)
+            except KeyError:
+                pass
+
+    def start_receive(self, fd, data=None):
+        _vv and IOLOG.debug('%r.start_receive(%r, %r)', self, fd, data)
+        self._rfds[fd] = data or fd
+        self._update(fd)
+
+    def stop_receive(self, fd):
+        _vv and IOLOG.debug('%r.stop_receive(%r)', self, fd)
+        self._rfds.pop(fd, None)
+        self._update(fd)
+
+    def start_transmit(self, fd, data=None):
+        _vv and IOLOG.debug('%r.start_transmit(%r, %r)', self, fd, data)
+        self._wfds[fd] = data or fd
+        self._update(fd)
+
+    def stop_transmit(self, fd):
+        _vv and IOLOG.debug('%r.stop_transmit(%r)', self, fd)
+        self._wfds.pop(fd, None)
+        self._update(fd)
+
+    def poll(self, timeout=None):
+        _vv and IOLOG.debug('%r.poll(%r)', self, timeout)
+        if timeout is not None:
+            timeout = max(0, int(timeout * 1000))
+
+        events, _ = io_op(self._pollobj.poll, timeout)
+        for fd, event in events:
+            if event & self._inmask and fd in self._rfds:
+                _vv and IOLOG.debug('%r: POLLIN for %r', self, fd)
+                yield self._rfds[fd]
+            if event & self._outmask and fd in self._wfds:
+                _vv and IOLOG.debug('%r: POLLOUT for %r', self, fd)
+                yield self._wfds[fd]
+
+
+#: Poller used by :class:`Broker` and :class:`Latch` until
+#: :mod:`mitogen.parent` installs the OS-specific poller. poll() is missing on
+#: some platforms, and on OS X cannot wait on TTY devices, so fall back to
+#: select() there.
+if hasattr(select, 'poll') and sys.platform != 'darwin':
+    DEFAULT_POLLER = PollPoller
+else:
+    DEFAULT_POLLER = Poller
+
+
 class Latch(object):
     """
     A latch is a :py:class:`Queue.Queue`-like object that supports mutation and
@@ -1319,11 +2565,19 @@ class Latch(object):
     Latches implement queues using the UNIX self-pipe trick, and a per-thread
     :py:func:`socket.socketpair` that is lazily created the first time any
     latch attempts to sleep on a thread, and dynamically associated with the
-    waiting Latch only for duration of the wait.
+    waiting Latch only for duration of the wait. Where :attr:`use_eventfd` is
+    set, an :func:`os.eventfd` watched by a persistent poll object replaces
+    the socketpair and per-wait poller.
 
     See :ref:`waking-sleeping-threads` for further discussion.
     """
-    poller_class = Poller
+    poller_class = DEFAULT_POLLER
+
+    #: If :data:`True`, sleeping threads wait on an :func:`os.eventfd` rather
+    #: than a :func:`socket.socketpair`, costing one descriptor rather than
+    #: two, and no poller construction per wait. Requires Linux and Python
+    #: 3.10+.
+    use_eventfd = _eventfd is not None and hasattr(select, 'poll')
 
     # The _cls_ prefixes here are to make it crystal clear in the code which
     # state mutation isn't covered by :attr:`_lock`.
@@ -1338,13 +2592,21 @@ class Latch(object):
     #: the parent process.
     _cls_all_sockets = []
 
+    #: List of reusable `(fd, poller)` tuples for :attr:`use_eventfd`, where
+    #: `poller` is a :class:`PollPoller` with `fd` already registered.
+    _cls_idle_eventfds = []
+
+    #: List of every eventfd that must be closed by :meth:`_on_fork`.
+    _cls_all_eventfds = []
+
     def __init__(self):
         self.closed = False
         self._lock = threading.Lock()
         #: List of unconsumed enqueued items.
         self._queue = []
-        #: List of `(wsock, cookie)` awaiting an element, where `wsock` is the
-        #: socketpair's write side, and `cookie` is the string to write.
+        #: List of `(wfd, cookie)` awaiting an element, where `wfd` is the
+        #: socketpair's write side or eventfd, and `cookie` is the string to
+        #: write.
         self._sleeping = []
         #: Number of elements of :attr:`_sleeping` that have already been
         #: woken, and have a corresponding element index from :attr:`_queue`
@@ -1359,6 +2621,9 @@ class Latch(object):
         cls._cls_idle_socketpairs = []
         while cls._cls_all_sockets:
             cls._cls_all_sockets.pop().close()
+        cls._cls_idle_eventfds = []
+        while cls._cls_all_eventfds:
+            os.close(cls._cls_all_eventfds.pop())
 
     def close(self):
         """
@@ -1369,8 +2634,8 @@ class Latch(object):
         try:
             self.closed = True
             while self._waking < len(self._sleeping):
-                wsock, cookie = self._sleeping[self._waking]
-                self._wake(wsock, cookie)
+                wfd, cookie = self._sleeping[self._waking]
+                self._wake(wfd, cookie)
                 self._waking += 1
         finally:
             self._lock.release()
@@ -1404,8 +2669,28 @@ class Latch(object):
             self._cls_all_sockets.extend((rsock, wsock))
             return rsock, wsock
 
+    def _get_eventfd(self):
+        """
+        Return an unused `(fd, poller)` tuple, creating one if none exist.
+        """
+        try:
+            return self._cls_idle_eventfds.pop()  # pop() must be atomic
+        except IndexError:
+            fd = _eventfd(0)
+            set_cloexec(fd)
+            self._cls_all_eventfds.append(fd)
+            # poll() has no descriptor of its own and no FD_SETSIZE limit, so
+            # it is used regardless of poller_class.
+            poller = PollPoller()
+            poller.start_receive(fd)
+            return fd, poller
+
     COOKIE_SIZE = 33
 
+    #: Wake value written to an eventfd. Only the owning thread reads it, and
+    #: it is woken at most once per sleep, so the count read is always 1.
+    EVENTFD_COOKIE = struct.pack('Q', 1)
+
     def _make_cookie(self):
         """
         Return a 33-byte string encoding the ID of the instance and the current
@@ -1437,6 +2722,83 @@ class Latch(object):
         """
         _vv and IOLOG.debug('%r.get(timeout=%r, block=%r)',
                             self, timeout, block)
+        return self._get(timeout, block, False, None)
+
+    def get_many(self, max_items=None, timeout=None, block=True, until=None):
+        """
+        Like :meth:`get`, but return a list of up to `max_items` enqueued
+        objects, or every enqueued object if `max_items` is :data:`None`,
+        taken using one lock acquisition. When the latch is empty, sleep as
+        :meth:`get` does, and once woken, take any further objects enqueued
+        in the meantime.
+
+        Objects already promised to other sleeping threads are never taken,
+        so threads already waiting are not starved.
+
+        :param until:
+            If not :data:`None`, a function called with each object. The
+            first object for which it returns :data:`True` ends the list: it
+            is returned alone if it is first, otherwise it is left at the head
+            of the queue for the next call.
+        :returns:
+            Non-empty list of de-queued objects.
+        """
+        _vv and IOLOG.debug('%r.get_many(max_items=%r, timeout=%r, block=%r)',
+                            self, max_items, timeout, block)
+        if max_items is not None and max_items < 1:
+            raise ValueError('max_items must be at least 1')
+        return self._get(timeout, block, True, max_items, until)
+
+    def requeue(self, objs):
+        """
+        Return objects taken by :meth:`get_many` to the head of the queue, in
+        their original order, ahead of any objects enqueued since, waking
+        sleeping threads as :meth:`put` does.
+
+        :raises mitogen.core.LatchError:
+            :py:meth:`close` has been called, and the object is no longer valid.
+        """
+        _vv and IOLOG.debug('%r.requeue(%r)', self, objs)
+        self._lock.acquire()
+        try:
+            if self.closed:
+                raise LatchError()
+            # Objects ahead of _waking are promised to woken threads.
+            self._queue[self._waking:self._waking] = objs
+            for x in range(min(len(objs),
+                               len(self._sleeping) - self._waking)):
+                wfd, cookie = self._sleeping[self._waking]
+                self._waking += 1
+                self._wake(wfd, cookie)
+        finally:
+            self._lock.release()
+
+    def _take(self, items, max_items, until):
+        """
+        Append up to `max_items` objects not promised to a sleeping thread to
+        `items`, stopping as described by :meth:`get_many`, and return it.
+        Must be called with :attr:`_lock` held.
+        """
+        if until is not None and items and until(items[0]):
+            return items
+        i = len(self._sleeping)
+        if max_items is None:
+            j = len(self._queue)
+        else:
+            j = min(len(self._queue), i + max_items - len(items))
+        if until is not None:
+            for k in range(i, j):
+                if until(self._queue[k]):
+                    if k == i and not items:
+                        j = k + 1
+                    else:
+                        j = k
+                    break
+        items.extend(self._queue[i:j])
+        del self._queue[i:j]
+        return items
+
+    def _get(self, timeout, block, many, max_items, until=None):
         self._lock.acquire()
         try:
             if self.closed:
@@ -1444,30 +2806,48 @@ class Latch(object):
             i = len(self._sleeping)
             if len(self._queue) > i:
                 _vv and IOLOG.debug('%r.get() -> %r', self, self._queue[i])
+                if many:
+                    return self._take([], max_items, until)
                 return self._queue.pop(i)
             if not block:
                 raise TimeoutError()
-            rsock, wsock = self._get_socketpair()
-            cookie = self._make_cookie()
-            self._sleeping.append((wsock, cookie))
+            if self.use_eventfd:
+                fd, poller = self._get_eventfd()
+                cookie = self.EVENTFD_COOKIE
+                self._sleeping.append((fd, cookie))
+            else:
+                rsock, wsock = self._get_socketpair()
+                cookie = self._make_cookie()
+                self._sleeping.append((wsock.fileno(), cookie))
         finally:
             self._lock.release()
 
+        if self.use_eventfd:
+            return self._get_sleep(poller, timeout, block, fd, fd, cookie,
+                                   self._cls_idle_eventfds, (fd, poller),
+                                   many, max_items, until)
+
         poller = self.poller_class()
         poller.start_receive(rsock.fileno())
         try:
-            return self._get_sleep(poller, timeout, block, rsock, wsock, cookie)
+            return self._get_sleep(poller, timeout, block, rsock.fileno(),
+                                   wsock.fileno(), cookie,
+                                   self._cls_idle_socketpairs, (rsock, wsock),
+                                   many, max_items, until)
         finally:
             poller.close()
 
-    def _get_sleep(self, poller, timeout, block, rsock, wsock, cookie):
+    def _get_sleep(self, poller, timeout, block, rfd, wfd, cookie, idle, item,
+                   many, max_items, until):
         """
         When a result is not immediately available, sleep waiting for
-        :meth:`put` to write a byte to our socket pair.
+        :meth:`put` to write a cookie to `wfd`. Once woken, `item` is returned
+        to the `idle` list for reuse. If `many` is :data:`True`, return a list
+        of up to `max_items` objects as described by :meth:`get_many`.
         """
         _vv and IOLOG.debug(
             '%r._get_sleep(timeout=%r, block=%r, rfd=%d, wfd=%d)',
-            self, timeout, block, rsock.fileno(), wsock.fileno()
+            self, timeout, block, rfd, wfd
         )
 
         e = None
@@ -1479,13 +2859,19 @@ class Latch(object):
 
         self._lock.acquire()
         try:
-            i = self._sleeping.index((wsock, cookie))
+            i = self._sleeping.index((wfd, cookie))
             del self._sleeping[i]
-            if not woken:
+            if i >= self._waking:
+                # put() and close() write a cookie only after assigning this
+                # sleeper an element, and can no longer find it, so `rfd` is
+                # empty and `item` is safe to reuse.
+                idle.append(item)
                 raise e or TimeoutError()
 
-            got_cookie = rsock.recv(self.COOKIE_SIZE)
-            self._cls_idle_socketpairs.append((rsock, wsock))
+            # Assigned an element, possibly after the poll timed out, so the
+            # cookie is already written.
+            got_cookie = os.read(rfd, len(cookie))
+            idle.append(item)
 
             assert cookie == got_cookie, (
                 "Cookie incorrect; got %r, expected %r" \
@@ -1498,6 +2884,8 @@ class Latch(object):
             if self.closed:
                 raise LatchError()
             _vv and IOLOG.debug('%r.get() wake -> %r', self, self._queue[i])
+            if many:
+                return self._take([self._queue.pop(i)], max_items, until)
             return self._queue.pop(i)
         finally:
             self._lock.release()
@@ -1518,17 +2906,16 @@ class Latch(object):
             self._queue.append(obj)
 
             if self._waking < len(self._sleeping):
-                wsock, cookie = self._sleeping[self._waking]
+                wfd, cookie = self._sleeping[self._waking]
                 self._waking += 1
-                _vv and IOLOG.debug('%r.put() -> waking wfd=%r',
-                                    self, wsock.fileno())
-                self._wake(wsock, cookie)
+                _vv and IOLOG.debug('%r.put() -> waking wfd=%r', self, wfd)
+                self._wake(wfd, cookie)
         finally:
             self._lock.release()
 
-    def _wake(self, wsock, cookie):
+    def _wake(self, wfd, cookie):
         try:
-            os.write(wsock.fileno(), cookie)
+            os.write(wfd, cookie)
         except OSError:
             e = sys.exc_info()[1]
             if e.args[0] != errno.EBADF:
@@ -1548,16 +2935,34 @@ class Waker(BasicStream):
     Used to wake the multiplexer when another thread needs to modify its state
     (via a cross-thread function call).
 
+    Deferred calls are appended to a :class:`collections.deque`, which is
+    atomic with respect to the GIL, so producers never contend on a lock. The
+    multiplexer is only woken when the queue transitions from empty to
+    non-empty, and drains the entire queue on each wake. On Linux with Python
+    3.10+ an :func:`os.eventfd` is used in place of the pipe.
+
     .. _UNIX self-pipe trick: https://cr.yp.to/docs/selfpipe.html
     """
     broker_ident = None
 
+    #: If :data:`True`, use :func:`os.eventfd` rather than a pipe when it is
+    #: available.
+    use_eventfd = _eventfd is not None
+
     def __init__(self, broker):
         self._broker = broker
-        self._lock = threading.Lock()
-        self._deferred = []
-
-        rfd, wfd = os.pipe()
+        self._deferred = collections.deque()
+        #: :data:`True` while a wake is outstanding, i.e. written by
+        #: :meth:`defer` but not yet consumed by :meth:`on_receive`.
+        self._waking = False
+
+        if self.use_eventfd:
+            rfd = _eventfd(0)
+            wfd = os.dup(rfd)
+            self._wake_buf = struct.pack('Q', 1)
+        else:
+            rfd, wfd = os.pipe()
+            self._wake_buf = b(' ')
         self.receive_side = Side(self, rfd)
         self.transmit_side = Side(self, wfd)
 
@@ -1573,31 +2978,26 @@ class Waker(BasicStream):
         """
         Prevent immediate Broker shutdown while deferred functions remain.
         """
-        self._lock.acquire()
-        try:
-            return len(self._deferred)
-        finally:
-            self._lock.release()
+        return len(self._deferred)
 
     def on_receive(self, broker):
         """
-        Drain the pipe and fire callbacks. Reading multiple bytes is safe since
-        new bytes corresponding to future .defer() calls are written only after
-        .defer() takes _lock: either a byte we read corresponds to something
-        already on the queue by the time we take _lock, or a byte remains
-        buffered, causing another wake up, because it was written after we
-        released _lock.
+        Drain the wake descriptor and fire callbacks. :attr:`_waking` is reset
+        only after the descriptor is drained and before the queue is drained:
+        any :meth:`defer` call that observes :attr:`_waking` as :data:`True`
+        has already appended to the queue, so its item is run below, and any
+        call that observes it as :data:`False` writes a fresh wake.
+
+        At most the number of items present on entry are run, so producers
+        cannot starve other streams; later items have their own wake pending.
         """
         _vv and IOLOG.debug('%r.on_receive()', self)
         self.receive_side.read(128)
-        self._lock.acquire()
-        try:
-            deferred = self._deferred
-            self._deferred = []
-        finally:
-            self._lock.release()
+        self._waking = False
 
-        for func, args, kwargs in deferred:
+        deferred = self._deferred
+        for x in range(len(deferred)):
+            func, args, kwargs = deferred.popleft()
             try:
                 func(*args, **kwargs)
             except Exception:
@@ -1610,21 +3010,22 @@ class Waker(BasicStream):
             _vv and IOLOG.debug('%r.defer() [immediate]', self)
             return func(*args, **kwargs)
 
-        _vv and IOLOG.debug('%r.defer() [fd=%r]', self, self.transmit_side.fd)
-        self._lock.acquire()
-        try:
-            self._deferred.append((func, args, kwargs))
-        finally:
-            self._lock.release()
+        self._deferred.append((func, args, kwargs))
+        if self._waking:
+            return
 
-        # Wake the multiplexer by writing a byte. If the broker is in the midst
-        # of tearing itself down, the waker fd may already have been closed, so
+        # Wake the multiplexer. Concurrent producers may both observe _waking
+        # as False, causing a harmless spurious wake, and a full pipe already
+        # guarantees a wake, so ignore EAGAIN. If the broker is in the midst of
+        # tearing itself down, the waker fd may already have been closed, so
         # ignore EBADF here.
+        _vv and IOLOG.debug('%r.defer() [fd=%r]', self, self.transmit_side.fd)
+        self._waking = True
         try:
-            self.transmit_side.write(b(' '))
+            self.transmit_side.write(self._wake_buf)
         except OSError:
             e = sys.exc_info()[1]
-            if e.args[0] != errno.EBADF:
+            if e.args[0] not in (errno.EBADF, errno.EAGAIN):
                 raise
 
 
@@ -1672,11 +3073,34 @@ class IoLogger(BasicStream):
         self._log_lines()
 
 
+class _Fragments(object):
+    """
+    :class:`Router` state for a message arriving as fragments. When `bits` is
+    :data:`None`, each fragment is routed as it arrives, otherwise they are
+    accumulated until the last arrives.
+    """
+    def __init__(self, stream, reassemble):
+        self.stream = stream
+        self.bits = None
+        if reassemble:
+            self.bits = []
+        self.size = 0
+        self.dropped = False
+
+
 class Router(object):
     context_class = Context
     max_message_size = 128 * 1048576
     unidirectional = False
 
+    #: When more than this many bytes are queued across every stream, threads
+    #: routing messages with `block=True` via a stream with more than its
+    #: :attr:`Stream.low_watermark` queued wait in :meth:`route` until the
+    #: total falls below it. Streams with little output queued are unaffected,
+    #: so a single stalled peer cannot block traffic to others. 0 disables the
+    #: budget.
+    max_queued_bytes = 256 * 1048576
+
     def __init__(self, broker):
         self.broker = broker
         listen(broker, 'exit', self._on_broker_exit)
@@ -1688,30 +3112,91 @@ class Router(object):
 
         #: context ID -> Stream
         self._stream_by_id = {}
+        #: Stream -> set of context IDs routed via it, the inverse of
+        #: :attr:`_stream_by_id`.
+        self._ids_by_stream = {}
         #: List of contexts to notify of shutdown.
         self._context_by_id = {}
         self._last_handle = itertools.count(1000)
-        #: handle -> (persistent?, func(msg))
+        #: handle -> (persistent?, func(msg), policy, fragments?)
         self._handle_map = {}
+        #: handle -> (respondent Context, its disconnect listener), for
+        #: handles registered with a respondent.
+        self._respondent_by_handle = {}
+        #: (src_id, dst_id, handle, priority) -> _Fragments
+        self._fragments = {}
+        #: Signalled by the broker as streams drain, while :attr:`_flow_waiters`
+        #: threads are blocked in :meth:`route`.
+        self._flow_cond = threading.Condition()
+        self._flow_waiters = 0
+        #: Bytes queued for transmission by every stream, maintained by the
+        #: streams on the broker thread.
+        self._queued_bytes = 0
 
     def __repr__(self):
         return 'Router(%r)' % (self.broker,)
 
+    def _add_route(self, target_id, stream):
+        """
+        Arrange for messages to `target_id` to be sent via `stream`, replacing
+        any existing route.
+        """
+        old = self._stream_by_id.get(target_id)
+        if old is not None:
+            self._discard_id(old, target_id)
+        self._stream_by_id[target_id] = stream
+        self._ids_by_stream.setdefault(stream, set()).add(target_id)
+
+    def _del_route(self, target_id):
+        """
+        Forget the route to `target_id`.
+
+        :raises KeyError:
+            No route exists.
+        """
+        self._forget_fragments(target_id)
+        self._discard_id(self._stream_by_id.pop(target_id), target_id)
+
+    def _forget_fragments(self, context_id):
+        """
+        Discard partial messages from or to `context_id`. A relayed context
+        may vanish while the stream its fragments arrived on stays up, so
+        they would otherwise never complete.
+        """
+        for key in list(self._fragments):
+            if context_id in key[:2]:
+                del self._fragments[key]
+
+    def _discard_id(self, stream, target_id):
+        ids = self._ids_by_stream.get(stream)
+        if ids is not None:
+            ids.discard(target_id)
+            if not ids:
+                del self._ids_by_stream[stream]
+
     def on_stream_disconnect(self, stream):
-        for context in self._context_by_id.values():
-            stream_ = self._stream_by_id.get(context.context_id)
-            if stream_ is stream:
-                del self._stream_by_id[context.context_id]
+        for target_id in self._ids_by_stream.pop(stream, ()):
+            if self._stream_by_id.get(target_id) is stream:
+                del self._stream_by_id[target_id]
+            context = self._context_by_id.get(target_id)
+            if context is not None:
                 context.on_disconnect()
+        for key, state in list(self._fragments.items()):
+            if state.stream is stream:
+                del self._fragments[key]
+        if self._flow_waiters:
+            self._notify_writable()
 
     def _on_broker_exit(self):
+        self._respondent_by_handle.clear()
         while self._handle_map:
-            _, (_, func, _) = self._handle_map.popitem()
+            _, (_, func, _, _) = self._handle_map.popitem()
             func(Message.dead())
+        self._notify_writable()
 
     def register(self, context, stream):
         _v and LOG.debug('register(%r, %r)', context, stream)
-        self._stream_by_id[context.context_id] = stream
+        self._add_route(context.context_id, stream)
         self._context_by_id[context.context_id] = context
         self.broker.start_receive(stream)
         listen(stream, 'disconnect', lambda: self.on_stream_disconnect(stream))
@@ -1720,11 +3205,39 @@ class Router(object):
         return self._stream_by_id.get(dst_id,
             self._stream_by_id.get(mitogen.parent_id))
 
+    def get_pickle_protocol(self, dst_id):
+        """
+        Return the pickle protocol to use for a message destined for `dst_id`,
+        as negotiated with the next hop towards it. Routers transcode messages
+        if a later hop supports only a lower protocol.
+        """
+        if dst_id == mitogen.context_id:
+            return pickle.HIGHEST_PROTOCOL
+        stream = self.stream_by_id(dst_id)
+        if stream is None:
+            return 2
+        return stream.pickle_protocol
+
     def del_handler(self, handle):
         del self._handle_map[handle]
+        self._forget_respondent(handle)
+
+    def _forget_respondent(self, handle):
+        """
+        Stop listening for disconnection of the respondent of `handle`, if it
+        had one, so contexts serving many calls do not accumulate listeners.
+        """
+        try:
+            respondent, on_disconnect = self._respondent_by_handle.pop(handle)
+        except KeyError:
+            return
+        try:
+            unlisten(respondent, 'disconnect', on_disconnect)
+        except ValueError:
+            pass  # Raced with the respondent disconnecting.
 
     def add_handler(self, fn, handle=None, persist=True,
-                    policy=None, respondent=None):
+                    policy=None, respondent=None, fragments=False):
         handle = handle or next(self._last_handle)
         _vv and IOLOG.debug('%r.add_handler(%r, %r, %r)', self, fn, handle, persist)
 
@@ -1736,9 +3249,12 @@ class Router(object):
                 if handle in self._handle_map:
                     fn(Message.dead())
                     del self._handle_map[handle]
+                # The signal is firing, so unlisten() is unnecessary.
+                self._respondent_by_handle.pop(handle, None)
+            self._respondent_by_handle[handle] = respondent, on_disconnect
             listen(respondent, 'disconnect', on_disconnect)
 
-        self._handle_map[handle] = persist, fn, policy
+        self._handle_map[handle] = persist, fn, policy, fragments
         return handle
 
     def on_shutdown(self, broker):
@@ -1755,14 +3271,18 @@ class Router(object):
     def _invoke(self, msg, stream):
         # IOLOG.debug('%r._invoke(%r)', self, msg)
         try:
-            persist, fn, policy = self._handle_map[msg.handle]
+            persist, fn, policy, _ = self._handle_map[msg.handle]
         except KeyError:
+            if msg.more:
+                return
             LOG.error('%r: invalid handle: %r', self, msg)
             if msg.reply_to and not msg.is_dead:
                 msg.reply(Message.dead())
             return
 
         if policy and not policy(msg, stream):
+            if msg.more:
+                return
             LOG.error('%r: policy refused message: %r', self, msg)
             if msg.reply_to:
                 self.route(Message.pickled(
@@ -1772,17 +3292,118 @@ class Router(object):
                 ))
             return
 
-        if not persist:
+        if not (persist or msg.more):
             del self._handle_map[msg.handle]
+            self._forget_respondent(msg.handle)
 
         try:
             fn(msg)
         except Exception:
             LOG.exception('%r._invoke(%r): %r crashed', self, msg, fn)
 
+    def _needs_transcode(self, data, protocol):
+        """
+        Return :data:`True` if `data` looks like a pickle using a higher
+        protocol than `protocol`. Messages whose protocol every hop supports
+        are forwarded untouched.
+        """
+        # Pickles of protocol 2 and above begin with PROTO (0x80) <version>.
+        if len(data) < 2 or ord(data[0:1]) != 0x80:
+            return False
+        if data[:_OOB_PREFIX_LEN] == _OOB_PREFIX:
+            return protocol < 5
+        # A sender never uses a protocol higher than this context negotiated
+        # with it, so anything else is not a pickle.
+        return protocol < ord(data[1:2]) <= pickle.HIGHEST_PROTOCOL
+
+    transcode_failed_msg = (
+        'Cannot forward message to a context that only supports pickle '
+        'protocol %d: %s'
+    )
+
+    def _transcode(self, msg, protocol):
+        """
+        Re-serialize `msg` using `protocol` if its data is a pickle using a
+        higher protocol, as happens when forwarding between streams that
+        negotiated different protocols.
+
+        :raises StreamError:
+            The data could not be unpickled by this context, so the next hop
+            would be unable to read it either.
+        """
+        if not self._needs_transcode((msg._bits or (msg.data,))[0],
+                                     protocol):
+            return
+        try:
+            obj = Message(data=msg.data, router=self).unpickle(
+                throw=False,
+                throw_dead=False,
+            )
+        except Exception:
+            # Besides StreamError, truncated or corrupt pickles raise
+            # EOFError, UnpicklingError and others. Whoever sent them must not
+            # be able to crash this context.
+            raise StreamError(self.transcode_failed_msg,
+                              protocol, sys.exc_info()[1])
+        msg._set_bits(_dumps(obj, protocol))
+
+    def _must_reassemble(self, msg):
+        """
+        Return :data:`True` if the message whose first fragment is `msg` must
+        be reassembled before it can be delivered or forwarded: when it is
+        addressed to a local handler that did not ask for fragments, or its
+        pickle must be transcoded for the next hop.
+        """
+        if msg.dst_id == mitogen.context_id:
+            entry = self._handle_map.get(msg.handle)
+            return entry is not None and not entry[3]
+
+        stream = self.stream_by_id(msg.dst_id)
+        return (stream is not None and
+                self._needs_transcode(msg.data, stream.pickle_protocol))
+
+    def _on_fragment(self, msg, in_stream):
+        """
+        Track `msg` if it is part of a fragmented message. Return `(msg,
+        fragment)`, where `msg` is the message to continue routing, or
+        :data:`None` if nothing should be routed yet, and `fragment` is
+        :data:`True` if it is a fragment routed as it arrived rather than a
+        complete message.
+        """
+        # Lanes are drained independently, so fragments of a bulk message may
+        # be interleaved with a priority message to the same handle.
+        priority = msg.priority or msg.handle in Stream.PRIORITY_HANDLES
+        key = (msg.src_id, msg.dst_id, msg.handle, priority)
+        state = self._fragments.get(key)
+        if state is None:
+            if not msg.more:
+                return msg, False
+            state = _Fragments(in_stream, self._must_reassemble(msg))
+            self._fragments[key] = state
+        if not msg.more:
+            del self._fragments[key]
+        if state.bits is None:
+            if state.dropped:
+                return None, True
+            return msg, True
+
+        state.size += len(msg.data)
+        if state.size > self.max_message_size:
+            LOG.error('fragmented message too large (max %d bytes): %r',
+                      self.max_message_size, msg)
+            state.bits = None
+            state.dropped = True
+            return None, True
+
+        state.bits.append(msg.data)
+        if msg.more:
+            return None, True
+        msg.data = b('').join(state.bits)
+        return msg, False
+
     def _async_route(self, msg, in_stream=None):
         _vv and IOLOG.debug('%r._async_route(%r, %r)', self, msg, in_stream)
-        if len(msg.data) > self.max_message_size:
+        if msg._data_len() > self.max_message_size:
             LOG.error('message too large (max %d bytes): %r',
                       self.max_message_size, msg)
             return
@@ -1806,6 +3427,12 @@ class Router(object):
             if in_stream.auth_id is not None:
                 msg.auth_id = in_stream.auth_id
 
+        fragment = False
+        if msg.more or self._fragments:
+            msg, fragment = self._on_fragment(msg, in_stream)
+            if msg is None:
+                return
+
         if msg.dst_id == mitogen.context_id:
             return self._invoke(msg, in_stream)
 
@@ -1826,25 +3453,111 @@ class Router(object):
             dead = True
 
         if dead:
-            if msg.reply_to and not msg.is_dead:
+            if msg.reply_to and not (msg.is_dead or msg.more):
                 msg.reply(Message.dead(), router=self)
             return
 
+        if not fragment:
+            try:
+                self._transcode(msg, out_stream.pickle_protocol)
+            except StreamError:
+                e = sys.exc_info()[1]
+                LOG.error('%r: %s: %r', self, e, msg)
+                if msg.reply_to and not (msg.is_dead or msg.more):
+                    self.route(Message.pickled(
+                        CallError(e),
+                        dst_id=msg.src_id,
+                        handle=msg.reply_to,
+                    ))
+                return
         out_stream._send(msg)
 
-    def route(self, msg):
+    def queued_bytes(self):
+        """
+        Return the total bytes queued for transmission by every stream.
+        """
+        return self._queued_bytes
+
+    def _must_wait(self, stream):
+        if stream.congested:
+            return True
+        return (self.max_queued_bytes and
+                stream.pending_bytes() > stream.low_watermark and
+                self._queued_bytes > self.max_queued_bytes)
+
+    def _notify_writable(self):
+        self._flow_cond.acquire()
+        try:
+            self._flow_cond.notify_all()
+        finally:
+            self._flow_cond.release()
+
+    def _wait_writable(self, msg, timeout):
+        """
+        Block the calling thread while the stream `msg` would be sent on is
+        congested, or raise :class:`TimeoutError` if `timeout` elapses. Never
+        blocks the broker thread, or priority messages, some of which are sent
+        with locks held that the broker needs.
+        """
+        if msg.dst_id == mitogen.context_id or msg.priority or \
+                msg.handle in Stream.PRIORITY_HANDLES:
+            return
+        stream = self.stream_by_id(msg.dst_id)
+        if stream is None or not self._must_wait(stream):
+            return
+        if self.broker._thread == threading.currentThread():
+            return
+        if timeout is not None and timeout <= 0:
+            raise TimeoutError('%r is congested', stream)
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+        stream.tx_waits += 1
+        self._flow_cond.acquire()
+        try:
+            self._flow_waiters += 1
+            try:
+                while self._must_wait(stream):
+                    if (not self.broker._alive) or stream.transmit_side is None \
+                            or stream.transmit_side.closed:
+                        return
+                    if timeout is None:
+                        self._flow_cond.wait()
+                    else:
+                        remain = deadline - time.time()
+                        if remain <= 0:
+                            raise TimeoutError('%r is congested', stream)
+                        self._flow_cond.wait(remain)
+            finally:
+                self._flow_waiters -= 1
+        finally:
+            self._flow_cond.release()
+
+    def route(self, msg, block=False, timeout=None):
+        """
+        Arrange for `msg` to be routed towards its destination. May be called
+        from any thread. If `block` is :data:`True`, when called from a thread
+        other than the broker and the stream `msg` will be sent on is
+        congested, block until it drains, or raise :class:`TimeoutError` once
+        `timeout` seconds elapse, or immediately if `timeout` is 0. Blocking
+        is opt-in, as callers holding locks needed by other threads must not
+        wait.
+        """
+        if block:
+            self._wait_writable(msg, timeout)
         self.broker.defer(self._async_route, msg)
 
 
 class Broker(object):
-    poller_class = Poller
+    poller_class = DEFAULT_POLLER
+    waker_class = Waker
     _waker = None
     _thread = None
     shutdown_timeout = 3.0
 
     def __init__(self, poller_class=None):
         self._alive = True
-        self._waker = Waker(self)
+        self._waker = self.waker_class(self)
         self.defer = self._waker.defer
         self.poller = self.poller_class()
         self.poller.start_receive(
@@ -2036,6 +3749,11 @@ class ExternalContext(object):
                              policy=has_parent_authority)
         self.stream = Stream(self.router, parent_id)
         self.stream.name = 'parent'
+        self.stream.compression_level = self.config.get('compression_level', 0)
+        if 'compression_threshold' in self.config:
+            self.stream.compression_threshold = (
+                self.config['compression_threshold']
+            )
         self.stream.accept(in_fd, out_fd)
         self.stream.receive_side.keep_alive = False
 
@@ -2058,6 +3776,15 @@ class ExternalContext(object):
         if self.config['debug']:
             enable_debug_logging()
 
+    def _open_module_cache(self):
+        path = self.config.get('module_cache_dir')
+        if path:
+            try:
+                return ModuleCache(path, self.config.get('module_cache_size'))
+            except (IOError, OSError):
+                e = sys.exc_info()[1]
+                LOG.warning('module cache %r disabled: %s', path, e)
+
     def _setup_importer(self):
         importer = self.config.get('importer')
         if importer:
@@ -2082,6 +3809,7 @@ class ExternalContext(object):
                 core_src,
                 self.config.get('whitelist', ()),
                 self.config.get('blacklist', ()),
+                module_cache=self._open_module_cache(),
             )
 
         self.importer = importer
@@ -2109,6 +3837,20 @@ class ExternalContext(object):
         mitogen.parent_ids = self.config['parent_ids'][:]
         mitogen.parent_id = mitogen.parent_ids[0]
 
+    def _setup_pickle_protocol(self):
+        # The parent offers the highest protocol it can read. Reply with ours,
+        # so both ends send using the highest protocol the other can read.
+        protocol = self.config.get('pickle_protocol')
+        if protocol:
+            self.stream.pickle_protocol = min(protocol,
+                                              pickle.HIGHEST_PROTOCOL)
+            self.parent.send(
+                Message(
+                    handle=PICKLE_PROTOCOL,
+                    data=b(str(pickle.HIGHEST_PROTOCOL)),
+                )
+            )
+
     def _setup_stdio(self):
         # We must open this prior to closing stdout, otherwise it will recycle
         # a standard handle, the dup2() will not error, and on closing it, we
@@ -2185,6 +3927,7 @@ class ExternalContext(object):
                     self._setup_stdio()
 
                 self.router.register(self.parent, self.stream)
+                self._setup_pickle_protocol()
 
                 sys.executable = os.environ.pop('ARGV0', sys.executable)
                 _v and LOG.debug('Connected to %s; my ID is %r, PID is %r',
@@ -113,6 +113,22 @@ def get_stream_info(router_id):
                 'sent_module_count': len(getattr(stream, 'sent_modules', [])),
                 'routes': sorted(getattr(stream, 'routes', [])),
                 'type': type(stream).__module__,
+                'tx_messages': getattr(stream, 'tx_messages', 0),
+                'tx_syscalls': getattr(stream, 'tx_syscalls', 0),
+                'tx_syscalls_per_message': (
+                    float(getattr(stream, 'tx_syscalls', 0)) /
+                    max(1, getattr(stream, 'tx_messages', 0))
+                ),
+                'tx_compressed': getattr(stream, 'tx_compressed', 0),
+                'tx_compression_saved': getattr(stream,
+                                                'tx_compression_saved', 0),
+                'tx_fragments': getattr(stream, 'tx_fragments', 0),
+                'tx_priority': getattr(stream, 'tx_priority', 0),
+                'pending_lanes': (hasattr(stream, 'pending_lanes') and
+                                  stream.pending_lanes()),
+                'pending_bytes': stream.pending_bytes(),
+                'congested': getattr(stream, 'congested', False),
+                'tx_waits': getattr(stream, 'tx_waits', 0),
             }))
             for via_id, stream in router._stream_by_id.items()
         )
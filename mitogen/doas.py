@@ -99,8 +99,7 @@ class Stream(mitogen.parent.Stream):
 
         for buf in it:
             LOG.debug('%r: received %r', self, buf)
-            if buf.endswith(self.EC0_MARKER):
-                self._ec0_received()
+            if self._bootstrap_marker_received(buf):
                 return
             if any(s in buf.lower() for s in self.incorrect_prompts):
                 if password_sent:
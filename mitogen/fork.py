@@ -26,6 +26,7 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import gc
 import logging
 import os
 import random
@@ -86,6 +87,35 @@ def on_fork():
     mitogen.core.Side._on_fork()
 
 
+def freeze_gc():
+    """
+    On Python 3.7 and above, move every object tracked by the garbage collector
+    to its permanent generation, so that collections in a forked child do not
+    visit, and so copy, the memory pages holding objects inherited from the
+    parent. Frozen objects are never collected, so a long-lived parent should
+    call this once, after building the state its children inherit, rather
+    than before every fork. Does nothing on older Pythons.
+    """
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def unfreeze_gc():
+    """
+    Undo :func:`freeze_gc`, if it is supported.
+    """
+    if hasattr(gc, 'unfreeze'):
+        gc.unfreeze()
+
+
+def _is_gc_frozen():
+    """
+    Return :data:`True` if any objects are in the garbage collector's
+    permanent generation, for example following a call to :func:`freeze_gc`.
+    """
+    return bool(getattr(gc, 'get_freeze_count', int)())
+
+
 def handle_child_crash():
     """
     Respond to _child_main() crashing by ensuring the relevant exception is
@@ -109,15 +139,27 @@ class Stream(mitogen.parent.Stream):
     #: User-supplied function for cleaning up child process state.
     on_fork = None
 
+    #: If :data:`True`, call :func:`freeze_gc` prior to forking, and
+    #: :func:`unfreeze_gc` in the parent once forked, unless the caller had
+    #: already frozen the heap, in which case it is left frozen.
+    freeze_gc = False
+
     def construct(self, old_router, max_message_size, on_fork=None,
                   debug=False, profiling=False, unidirectional=False,
-                  on_start=None):
+                  on_start=None, compression_level=None,
+                  compression_threshold=None, freeze_gc=False):
         # fork method only supports a tiny subset of options.
-        super(Stream, self).construct(max_message_size=max_message_size,
-                                      debug=debug, profiling=profiling,
-                                      unidirectional=False)
+        super(Stream, self).construct(
+            max_message_size=max_message_size,
+            debug=debug,
+            profiling=profiling,
+            unidirectional=False,
+            compression_level=compression_level,
+            compression_threshold=compression_threshold,
+        )
         self.on_fork = on_fork
         self.on_start = on_start
+        self.freeze_gc = freeze_gc
 
         responder = getattr(old_router, 'responder', None)
         if isinstance(responder, mitogen.parent.ModuleForwarder):
@@ -127,7 +169,18 @@ class Stream(mitogen.parent.Stream):
 
     def start_child(self):
         parentfp, childfp = mitogen.parent.create_socketpair()
-        self.pid = os.fork()
+        # Always freeze, so objects allocated since the caller froze the heap
+        # are frozen in the child too, but never thaw the caller's freeze.
+        thaw = self.freeze_gc and not _is_gc_frozen()
+        if self.freeze_gc:
+            freeze_gc()
+        try:
+            self.pid = os.fork()
+        finally:
+            # Only the child keeps the heap frozen, otherwise garbage alive in
+            # the parent at each fork would never be collected.
+            if thaw and self.pid != 0:
+                unfreeze_gc()
         if self.pid:
             childfp.close()
             # Decouple the socket from the lifetime of the Python socket object.
@@ -191,3 +244,183 @@ class Stream(mitogen.parent.Stream):
     def _connect_bootstrap(self, extra_fd):
         # None required.
         pass
+
+
+class Pool(object):
+    """
+    Keep up to `size` children forked ahead of time by `router`, so that
+    :meth:`get` usually returns a fully started context without waiting for
+    fork() and child setup. Every child is forked by one background thread,
+    which replaces children as they are taken, and forks on behalf of
+    :meth:`get` when none is ready, so forks are never made by several threads
+    at once. Children that exit before being taken are replaced during the
+    next call to :meth:`get`.
+
+    Children are prepared before they are needed, so any state they must
+    carry should be established by `on_fork` or `on_start`, rather than by
+    calls made after :meth:`get` returns.
+
+    :param mitogen.parent.Router router:
+        Router used to fork children.
+    :param int size:
+        Number of children to keep ready.
+    :param kwargs:
+        Keyword arguments passed to :meth:`mitogen.parent.Router.fork`.
+    """
+    closed_msg = 'Pool is closed'
+
+    def __init__(self, router, size=1, **kwargs):
+        self.router = router
+        self.size = size
+        self.kwargs = kwargs
+        #: Protects :attr:`_ready`, :attr:`_waiters` and :attr:`closed`.
+        self._lock = threading.Lock()
+        #: `(context, disconnect listener)` for started children not yet
+        #: handed out, oldest first.
+        self._ready = []
+        #: Latches of threads sleeping in :meth:`get`, oldest first.
+        self._waiters = []
+        #: Posted to wake the refill thread.
+        self._wake = mitogen.core.Latch()
+        self.closed = False
+        mitogen.core.listen(router.broker, 'shutdown', self.close)
+        self._thread = threading.Thread(
+            name='mitogen.fork.Pool.%x' % (id(self),),
+            target=mitogen.core._profile_hook,
+            args=('mitogen.fork.Pool', self._refill_main),
+        )
+        self._thread.setDaemon(True)
+        self._thread.start()
+        self._wake.put(None)
+
+    def __repr__(self):
+        return 'Pool(size=%d, ready=%d)' % (self.size, len(self._ready))
+
+    def _on_disconnect(self, context):
+        self._lock.acquire()
+        try:
+            for i, (ready, _) in enumerate(self._ready):
+                if ready is context:
+                    # Not replaced until the next get(), so a child that
+                    # crashes during startup cannot cause endless forking.
+                    LOG.debug('%r: ready child %r disconnected', self, context)
+                    del self._ready[i]
+                    break
+        finally:
+            self._lock.release()
+
+    def _must_fork(self):
+        self._lock.acquire()
+        try:
+            return (not self.closed) and (
+                bool(self._waiters) or len(self._ready) < self.size
+            )
+        finally:
+            self._lock.release()
+
+    def _on_fork_failed(self, e):
+        """
+        Wake every thread waiting in :meth:`get` with the exception `e`.
+        """
+        self._lock.acquire()
+        try:
+            waiters, self._waiters = self._waiters, []
+        finally:
+            self._lock.release()
+        for waiter in waiters:
+            waiter.put(e)
+
+    def _add(self, context):
+        """
+        Hand a newly forked `context` to the oldest thread waiting in
+        :meth:`get`, or if none are waiting, add it to the ready list.
+        """
+        on_disconnect = lambda: self._on_disconnect(context)
+        mitogen.core.listen(context, 'disconnect', on_disconnect)
+        waiter = None
+        self._lock.acquire()
+        try:
+            closed = self.closed
+            if not closed:
+                if self._waiters:
+                    waiter = self._waiters.pop(0)
+                else:
+                    self._ready.append((context, on_disconnect))
+        finally:
+            self._lock.release()
+
+        if closed:
+            context.shutdown()
+        elif waiter is not None:
+            mitogen.core.unlisten(context, 'disconnect', on_disconnect)
+            waiter.put(context)
+
+    def _refill_main(self):
+        while True:
+            try:
+                self._wake.get()
+            except mitogen.core.LatchError:
+                return
+
+            while self._must_fork():
+                try:
+                    context = self.router.fork(**self.kwargs)
+                except Exception:
+                    e = sys.exc_info()[1]
+                    LOG.exception('%r: fork failed', self)
+                    self._on_fork_failed(e)
+                    break
+                self._add(context)
+
+    def get(self):
+        """
+        Return a ready :class:`mitogen.parent.Context`, waiting for the
+        refill thread to fork one if none is ready, and arrange for a
+        replacement to be prepared.
+
+        :raises mitogen.core.Error:
+            The pool was closed.
+        :raises Exception:
+            No child was ready, and forking one failed.
+        """
+        self._lock.acquire()
+        try:
+            if self.closed:
+                raise mitogen.core.Error(self.closed_msg)
+            waiter = None
+            if self._ready:
+                context, on_disconnect = self._ready.pop(0)
+            else:
+                waiter = mitogen.core.Latch()
+                self._waiters.append(waiter)
+            self._wake.put(None)
+        finally:
+            self._lock.release()
+
+        if waiter is None:
+            mitogen.core.unlisten(context, 'disconnect', on_disconnect)
+            return context
+
+        result = waiter.get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        """
+        Stop the refill thread and shut down any children not yet handed out.
+        Threads waiting in :meth:`get` receive :class:`mitogen.core.Error`.
+        """
+        self._lock.acquire()
+        try:
+            self.closed = True
+            ready, self._ready = self._ready, []
+            waiters, self._waiters = self._waiters, []
+        finally:
+            self._lock.release()
+
+        self._wake.close()
+        for waiter in waiters:
+            waiter.put(mitogen.core.Error(self.closed_msg))
+        for context, _ in ready:
+            context.shutdown()
@@ -38,6 +38,7 @@ import imp
 import inspect
 import itertools
 import logging
+import marshal
 import os
 import pkgutil
 import re
@@ -538,10 +539,18 @@ class ModuleFinder(object):
 
 
 class ModuleResponder(object):
+    #: If :data:`True`, modules sent to a child whose
+    #: :data:`mitogen.core.BYTECODE_TAG` matches our own are accompanied by
+    #: their compiled code, so the child need not compile them itself.
+    ship_bytecode = True
+
     def __init__(self, router):
         self._router = router
         self._finder = ModuleFinder()
         self._cache = {}  # fullname -> pickled
+        self._bytecode_cache = {}  # (fullname, tag) -> compressed or None
+        self._digest_cache = {}  # fullname -> digest
+        mitogen.core._import_sha1()
         self.blacklist = []
         self.whitelist = ['']
         router.add_handler(
@@ -614,28 +623,61 @@ class ModuleResponder(object):
         self._cache[fullname] = tup
         return tup
 
-    def _send_load_module(self, stream, fullname):
-        if fullname not in stream.sent_modules:
-            LOG.debug('_send_load_module(%r, %r)', stream, fullname)
-            self._router._async_route(
-                mitogen.core.Message.pickled(
-                    self._build_tuple(fullname),
-                    dst_id=stream.remote_id,
-                    handle=mitogen.core.LOAD_MODULE,
+    def _get_bytecode(self, tup):
+        """
+        Return the compressed, marshalled code object for the module described
+        by `tup`, compiling it on first use, or :data:`None` if it cannot be
+        compiled.
+        """
+        key = (tup[0], mitogen.core.BYTECODE_TAG)
+        if key not in self._bytecode_cache:
+            source = zlib.decompress(tup[3])
+            try:
+                code = compile(source, 'master:' + tup[2], 'exec', 0, 1)
+                compressed = mitogen.core.Blob(
+                    zlib.compress(marshal.dumps(code), 9)
                 )
-            )
+            except Exception:
+                LOG.debug('_get_bytecode(%r): cannot compile', tup[0],
+                          exc_info=True)
+                compressed = None
+            self._bytecode_cache[key] = compressed
+        return self._bytecode_cache[key]
+
+    def _is_cached(self, stream, tup):
+        """
+        Return :data:`True` if the remote end of `stream` reported having
+        an identical copy of the module described by `tup` cached.
+        """
+        digest = stream.module_digests.get(tup[0])
+        if not digest:
+            return False
+        if tup[0] not in self._digest_cache:
+            self._digest_cache[tup[0]] = mitogen.core.module_digest(tup[3])
+        return digest == self._digest_cache[tup[0]]
+
+    def _add_load_module(self, stream, fullname, tups):
+        if fullname not in stream.sent_modules:
+            LOG.debug('_add_load_module(%r, %r)', stream, fullname)
+            tup = self._build_tuple(fullname)
+            if tup[3] is not None and self._is_cached(stream, tup):
+                # Omit the source, the child will use its cached copy.
+                tup = tup[:3] + (None,) + tup[4:5]
+            elif (self.ship_bytecode and tup[3] is not None and
+                    stream.bytecode_tag == mitogen.core.BYTECODE_TAG):
+                compressed = self._get_bytecode(tup)
+                if compressed is not None:
+                    # 5:(tag, compressed bytecode)
+                    tup += ((stream.bytecode_tag, compressed),)
+            tups.append(tup)
             stream.sent_modules.add(fullname)
 
-    def _send_module_load_failed(self, stream, fullname):
-        stream.send(
-            mitogen.core.Message.pickled(
-                (fullname, None, None, None, ()),
-                dst_id=stream.remote_id,
-                handle=mitogen.core.LOAD_MODULE,
-            )
-        )
-
-    def _send_module_and_related(self, stream, fullname):
+    def _add_module_and_related(self, stream, fullname, tups):
+        """
+        Append to `tups` the tuple for `fullname`, preceded by those of any
+        related modules not yet sent on `stream`, or a negative response if
+        `fullname` cannot be served.
+        """
         try:
             tup = self._build_tuple(fullname)
             if tup[2] and is_stdlib_path(tup[2]):
@@ -643,7 +685,7 @@ class ModuleResponder(object):
                 # RTT per hit, so a client-side solution is also required.
                 LOG.warning('%r: refusing to serve stdlib module %r',
                             self, fullname)
-                self._send_module_load_failed(stream, fullname)
+                tups.append(self._make_negative_response(fullname))
                 return
 
             for name in tup[4]:  # related
@@ -652,11 +694,31 @@ class ModuleResponder(object):
                     # Parent hasn't been sent, so don't load submodule yet.
                     continue
 
-                self._send_load_module(stream, name)
-            self._send_load_module(stream, fullname)
+                self._add_load_module(stream, name, tups)
+            self._add_load_module(stream, fullname, tups)
         except Exception:
             LOG.debug('While importing %r', fullname, exc_info=True)
-            self._send_module_load_failed(stream, fullname)
+            tups.append(self._make_negative_response(fullname))
+
+    def _send_tuples(self, stream, tups):
+        """
+        Send `tups` using one LOAD_MODULE message. A single tuple is sent
+        alone, otherwise a list of tuples is sent.
+        """
+        if tups:
+            self._router._async_route(
+                mitogen.core.Message.pickled(
+                    tups[0] if len(tups) == 1 else tups,
+                    protocol=stream.pickle_protocol,
+                    dst_id=stream.remote_id,
+                    handle=mitogen.core.LOAD_MODULE,
+                )
+            )
+
+    def _send_module_and_related(self, stream, fullname):
+        tups = []
+        self._add_module_and_related(stream, fullname, tups)
+        self._send_tuples(stream, tups)
 
     def _on_get_module(self, msg):
         if msg.is_dead:
@@ -664,12 +726,18 @@ class ModuleResponder(object):
 
         LOG.debug('%r._on_get_module(%r)', self, msg.data)
         stream = self._router.stream_by_id(msg.src_id)
-        fullname = msg.data.decode()
-        if fullname in stream.sent_modules:
+        # Requests may name several modules, separated by NUL.
+        fullnames, stream.bytecode_tag, digests = \
+            mitogen.core.parse_module_request(msg.data)
+        mitogen.parent.note_module_digests(stream, digests)
+        if len(fullnames) == 1 and fullnames[0] in stream.sent_modules:
             LOG.warning('_on_get_module(): dup request for %r from %r',
-                        fullname, stream)
+                        fullnames[0], stream)
 
-        self._send_module_and_related(stream, fullname)
+        tups = []
+        for fullname in fullnames:
+            self._add_module_and_related(stream, fullname, tups)
+        self._send_tuples(stream, tups)
 
     def _send_forward_module(self, stream, context, fullname):
         if stream.remote_id != context.context_id:
@@ -738,6 +806,7 @@ class Router(mitogen.parent.Router):
             handle=mitogen.core.DETACHING,
             persist=True,
         )
+        self._add_pickle_protocol_handler()
 
     def enable_debug(self):
         mitogen.core.enable_debug_logging()
@@ -47,6 +47,7 @@ import termios
 import textwrap
 import threading
 import time
+import weakref
 import zlib
 
 # Absolute imports for <2.5.
@@ -78,6 +79,20 @@ try:
 except:
     SC_OPEN_MAX = 1024
 
+#: If :data:`True`, :func:`create_child` and friends start children using
+#: :func:`os.posix_spawnp` where possible, rather than :class:`subprocess.Popen`
+#: with its fork() of this process. Available on Python 3.8 and above.
+USE_POSIX_SPAWN = hasattr(os, 'posix_spawnp')
+
+#: Signals reset to their default disposition in children started by
+#: :func:`posix_spawn_child`, matching `restore_signals` of
+#: :class:`subprocess.Popen`.
+SPAWN_SIGDEF = tuple(
+    getattr(signal, name)
+    for name in ('SIGPIPE', 'SIGXFZ', 'SIGXFSZ')
+    if hasattr(signal, name)
+)
+
 
 def get_log_level():
     return (LOG.level or logging.getLogger().level or logging.INFO)
@@ -92,6 +107,35 @@ def get_core_source():
     return inspect.getsource(mitogen.core)
 
 
+@lru_cache()
+def get_core_compressor():
+    """
+    Return `(prefix, compressor)`, where `prefix` is the start of a
+    :mod:`zlib` stream containing the source returned by
+    :func:`get_core_source`, and `compressor` is the compression object that
+    produced it. The stream is flushed to a byte boundary, so the preamble
+    for each new context is `prefix` followed by the output of a copy of
+    `compressor` given only that context's configuration, and compressing the
+    core source is paid once per process.
+    """
+    compressor = zlib.compressobj(9)
+    source = get_core_source().encode('utf-8')
+    prefix = compressor.compress(source) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return prefix, compressor
+
+
+@lru_cache()
+def get_first_stage_template(func):
+    """
+    Return the source of the first stage function `func` formatted for use on
+    the command line, with its `CONTEXT_NAME` and `PREAMBLE_COMPRESSED_LEN`
+    placeholders still present.
+    """
+    source = inspect.getsource(func)
+    source = textwrap.dedent('\n'.join(source.strip().split('\n')[2:]))
+    return source.replace('    ', '\t')
+
+
 def get_default_remote_name():
     """
     Return the default name appearing in argv[0] of remote machines.
@@ -113,6 +157,19 @@ def is_immediate_child(msg, stream):
     return msg.src_id == stream.remote_id
 
 
+def note_module_digests(stream, digests):
+    """
+    Record on `stream` the digests of modules its remote reported cached in a
+    :data:`mitogen.core.GET_MODULE` request. A module whose cached copy the
+    remote could not use is forgotten as having been sent, so that it is sent
+    again in full.
+    """
+    for fullname, digest in digests.items():
+        if not digest:
+            stream.sent_modules.discard(fullname)
+    stream.module_digests.update(digests)
+
+
 def flags(names):
     """Return the result of ORing a set of (space separated) :py:mod:`termios`
     module constants together."""
@@ -155,6 +212,88 @@ def close_nonstandard_fds():
             pass
 
 
+def get_inheritable_fds():
+    """
+    Return a list of file descriptors above 2 that would be inherited across
+    exec(). The list of open descriptors is read from ``/proc/self/fd`` or
+    ``/dev/fd`` where available, so cost depends on the number of open
+    descriptors rather than :data:`SC_OPEN_MAX`.
+    """
+    for path in '/proc/self/fd', '/dev/fd':
+        try:
+            fds = [int(name) for name in os.listdir(path)]
+            break
+        except OSError:
+            pass
+    else:
+        fds = xrange(3, SC_OPEN_MAX)
+
+    inheritable = []
+    for fd in fds:
+        if fd > 2:
+            try:
+                if os.get_inheritable(fd):
+                    inheritable.append(fd)
+            except OSError:
+                pass  # Descriptor used by listdir(), or closed since.
+    return inheritable
+
+
+def can_posix_spawn(fds, tty=False):
+    """
+    Return :data:`True` if :func:`posix_spawn_child` can start a child with
+    `fds` as its stdio. Descriptors already occupying a stdio slot would keep
+    their close-on-exec flag with some C libraries. Acquiring a controlling
+    TTY by opening it is Linux behaviour.
+    """
+    if not USE_POSIX_SPAWN:
+        return False
+    if tty and not sys.platform.startswith('linux'):
+        return False
+    for fd in fds:
+        if fd is not None and fd < 3:
+            return False
+    return True
+
+
+def posix_spawn_child(args, fds, tty_path=None):
+    """
+    Start a child process using :func:`os.posix_spawnp`, avoiding a fork() of
+    this process, whose cost grows with its memory size.
+
+    Descriptors are created close-on-exec by default since Python 3.4, so
+    besides `fds` only those explicitly marked inheritable must be closed.
+    They are found using :func:`get_inheritable_fds`.
+
+    :param list args:
+        Argument vector for the child.
+    :param list fds:
+        Descriptors to install as the child's stdin, stdout and stderr, or
+        :data:`None` to inherit this process's descriptor.
+    :param str tty_path:
+        If not :data:`None`, start the child in a new session, and open this
+        path as its stderr, causing it to become the controlling TTY.
+    :returns:
+        Process ID of the new child.
+    """
+    actions = [
+        (os.POSIX_SPAWN_DUP2, fd, target)
+        for target, fd in enumerate(fds)
+        if fd is not None
+    ]
+    if tty_path is not None:
+        actions.append((os.POSIX_SPAWN_OPEN, 2, tty_path, os.O_RDWR, 0))
+    actions.extend(
+        (os.POSIX_SPAWN_CLOSE, fd)
+        for fd in get_inheritable_fds()
+    )
+    return os.posix_spawnp(args[0], args, os.environ,
+        file_actions=actions,
+        setsid=tty_path is not None,
+        setsigdef=SPAWN_SIGDEF,
+    )
+
+
 def create_socketpair():
     """
     Create a :func:`socket.socketpair` to use for use as a child process's UNIX
@@ -219,19 +358,21 @@ def create_child(args, merge_stdio=False, preexec_fn=None):
     # O_NONBLOCK from Python's future stdin fd.
     mitogen.core.set_block(childfp.fileno())
 
+    fds = [childfp.fileno(), childfp.fileno(), None]
     if merge_stdio:
-        extra = {'stderr': childfp}
+        fds[2] = childfp.fileno()
+
+    if preexec_fn is None and can_posix_spawn(fds):
+        pid = posix_spawn_child(args, fds)
     else:
-        extra = {}
-
-    pid = detach_popen(
-        args=args,
-        stdin=childfp,
-        stdout=childfp,
-        close_fds=True,
-        preexec_fn=preexec_fn,
-        **extra
-    )
+        pid = detach_popen(
+            args=args,
+            stdin=fds[0],
+            stdout=fds[1],
+            stderr=fds[2],
+            close_fds=True,
+            preexec_fn=preexec_fn,
+        )
     childfp.close()
     # Decouple the socket from the lifetime of the Python socket object.
     fd = os.dup(parentfp.fileno())
@@ -273,14 +414,18 @@ def tty_create_child(args):
     disable_echo(master_fd)
     disable_echo(slave_fd)
 
-    pid = detach_popen(
-        args=args,
-        stdin=slave_fd,
-        stdout=slave_fd,
-        stderr=slave_fd,
-        preexec_fn=_acquire_controlling_tty,
-        close_fds=True,
-    )
+    if can_posix_spawn([slave_fd], tty=True):
+        pid = posix_spawn_child(args, [slave_fd, slave_fd, None],
+                                tty_path=os.ttyname(slave_fd))
+    else:
+        pid = detach_popen(
+            args=args,
+            stdin=slave_fd,
+            stdout=slave_fd,
+            stderr=slave_fd,
+            preexec_fn=_acquire_controlling_tty,
+            close_fds=True,
+        )
 
     os.close(slave_fd)
     LOG.debug('tty_create_child() child %d fd %d, parent %d, cmd: %s',
@@ -307,14 +452,18 @@ def hybrid_tty_create_child(args):
     mitogen.core.set_block(childfp)
     disable_echo(master_fd)
     disable_echo(slave_fd)
-    pid = detach_popen(
-        args=args,
-        stdin=childfp,
-        stdout=childfp,
-        stderr=slave_fd,
-        preexec_fn=_acquire_controlling_tty,
-        close_fds=True,
-    )
+    if can_posix_spawn([childfp.fileno(), slave_fd], tty=True):
+        pid = posix_spawn_child(args, [childfp.fileno(), childfp.fileno(),
+                                       None], tty_path=os.ttyname(slave_fd))
+    else:
+        pid = detach_popen(
+            args=args,
+            stdin=childfp,
+            stdout=childfp,
+            stderr=slave_fd,
+            preexec_fn=_acquire_controlling_tty,
+            close_fds=True,
+        )
 
     os.close(slave_fd)
     childfp.close()
@@ -419,8 +568,25 @@ def iter_read(fds, deadline=None):
     raise mitogen.core.TimeoutError('read timed out')
 
 
+def find_marker(tail, buf, s):
+    """
+    Search for the marker `s` in `buf`, including any occurrence split between
+    the end of the previous read and the start of this one.
+
+    :param bytes tail:
+        Value returned by the previous call, or the empty string.
+    :returns:
+        `(found, tail)`, where `tail` holds the last ``len(s) - 1`` bytes of
+        the data searched, to pass to the next call.
+    """
+    data = tail + buf
+    if s in data:
+        return True, b('')
+    return False, data[max(0, len(data) - len(s) + 1):]
+
+
 def discard_until(fd, s, deadline):
-    """Read chunks from `fd` until one is encountered that ends with `s`. This
+    """Read chunks from `fd` until one is encountered that contains `s`. This
     is used to skip output produced by ``/etc/profile``, ``/etc/motd`` and
     mandatory SSH banners while waiting for :attr:`Stream.EC0_MARKER` to
     appear, indicating the first stage is ready to receive the compressed
@@ -438,11 +604,13 @@ def discard_until(fd, s, deadline):
     :raises mitogen.core.StreamError:
         Attempt to read past end of file.
     """
+    tail = b('')
     for buf in iter_read([fd], deadline):
         if IOLOG.level == logging.DEBUG:
             for line in buf.splitlines():
                 IOLOG.debug('discard_until: discarding %r', line)
-        if buf.endswith(s):
+        found, tail = find_marker(tail, buf, s)
+        if found:
             return
 
 
@@ -488,7 +656,7 @@ def upgrade_router(econtext):
         )
 
 
-def make_call_msg(fn, *args, **kwargs):
+def _make_call_msg(fn, args, kwargs, protocol=2):
     if inspect.ismethod(fn) and inspect.isclass(fn.__self__):
         klass = mitogen.core.to_text(fn.__self__.__name__)
     else:
@@ -501,7 +669,12 @@ def make_call_msg(fn, *args, **kwargs):
         args,
         mitogen.core.Kwargs(kwargs)
     )
-    return mitogen.core.Message.pickled(tup, handle=mitogen.core.CALL_FUNCTION)
+    return mitogen.core.Message.pickled(tup, protocol=protocol,
+                                        handle=mitogen.core.CALL_FUNCTION)
+
+
+def make_call_msg(fn, *args, **kwargs):
+    return _make_call_msg(fn, args, kwargs)
 
 
 def stream_by_method_name(name):
@@ -752,6 +925,149 @@ class EpollPoller(mitogen.core.Poller):
                 yield self._wfds[fd]
 
 
+class EdgeEpollPoller(EpollPoller):
+    """
+    Edge-triggered variant of :class:`EpollPoller`. Each descriptor is
+    registered once, after which interest in it is tracked in user space, so
+    :meth:`start_transmit` and :meth:`stop_transmit` no longer cost an
+    :func:`epoll_ctl` call each. Registrations are only extended, when a
+    descriptor is first used in a new direction.
+
+    Readiness reported by the kernel is remembered until
+    :attr:`mitogen.core.Side.would_block` shows a wake exhausted the buffer.
+    Writeable descriptors are woken again without a system call for as long
+    as the stream has output. Since a further read may block, readable
+    descriptors whose buffer was not exhausted are instead re-armed, causing
+    the kernel to report them again if input remains.
+
+    Data registered with this poller should be `(side, func)` tuples as used
+    by :class:`mitogen.core.Broker`. Descriptors registered with any other
+    data are unregistered when idle and re-armed after every wake, behaving
+    like :class:`EpollPoller`.
+    """
+    _repr = 'EdgeEpollPoller()'
+
+    _outmask = (getattr(select, 'EPOLLOUT', 0) |
+                getattr(select, 'EPOLLERR', 0))
+
+    def __init__(self):
+        super(EdgeEpollPoller, self).__init__()
+        #: Mapping of registered fd -> registered direction mask.
+        self._masks = {}
+        #: Mapping of registered fd -> weakref to the Side it was registered
+        #: for, or :data:`None`. Idle registrations are retained, so this
+        #: detects the descriptor number being reused after it was closed.
+        self._sides = {}
+        self._rready = set()
+        self._wready = set()
+
+    def _side(self, data):
+        if type(data) is tuple:
+            return data[0]
+
+    def _registered_side(self, fd):
+        ref = self._sides.get(fd)
+        return ref and ref()
+
+    def _forget(self, fd):
+        try:
+            self._epoll.unregister(fd)
+        except (IOError, OSError):
+            pass  # Already closed, or replaced by a new file.
+        del self._masks[fd]
+        del self._sides[fd]
+        self._rready.discard(fd)
+        self._wready.discard(fd)
+
+    def _control(self, fd):
+        mitogen.core._vv and IOLOG.debug('%r._control(%r)', self, fd)
+        want = (((fd in self._rfds) and select.EPOLLIN) |
+                ((fd in self._wfds) and select.EPOLLOUT))
+        if not want:
+            if fd in self._masks and self._sides[fd] is None:
+                self._forget(fd)
+            return
+
+        data = self._rfds.get(fd) or self._wfds[fd]
+        side = self._side(data)
+        if fd in self._masks and (self._registered_side(fd) is not side or
+                                  (side and side.closed)):
+            self._forget(fd)
+
+        mask = self._masks.get(fd)
+        if mask is None:
+            self._epoll.register(fd, want | select.EPOLLET)
+            self._masks[fd] = want
+            self._sides[fd] = side and weakref.ref(side)
+        elif want & ~mask:
+            # Also re-arms the descriptor, reporting any current readiness.
+            self._epoll.modify(fd, mask | want | select.EPOLLET)
+            self._masks[fd] = mask | want
+
+    def _rearm(self, fd):
+        mask = self._masks.get(fd)
+        if mask is not None:
+            self._epoll.modify(fd, mask | select.EPOLLET)
+
+    def start_receive(self, fd, data=None):
+        # Read edges are discarded while nobody is listening for them.
+        rearm = (fd not in self._rfds and
+                 self._masks.get(fd, 0) & select.EPOLLIN)
+        super(EdgeEpollPoller, self).start_receive(fd, data)
+        if rearm:
+            self._rearm(fd)
+
+    def _writeable(self):
+        wready = self._wready
+        return [fd for fd in self._wfds if fd in wready]
+
+    def poll(self, timeout=None):
+        the_timeout = -1
+        if timeout is not None:
+            the_timeout = timeout
+        rready = self._rready
+        writeable = self._writeable()
+        if rready or writeable:
+            the_timeout = 0
+
+        events, _ = mitogen.core.io_op(self._epoll.poll, the_timeout, 32)
+        for fd, event in events:
+            if event & self._inmask:
+                rready.add(fd)
+            if event & self._outmask:
+                self._wready.add(fd)
+                if fd in self._wfds and fd not in writeable:
+                    writeable.append(fd)
+
+        while rready:
+            fd = rready.pop()
+            data = self._rfds.get(fd)
+            if data is None:
+                continue
+            side = self._side(data)
+            if side:
+                side.would_block = False
+            mitogen.core._vv and IOLOG.debug('%r: POLLIN: %r', self, fd)
+            yield data
+            if not (side and side.would_block):
+                self._rearm(fd)
+
+        for fd in writeable:
+            data = self._wfds.get(fd)
+            if data is None:
+                continue
+            side = self._side(data)
+            if side:
+                side.would_block = False
+            mitogen.core._vv and IOLOG.debug('%r: POLLOUT: %r', self, fd)
+            yield data
+            if not side:
+                self._wready.discard(fd)
+                self._rearm(fd)
+            elif side.would_block:
+                self._wready.discard(fd)
+
+
 POLLER_BY_SYSNAME = {
     'Darwin': KqueuePoller,
     'FreeBSD': KqueuePoller,
@@ -760,7 +1076,7 @@ POLLER_BY_SYSNAME = {
 
 PREFERRED_POLLER = POLLER_BY_SYSNAME.get(
     os.uname()[0],
-    mitogen.core.Poller,
+    mitogen.core.DEFAULT_POLLER,
 )
 
 # For apps that start threads dynamically, it's possible Latch will also get
@@ -837,6 +1153,21 @@ class Stream(mitogen.core.Stream):
     #: ExternalContext.main().
     max_message_size = None
 
+    #: If not :data:`None`, directory in the new context in which to cache
+    #: modules received from this one. See :class:`mitogen.core.ModuleCache`.
+    module_cache_dir = None
+
+    #: Upper bound in bytes on the size of :attr:`module_cache_dir`, or
+    #: :data:`None` for :attr:`mitogen.core.ModuleCache.max_bytes`.
+    module_cache_size = None
+
+    #: If :data:`True`, write the preamble as soon as the child is started,
+    #: rather than waiting for the first stage to announce it is ready using
+    #: :attr:`EC0_MARKER`, saving one round-trip. The preamble waits in the
+    #: child's stdin until the first stage reads it, so this is unsafe when
+    #: anything else may read stdin first.
+    pipelined = False
+
     def __init__(self, *args, **kwargs):
         super(Stream, self).__init__(*args, **kwargs)
         self.sent_modules = set(['mitogen', 'mitogen.core'])
@@ -846,11 +1177,24 @@ class Stream(mitogen.core.Stream):
 
     def construct(self, max_message_size, remote_name=None, python_path=None,
                   debug=False, connect_timeout=None, profiling=False,
-                  unidirectional=False, old_router=None, **kwargs):
+                  unidirectional=False, old_router=None,
+                  compression_level=None, compression_threshold=None,
+                  module_cache_dir=None, module_cache_size=None,
+                  pipelined=None, **kwargs):
         """Get the named context running on the local machine, creating it if
         it does not exist."""
         super(Stream, self).construct(**kwargs)
         self.max_message_size = max_message_size
+        if compression_level is not None:
+            self.compression_level = compression_level
+        if compression_threshold is not None:
+            self.compression_threshold = compression_threshold
+        if module_cache_dir is not None:
+            self.module_cache_dir = module_cache_dir
+        if module_cache_size is not None:
+            self.module_cache_size = module_cache_size
+        if pipelined is not None:
+            self.pipelined = pipelined
         if python_path:
             self.python_path = python_path
         if connect_timeout:
@@ -986,9 +1330,7 @@ class Stream(mitogen.core.Stream):
         return [self.python_path]
 
     def get_boot_command(self):
-        source = inspect.getsource(self._first_stage)
-        source = textwrap.dedent('\n'.join(source.strip().split('\n')[2:]))
-        source = source.replace('    ', '\t')
+        source = get_first_stage_template(self._first_stage)
         source = source.replace('CONTEXT_NAME', self.remote_name)
         preamble_compressed = self.get_preamble()
         source = source.replace('PREAMBLE_COMPRESSED_LEN',
@@ -1021,14 +1363,35 @@ class Stream(mitogen.core.Stream):
             'blacklist': self._router.get_module_blacklist(),
             'max_message_size': self.max_message_size,
             'version': mitogen.__version__,
+            'pickle_protocol': mitogen.core.pickle.HIGHEST_PROTOCOL,
+            'compression_level': self.compression_level,
+            'compression_threshold': self.compression_threshold,
+            'module_cache_dir': self.module_cache_dir,
+            'module_cache_size': self.module_cache_size,
         }
 
+    #: Cached by :meth:`get_preamble`, which is called once to build the boot
+    #: command, and again to send the preamble.
+    _preamble = None
+
     def get_preamble(self):
-        source = get_core_source()
-        source += '\nExternalContext(%r).main()\n' % (
-            self.get_econtext_config(),
-        )
-        return zlib.compress(source.encode('utf-8'), 9)
+        if self._preamble is None:
+            trailer = '\nExternalContext(%r).main()\n' % (
+                self.get_econtext_config(),
+            )
+            prefix, compressor = get_core_compressor()
+            if hasattr(compressor, 'copy'):
+                compressor = compressor.copy()
+                self._preamble = (
+                    prefix +
+                    compressor.compress(trailer.encode('utf-8')) +
+                    compressor.flush()
+                )
+            else:
+                # Python 2.4 cannot copy compression objects.
+                source = get_core_source() + trailer
+                self._preamble = zlib.compress(source.encode('utf-8'), 9)
+        return self._preamble
 
     create_child = staticmethod(create_child)
     create_child_args = {}
@@ -1053,6 +1416,9 @@ class Stream(mitogen.core.Stream):
                   self, self.receive_side.fd)
 
         try:
+            if self.pipelined:
+                write_all(self.transmit_side.fd, self.get_preamble(),
+                          self.connect_deadline)
             self._connect_bootstrap(extra_fd)
         except Exception:
             self._reap_child()
@@ -1064,16 +1430,44 @@ class Stream(mitogen.core.Stream):
     EC0_MARKER = mitogen.core.b('MITO000\n')
     EC1_MARKER = mitogen.core.b('MITO001\n')
 
+    #: Unmatched end of the data last passed to
+    #: :meth:`_bootstrap_marker_received`, in case a marker is split across
+    #: reads.
+    _bootstrap_tail = mitogen.core.b('')
+
     def _ec0_received(self):
         LOG.debug('%r._ec0_received()', self)
         write_all(self.transmit_side.fd, self.get_preamble())
         discard_until(self.receive_side.fd, self.EC1_MARKER,
                       self.connect_deadline)
 
+    def _bootstrap_marker_received(self, buf):
+        """
+        Inspect `buf` read from the child by :meth:`_connect_bootstrap`,
+        returning :data:`True` once the child has received the preamble. When
+        :attr:`pipelined`, the preamble was already sent, so the first stage
+        follows :attr:`EC0_MARKER` with :attr:`EC1_MARKER` unprompted, and the
+        two may arrive together. Markers split across reads, or followed by
+        further output, are found.
+        """
+        if self.pipelined:
+            found, self._bootstrap_tail = find_marker(
+                self._bootstrap_tail, buf, self.EC1_MARKER)
+            return found
+        found, self._bootstrap_tail = find_marker(
+            self._bootstrap_tail, buf, self.EC0_MARKER)
+        if found:
+            self._ec0_received()
+        return found
+
     def _connect_bootstrap(self, extra_fd):
-        discard_until(self.receive_side.fd, self.EC0_MARKER,
-                      self.connect_deadline)
-        self._ec0_received()
+        if self.pipelined:
+            discard_until(self.receive_side.fd, self.EC1_MARKER,
+                          self.connect_deadline)
+        else:
+            discard_until(self.receive_side.fd, self.EC0_MARKER,
+                          self.connect_deadline)
+            self._ec0_received()
 
 
 class ChildIdAllocator(object):
@@ -1110,9 +1504,15 @@ class Context(mitogen.core.Context):
     def __hash__(self):
         return hash((self.router, self.context_id))
 
+    def _make_call_msg(self, fn, args, kwargs):
+        return _make_call_msg(
+            fn, args, kwargs,
+            protocol=self.router.get_pickle_protocol(self.context_id),
+        )
+
     def call_async(self, fn, *args, **kwargs):
         LOG.debug('%r.call_async(): %r', self, CallSpec(fn, args, kwargs))
-        return self.send_async(make_call_msg(fn, *args, **kwargs))
+        return self.send_async(self._make_call_msg(fn, args, kwargs))
 
     def call(self, fn, *args, **kwargs):
         receiver = self.call_async(fn, *args, **kwargs)
@@ -1121,7 +1521,7 @@ class Context(mitogen.core.Context):
     def call_no_reply(self, fn, *args, **kwargs):
         LOG.debug('%r.call_no_reply(%r, *%r, **%r)',
                   self, fn, args, kwargs)
-        self.send(make_call_msg(fn, *args, **kwargs))
+        self.send(self._make_call_msg(fn, args, kwargs))
 
     def shutdown(self, wait=False):
         LOG.debug('%r.shutdown() sending SHUTDOWN', self)
@@ -1265,6 +1665,15 @@ class Router(mitogen.core.Router):
             handle=mitogen.core.DETACHING,
             persist=True,
         )
+        self._add_pickle_protocol_handler()
+
+    def _add_pickle_protocol_handler(self):
+        self.add_handler(
+            fn=self._on_pickle_protocol,
+            handle=mitogen.core.PICKLE_PROTOCOL,
+            persist=True,
+            policy=is_immediate_child,
+        )
 
     def _on_detaching(self, msg):
         if msg.is_dead:
@@ -1277,20 +1686,30 @@ class Router(mitogen.core.Router):
         stream.detached = True
         msg.reply(None)
 
+    def _on_pickle_protocol(self, msg):
+        if msg.is_dead:
+            return
+        stream = self.stream_by_id(msg.src_id)
+        try:
+            protocol = int(msg.data)
+        except ValueError:
+            LOG.warning('bad PICKLE_PROTOCOL received on %r: %r', stream, msg)
+            return
+        stream.pickle_protocol = min(protocol,
+                                     mitogen.core.pickle.HIGHEST_PROTOCOL)
+        LOG.debug('%r: using pickle protocol %d', stream,
+                  stream.pickle_protocol)
+
     def add_route(self, target_id, stream):
         LOG.debug('%r.add_route(%r, %r)', self, target_id, stream)
         assert isinstance(target_id, int)
         assert isinstance(stream, Stream)
-        try:
-            self._stream_by_id[target_id] = stream
-        except KeyError:
-            LOG.error('%r: cant add route to %r via %r: no such stream',
-                      self, target_id, stream)
+        self._add_route(target_id, stream)
 
     def del_route(self, target_id):
         LOG.debug('%r.del_route(%r)', self, target_id)
         try:
-            del self._stream_by_id[target_id]
+            self._del_route(target_id)
         except KeyError:
             LOG.error('%r: cant delete route to %r: no such stream',
                       self, target_id)
@@ -1347,6 +1766,73 @@ class Router(mitogen.core.Router):
             return self.proxy_connect(via, method_name, name=name, **kwargs)
         return self._connect(klass, name=name, **kwargs)
 
+    def _connect_many_main(self, latch):
+        while True:
+            try:
+                (method_name, kwargs), recv = latch.get(block=False)
+            except mitogen.core.TimeoutError:
+                try:
+                    mitogen.core.unlisten(self.broker, 'shutdown', latch.close)
+                except ValueError:
+                    pass  # Another thread found the batch drained first.
+                return
+            except mitogen.core.LatchError:
+                return  # Broker shut down, receivers were sent dead messages.
+
+            try:
+                obj = self.connect(method_name, **kwargs)
+            except Exception:
+                obj = mitogen.core.CallError(sys.exc_info()[1])
+            self.route(mitogen.core.Message.pickled(
+                obj,
+                dst_id=mitogen.context_id,
+                handle=recv.handle,
+                router=self,
+            ))
+
+    def connect_many(self, specs, max_parallel=8):
+        """
+        Start connecting every context described by `specs`, running up to
+        `max_parallel` connections at a time on a private pool of threads.
+
+        :param list specs:
+            Sequence of `(method_name, kwargs)` tuples, as would be passed to
+            :meth:`connect`.
+        :param int max_parallel:
+            Maximum number of connections in progress at once.
+        :returns:
+            List of :class:`mitogen.core.Receiver`, one per spec in the same
+            order, each receiving a single message: the connected
+            :class:`mitogen.parent.Context`, or
+            :class:`mitogen.core.CallError` describing why that connection
+            failed. Failures do not affect other connections. Connections not
+            yet started when the broker shuts down are abandoned.
+        """
+        if max_parallel < 1:
+            raise ValueError('max_parallel must be at least 1')
+
+        if not specs:
+            return []
+
+        latch = mitogen.core.Latch()
+        recvs = []
+        for spec in specs:
+            recv = mitogen.core.Receiver(self)
+            latch.put((spec, recv))
+            recvs.append(recv)
+        mitogen.core.listen(self.broker, 'shutdown', latch.close)
+
+        for x in range(min(max_parallel, len(recvs))):
+            name = 'mitogen.parent.Router.%x.connector-%d' % (id(self), x)
+            thread = threading.Thread(
+                name=name,
+                target=mitogen.core._profile_hook,
+                args=(name, self._connect_many_main, latch),
+            )
+            thread.setDaemon(True)
+            thread.start()
+        return recvs
+
     def proxy_connect(self, via_context, method_name, name=None, **kwargs):
         resp = via_context.call(_proxy_connect,
             name=name,
@@ -1430,6 +1916,8 @@ class ModuleForwarder(object):
         self.router = router
         self.parent_context = parent_context
         self.importer = importer
+        self._digest_cache = {}  # fullname -> digest
+        mitogen.core._import_sha1()
         router.add_handler(
             fn=self._on_forward_module,
             handle=mitogen.core.FORWARD_MODULE,
@@ -1446,6 +1934,11 @@ class ModuleForwarder(object):
     def __repr__(self):
         return 'ModuleForwarder(%r)' % (self.router,)
 
+    def _get_digest(self, tup):
+        if tup[0] not in self._digest_cache:
+            self._digest_cache[tup[0]] = mitogen.core.module_digest(tup[3])
+        return self._digest_cache[tup[0]]
+
     def _on_forward_module(self, msg):
         if msg.is_dead:
             return
@@ -1479,42 +1972,59 @@ class ModuleForwarder(object):
         if msg.is_dead:
             return
 
-        fullname = msg.data.decode('utf-8')
-        callback = lambda: self._on_cache_callback(msg, fullname)
-        self.importer._request_module(fullname, callback)
-
-    def _send_one_module(self, msg, tup):
-        self.router._async_route(
-            mitogen.core.Message.pickled(
-                tup,
-                dst_id=msg.src_id,
-                handle=mitogen.core.LOAD_MODULE,
-            )
-        )
-
-    def _on_cache_callback(self, msg, fullname):
-        LOG.debug('%r._on_get_module(): sending %r', self, fullname)
+        # Requests may name several modules, separated by NUL. They are
+        # requested upstream together, and answered with one bundle.
         stream = self.router.stream_by_id(msg.src_id)
-        self._send_module_and_related(stream, fullname)
+        fullnames, stream.bytecode_tag, digests = \
+            mitogen.core.parse_module_request(msg.data)
+        note_module_digests(stream, digests)
+        callback = lambda: self._on_cache_callback(msg, fullnames)
+        self.importer._request_modules(fullnames, callback)
+
+    def _on_cache_callback(self, msg, fullnames):
+        LOG.debug('%r._on_get_module(): sending %r', self, fullnames)
+        stream = self.router.stream_by_id(msg.src_id)
+        tups = []
+        for fullname in fullnames:
+            self._add_module_and_related(stream, fullname, tups)
+        self._send_tuples(stream, tups)
 
     def _send_module_and_related(self, stream, fullname):
+        tups = []
+        self._add_module_and_related(stream, fullname, tups)
+        self._send_tuples(stream, tups)
+
+    def _add_module_and_related(self, stream, fullname, tups):
         tup = self.importer._cache[fullname]
-        for related in tup[4]:
+        for related in tup[4] or ():
             rtup = self.importer._cache.get(related)
             if rtup:
-                self._send_one_module(stream, rtup)
+                self._add_one_module(stream, rtup, tups)
             else:
-                LOG.debug('%r._send_module_and_related(%r): absent: %r',
+                LOG.debug('%r._add_module_and_related(%r): absent: %r',
                            self, fullname, related)
 
-        self._send_one_module(stream, tup)
+        self._add_one_module(stream, tup, tups)
 
-    def _send_one_module(self, stream, tup):
+    def _add_one_module(self, stream, tup, tups):
         if tup[0] not in stream.sent_modules:
             stream.sent_modules.add(tup[0])
+            digest = stream.module_digests.get(tup[0])
+            if (digest and tup[3] is not None and
+                    digest == self._get_digest(tup)):
+                # Omit the source, the child will use its cached copy.
+                tup = tup[:3] + (None,) + tup[4:5]
+            elif len(tup) > 5 and tup[5][0] != stream.bytecode_tag:
+                # Compiled for our interpreter, but not the child's.
+                tup = tup[:5]
+            tups.append(tup)
+
+    def _send_tuples(self, stream, tups):
+        if tups:
             self.router._async_route(
                 mitogen.core.Message.pickled(
-                    tup,
+                    tups[0] if len(tups) == 1 else tups,
+                    protocol=stream.pickle_protocol,
                     dst_id=stream.remote_id,
                     handle=mitogen.core.LOAD_MODULE,
                 )
@@ -26,6 +26,8 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import sys
+
 import mitogen.core
 
 
@@ -36,6 +38,10 @@ class Error(mitogen.core.Error):
 class Select(object):
     notify = None
 
+    #: :class:`mitogen.core.ChannelError` to be raised by the next call to
+    #: :meth:`get_many`, after messages already collected were returned.
+    _pending_error = None
+
     @classmethod
     def all(cls, receivers):
         return list(msg.unpickle() for msg in cls(receivers))
@@ -131,3 +137,78 @@ class Select(object):
                 # thread drained it between add() calling recv.empty() and
                 # self._put(). In this case just sleep again.
                 continue
+
+    def get_many(self, max_items=None, timeout=None, block=True):
+        """
+        Like :meth:`get`, but return a list of messages from up to
+        `max_items` notifications, using one :meth:`Latch.get_many
+        <mitogen.core.Latch.get_many>` call, and one
+        :meth:`Receiver.get_many <mitogen.core.Receiver.get_many>` call per
+        receiver that has messages ready.
+        """
+        if self._pending_error:
+            e, self._pending_error = self._pending_error, None
+            raise e
+        if not self._receivers:
+            raise Error(self.empty_msg)
+
+        while True:
+            recvs = self._latch.get_many(max_items, timeout=timeout,
+                                         block=block)
+            counts = {}
+            order = []
+            for recv in recvs:
+                if recv not in counts:
+                    counts[recv] = 0
+                    order.append(recv)
+                counts[recv] += 1
+
+            msgs = []
+            unused = counts.copy()
+            for recv in order:
+                count = counts[recv]
+                if self._oneshot:
+                    count = 1
+                try:
+                    batch = recv.get_many(count, block=False)
+                except mitogen.core.TimeoutError:
+                    unused[recv] = 0
+                    continue  # See get().
+                except mitogen.core.ChannelError:
+                    # Requeue notifications not yet consumed, and if messages
+                    # were already taken, return them and report the error by
+                    # the next call. Only the dead message was consumed.
+                    unused[recv] -= 1
+                    self._requeue(recvs, unused)
+                    if not msgs:
+                        raise
+                    self._pending_error = sys.exc_info()[1]
+                    return msgs
+
+                if self._oneshot:
+                    self.remove(recv)
+                    unused[recv] = 0
+                else:
+                    # Fewer are returned when a dead message ends the batch.
+                    unused[recv] -= len(batch)
+                for msg in batch:
+                    msg.receiver = recv
+                msgs.extend(batch)
+
+            self._requeue(recvs, unused)
+            if msgs:
+                return msgs
+
+    def _requeue(self, recvs, unused):
+        """
+        Return the last `unused[recv]` notifications for each receiver in
+        `recvs` to the head of the latch, in their original order.
+        """
+        objs = []
+        for recv in reversed(recvs):
+            if unused[recv]:
+                unused[recv] -= 1
+                objs.append(recv)
+        if objs:
+            objs.reverse()
+            self._latch.requeue(objs)
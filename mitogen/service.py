@@ -26,6 +26,7 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import collections
 import grp
 import os
 import os.path
@@ -426,6 +427,12 @@ class Pool(object):
     """
     activator_class = Activator
 
+    #: Maximum number of messages a worker removes from the select at once.
+    #: Messages beyond the first are placed in a backlog shared by all
+    #: workers, so a service method that blocks never delays messages taken
+    #: in the same batch.
+    batch_size = 16
+
     def __init__(self, router, services, size=1):
         self.router = router
         self._activator = self.activator_class()
@@ -434,11 +441,29 @@ class Pool(object):
             handle=mitogen.core.CALL_SERVICE,
         )
 
+        #: Accepts only messages routed from this process, never from the
+        #: network. Routing a message to it wakes an idle worker to process
+        #: the backlog.
+        self._handoff = mitogen.core.Receiver(
+            router=router,
+            policy=lambda msg, stream: stream is None,
+        )
+
         self._select = mitogen.select.Select(oneshot=False)
         self._select.add(self._receiver)
+        self._select.add(self._handoff)
         #: Serialize service construction.
         self._lock = threading.Lock()
-        self._func_by_recv = {self._receiver: self._on_service_call}
+        #: Protects :attr:`_backlog` and :attr:`_idle`.
+        self._backlog_lock = threading.Lock()
+        #: Messages taken from the select but not yet claimed by a worker.
+        self._backlog = collections.deque()
+        #: Count of workers sleeping on the select.
+        self._idle = 0
+        self._func_by_recv = {
+            self._receiver: self._on_service_call,
+            self._handoff: self._on_handoff,
+        }
         self._invoker_by_name = {}
 
         for service in services:
@@ -474,6 +499,7 @@ class Pool(object):
     def stop(self, join=True):
         self.closed = True
         self._select.close()
+        self._handoff.close()
         if join:
             self.join()
 
@@ -527,20 +553,69 @@ class Pool(object):
             e = sys.exc_info()[1]
             msg.reply(mitogen.core.CallError(e))
 
+    def _pop_backlog(self, idle):
+        """
+        Return the oldest message from the backlog, or :data:`None` if it is
+        empty. If `idle` is :data:`True` and no message is available, the
+        calling worker is counted as idle until :meth:`_extend_backlog`.
+        """
+        self._backlog_lock.acquire()
+        try:
+            if self._backlog:
+                return self._backlog.popleft()
+            if idle:
+                self._idle += 1
+        finally:
+            self._backlog_lock.release()
+
+    def _extend_backlog(self, msgs):
+        """
+        Stop counting the calling worker as idle, and add `msgs` to the
+        backlog, waking one idle worker for each message while any remain.
+        """
+        self._backlog_lock.acquire()
+        try:
+            self._idle -= 1
+            self._backlog.extend(msgs)
+            wake = min(self._idle, len(msgs))
+        finally:
+            self._backlog_lock.release()
+
+        for x in range(wake):
+            self.router.route(
+                mitogen.core.Message(
+                    dst_id=mitogen.context_id,
+                    handle=self._handoff.handle,
+                )
+            )
+
+    def _on_handoff(self, recv, msg):
+        msg = self._pop_backlog(idle=False)
+        if msg is not None:
+            self._dispatch(msg)
+
+    def _dispatch(self, msg):
+        func = self._func_by_recv[msg.receiver]
+        try:
+            func(msg.receiver, msg)
+        except Exception:
+            LOG.exception('While handling %r using %r', msg, func)
+
     def _worker_run(self):
         while not self.closed:
-            try:
-                msg = self._select.get()
-            except (mitogen.core.ChannelError, mitogen.core.LatchError):
-                e = sys.exc_info()[1]
-                LOG.info('%r: channel or latch closed, exitting: %s', self, e)
-                return
-
-            func = self._func_by_recv[msg.receiver]
-            try:
-                func(msg.receiver, msg)
-            except Exception:
-                LOG.exception('While handling %r using %r', msg, func)
+            msg = self._pop_backlog(idle=True)
+            if msg is None:
+                try:
+                    msgs = self._select.get_many(self.batch_size)
+                except (mitogen.core.ChannelError, mitogen.core.LatchError):
+                    e = sys.exc_info()[1]
+                    LOG.info('%r: channel or latch closed, exitting: %s',
+                             self, e)
+                    return
+                self._extend_backlog(msgs[1:])
+                msg = msgs[0]
+
+            self._dispatch(msg)
 
     def _worker_main(self):
         try:
@@ -580,6 +655,11 @@ class PushFileService(Service):
     """
     invoker_class = SerializedInvoker
 
+    #: Seconds :meth:`_forward` waits for a congested stream to drain before
+    #: queueing the file regardless. Methods run one at a time, so this
+    #: bounds how long one slow child delays forwarding to every other.
+    forward_timeout = 1.0
+
     def __init__(self, **kwargs):
         super(PushFileService, self).__init__(**kwargs)
         self._lock = threading.Lock()
@@ -604,24 +684,33 @@ class PushFileService(Service):
         return self._cache[path]
 
     def _forward(self, context, path):
+        """
+        Send `path` towards `context` via the next hop. Called without locks
+        held, so the calling thread may block for up to
+        :attr:`forward_timeout` while the stream is congested, rather than
+        queueing whole files without bound.
+        """
         stream = self.router.stream_by_id(context.context_id)
         child = mitogen.core.Context(self.router, stream.remote_id)
         sent = self._sent_by_stream.setdefault(stream, set())
         if path in sent and child.context_id != context.context_id:
-            child.call_service_async(
-                service_name=self.name(),
-                method_name='forward',
-                path=path,
-                context=context
-            ).close()
+            msg = child._make_service_msg(self.name(), 'forward', {
+                'path': path,
+                'context': context,
+            })
         else:
-            child.call_service_async(
-                service_name=self.name(),
-                method_name='store_and_forward',
-                path=path,
-                data=self._cache[path],
-                context=context
-            ).close()
+            msg = child._make_service_msg(self.name(), 'store_and_forward', {
+                'path': path,
+                'data': self._cache[path],
+                'context': context,
+            })
+        try:
+            child.send(msg, block=True, timeout=self.forward_timeout)
+        except mitogen.core.TimeoutError:
+            LOG.warning('%r: %r still congested after %.1f seconds, '
+                        'queueing %r anyway', self, stream,
+                        self.forward_timeout, path)
+            child.send(msg)
 
     @expose(policy=AllowParents())
     @arg_spec({
@@ -689,7 +778,7 @@ class PushFileService(Service):
         if path not in self._cache:
             LOG.error('%r: %r is not in local cache', self, path)
             return
-        self._forward(path, context)
+        self._forward(context, path)
 
 
 class FileService(Service):
@@ -899,8 +988,8 @@ class FileService(Service):
     def acknowledge(self, size, msg):
         """
         Acknowledge bytes received by a transfer target, scheduling new chunks
-        to keep the window full. This should be called for every chunk received
-        by the target.
+        to keep the window full. This should be called for every chunk, or batch
+        of chunks, received by the target.
         """
         stream = self.router.stream_by_id(msg.src_id)
         state = self._state_by_stream[stream]
@@ -941,15 +1030,30 @@ class FileService(Service):
             sender=recv.to_sender(),
         )
 
-        for chunk in recv:
-            s = chunk.unpickle()
-            LOG.debug('get_file(%r): received %d bytes', path, len(s))
-            context.call_service_async(
-                service_name=cls.name(),
-                method_name='acknowledge',
-                size=len(s),
-            ).close()
-            out_fp.write(s)
+        done = False
+        while not done:
+            # Drain every chunk that arrived while the last batch was being
+            # written, acknowledging them with a single message.
+            chunks = []
+            for msg in recv.get_many(throw_dead=False):
+                if msg.is_dead:
+                    done = True
+                    break
+                chunks.append(msg.unpickle())
+
+            size = sum(len(s) for s in chunks)
+            if not size:
+                continue
+            LOG.debug('get_file(%r): received %d bytes', path, size)
+            # Sent in the priority lane, so the window is reopened without
+            # waiting for bulk traffic queued towards the source.
+            context.send(
+                context._make_service_msg(cls.name(), u'acknowledge',
+                                          {'size': size}),
+                priority=True,
+            )
+            for s in chunks:
+                out_fp.write(s)
 
         ok = out_fp.tell() == metadata['size']
         if not ok:
@@ -140,7 +140,7 @@ class Stream(mitogen.parent.Stream):
 
     def construct(self, hostname, username=None, ssh_path=None, port=None,
                   check_host_keys='enforce', password=None, identity_file=None,
-                  compression=True, ssh_args=None, keepalive_enabled=True,
+                  compression=None, ssh_args=None, keepalive_enabled=True,
                   keepalive_count=3, keepalive_interval=15,
                   identities_only=True, ssh_debug_level=None, **kwargs):
         super(Stream, self).construct(**kwargs)
@@ -154,6 +154,9 @@ class Stream(mitogen.parent.Stream):
         self.password = password
         self.identity_file = identity_file
         self.identities_only = identities_only
+        if compression is None:
+            # Avoid compressing twice when messages are already compressed.
+            compression = not self.compression_level
         self.compression = compression
         self.keepalive_enabled = keepalive_enabled
         self.keepalive_count = keepalive_count
@@ -251,9 +254,8 @@ class Stream(mitogen.parent.Stream):
 
         for buf, partial in filter_debug(self, it):
             LOG.debug('%r: received %r', self, buf)
-            if buf.endswith(self.EC0_MARKER):
+            if self._bootstrap_marker_received(buf):
                 self._router.broker.start_receive(self.tty_stream)
-                self._ec0_received()
                 return
             elif HOSTKEY_REQ_PROMPT in buf.lower():
                 self._host_key_prompt()
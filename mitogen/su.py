@@ -65,6 +65,9 @@ class Stream(mitogen.parent.Stream):
     def construct(self, username=None, password=None, su_path=None,
                   password_prompt=None, incorrect_prompts=None, **kwargs):
         super(Stream, self).construct(**kwargs)
+        if self.pipelined:
+            # The preamble would be read by su as the password.
+            raise ValueError('su does not support pipelined=True')
         if username is not None:
             self.username = username
         if password is not None:
@@ -99,8 +102,7 @@ class Stream(mitogen.parent.Stream):
 
         for buf in it:
             LOG.debug('%r: received %r', self, buf)
-            if buf.endswith(self.EC0_MARKER):
-                self._ec0_received()
+            if self._bootstrap_marker_received(buf):
                 return
             if any(s in buf.lower() for s in self.incorrect_prompts):
                 if password_sent:
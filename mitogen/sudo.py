@@ -175,8 +175,7 @@ class Stream(mitogen.parent.Stream):
 
         for buf in it:
             LOG.debug('%r: received %r', self, buf)
-            if buf.endswith(self.EC0_MARKER):
-                self._ec0_received()
+            if self._bootstrap_marker_received(buf):
                 return
             elif PASSWORD_PROMPT in buf.lower():
                 if self.password is None:
@@ -0,0 +1,56 @@
+"""
+Measure time to start a local context and import a set of large modules in
+it, with and without the master shipping precompiled bytecode alongside
+module source.
+
+    bytecode.py [count]
+"""
+
+import sys
+import time
+
+import mitogen
+import mitogen.master
+
+MODULES = [
+    'mitogen.parent',
+    'mitogen.master',
+    'mitogen.service',
+    'mitogen.select',
+    'mitogen.ssh',
+    'mitogen.sudo',
+    'mitogen.fork',
+    'mitogen.utils',
+]
+
+
+def do_import(names):
+    t0 = time.time()
+    for name in names:
+        __import__(name)
+    return time.time() - t0
+
+
+def run(router, ship_bytecode, count):
+    router.responder.ship_bytecode = ship_bytecode
+    startup = 0.0
+    importing = 0.0
+    for x in range(count):
+        t0 = time.time()
+        context = router.local()
+        importing += context.call(do_import, MODULES)
+        startup += time.time() - t0
+        context.shutdown(wait=True)
+    return 1000 * startup / count, 1000 * importing / count
+
+
+@mitogen.main()
+def main(router):
+    count = int((sys.argv[1:2] or ['20'])[0])
+    print('%-14s %14s %14s' % ('', 'startup msec', 'import msec'))
+    for ship_bytecode in False, True:
+        print('%-14s %14.1f %14.1f' % (
+            ('bytecode=%s' % (ship_bytecode,),) +
+            run(router, ship_bytecode, count)
+        ))
+        sys.stdout.flush()
@@ -0,0 +1,62 @@
+"""
+Measure time to connect many local contexts over a simulated slow link, one
+after another, and using Router.connect_many() with varying parallelism. The
+link is simulated using the delay proxy from pipelined_connect.py. Each
+context is shut down as soon as its connection completes, so only a few exist
+at any moment.
+
+    connect_many.py [count [rtt_secs [max_parallel ...]]]
+"""
+
+import sys
+import time
+
+import mitogen
+import mitogen.core
+import mitogen.select
+
+import pipelined_connect
+
+
+def get_kwargs(rtt):
+    return {
+        'python_path': [sys.executable, pipelined_connect.__file__,
+                        'proxy', str(rtt / 2), sys.executable],
+    }
+
+
+def run_serial(router, count, rtt):
+    t0 = time.time()
+    for x in range(count):
+        router.local(**get_kwargs(rtt)).shutdown(wait=True)
+    return time.time() - t0, 0
+
+
+def run_parallel(router, count, rtt, max_parallel):
+    t0 = time.time()
+    failed = 0
+    recvs = router.connect_many([(u'local', get_kwargs(rtt))] * count,
+                                max_parallel=max_parallel)
+    for msg in mitogen.select.Select(recvs):
+        try:
+            msg.unpickle().shutdown(wait=True)
+        except mitogen.core.CallError:
+            failed += 1
+    return time.time() - t0, failed
+
+
+@mitogen.main()
+def main(router):
+    count = int((sys.argv[1:2] or ['200'])[0])
+    rtt = float((sys.argv[2:3] or ['0.1'])[0])
+    parallels = [int(s) for s in sys.argv[3:]] or [8, 32, 64]
+    print('%d local connects at %dms RTT' % (count, 1000 * rtt))
+    print('%-16s %10s %8s' % ('', 'secs', 'failed'))
+    print('%-16s %10.2f %8d' % (('serial',) + run_serial(router, count, rtt)))
+    sys.stdout.flush()
+    for max_parallel in parallels:
+        print('%-16s %10.2f %8d' % (
+            ('max_parallel=%d' % (max_parallel,),) +
+            run_parallel(router, count, rtt, max_parallel)
+        ))
+        sys.stdout.flush()
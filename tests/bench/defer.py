@@ -0,0 +1,128 @@
+"""
+Measure throughput of cross-thread Router.route() calls from many threads,
+comparing the batched Waker with the previous lock-per-call Waker.
+"""
+
+import errno
+import sys
+import threading
+import time
+
+import mitogen.core
+import mitogen.master
+
+THREADS = 16
+PER_THREAD = 20000
+
+
+class LockingWaker(mitogen.core.Waker):
+    """
+    The Waker prior to batching: every defer() takes a lock and writes a byte
+    to a pipe. EAGAIN is ignored here, as otherwise producers crash once the
+    pipe fills.
+    """
+    use_eventfd = False
+
+    def __init__(self, broker):
+        super(LockingWaker, self).__init__(broker)
+        self._lock = threading.Lock()
+        self._deferred = []
+
+    @property
+    def keep_alive(self):
+        self._lock.acquire()
+        try:
+            return len(self._deferred)
+        finally:
+            self._lock.release()
+
+    def on_receive(self, broker):
+        self.receive_side.read(128)
+        self._lock.acquire()
+        try:
+            deferred = self._deferred
+            self._deferred = []
+        finally:
+            self._lock.release()
+
+        for func, args, kwargs in deferred:
+            func(*args, **kwargs)
+
+    def defer(self, func, *args, **kwargs):
+        if threading.currentThread().ident == self.broker_ident:
+            return func(*args, **kwargs)
+
+        self._lock.acquire()
+        try:
+            self._deferred.append((func, args, kwargs))
+        finally:
+            self._lock.release()
+
+        try:
+            self.transmit_side.write(mitogen.core.b(' '))
+        except OSError:
+            e = sys.exc_info()[1]
+            if e.args[0] not in (errno.EBADF, errno.EAGAIN):
+                raise
+
+
+class PipeWaker(mitogen.core.Waker):
+    use_eventfd = False
+
+
+def run(waker_class):
+    broker_class = type('Broker', (mitogen.master.Broker,), {
+        'waker_class': waker_class,
+    })
+    broker = broker_class()
+    router = mitogen.master.Router(broker)
+    try:
+        latch = mitogen.core.Latch()
+        total = THREADS * PER_THREAD
+        counts = [0]
+
+        def on_msg(msg):
+            counts[0] += 1
+            if counts[0] == total:
+                latch.put(None)
+
+        handle = router.add_handler(on_msg, persist=True)
+
+        def produce():
+            for x in range(PER_THREAD):
+                router.route(mitogen.core.Message(
+                    dst_id=mitogen.context_id,
+                    handle=handle,
+                ))
+
+        threads = [threading.Thread(target=produce) for x in range(THREADS)]
+        t0 = time.time()
+        for th in threads:
+            th.start()
+        latch.get()
+        t1 = time.time()
+        for th in threads:
+            th.join()
+        return total, t1 - t0
+    finally:
+        broker.shutdown()
+        broker.join()
+
+
+def main():
+    wakers = [
+        ('locking', LockingWaker),
+        ('pipe', PipeWaker),
+    ]
+    if mitogen.core._eventfd is not None:
+        wakers.append(('eventfd', mitogen.core.Waker))
+
+    print('%-10s %12s' % ('waker', 'msgs/sec'))
+    for name, waker_class in wakers:
+        count, elapsed = run(waker_class)
+        print('%-10s %12d' % (name, count / elapsed))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Compare level-triggered EpollPoller with EdgeEpollPoller when 1000 streams
+are connected. Each round, a burst of small messages arrives for a random
+subset of streams, each of which echoes its input, starting and stopping
+transmit exactly as mitogen.core.Stream does. Reports time per round and
+epoll_ctl() calls per round.
+"""
+
+import os
+import random
+import resource
+import socket
+import sys
+import time
+
+import mitogen.core
+import mitogen.parent
+
+STREAMS = 1000
+ACTIVE = 100
+ROUNDS = 500
+MSG = mitogen.core.b('x') * 64
+
+
+class CountingEpoll(object):
+    def __init__(self, epoll):
+        self.epoll = epoll
+        self.ctl = 0
+
+    def register(self, *args):
+        self.ctl += 1
+        return self.epoll.register(*args)
+
+    def modify(self, *args):
+        self.ctl += 1
+        return self.epoll.modify(*args)
+
+    def unregister(self, *args):
+        self.ctl += 1
+        return self.epoll.unregister(*args)
+
+    def poll(self, *args):
+        return self.epoll.poll(*args)
+
+    def close(self):
+        self.epoll.close()
+
+
+class EchoStream(mitogen.core.BasicStream):
+    echoed = 0
+
+    def __init__(self, poller, sock):
+        self.poller = poller
+        self.receive_side = mitogen.core.Side(self, os.dup(sock.fileno()))
+        self.transmit_side = mitogen.core.Side(self, os.dup(sock.fileno()))
+        self.buf = mitogen.core.b('')
+        poller.start_receive(self.receive_side.fd,
+                             (self.receive_side, self.on_receive))
+
+    def on_receive(self, broker):
+        buf = self.receive_side.read()
+        if not self.buf:
+            self.poller.start_transmit(self.transmit_side.fd,
+                                       (self.transmit_side, self.on_transmit))
+        self.buf += buf
+
+    def on_transmit(self, broker):
+        written = self.transmit_side.write(self.buf)
+        self.buf = self.buf[written:]
+        if not self.buf:
+            self.poller.stop_transmit(self.transmit_side.fd)
+            EchoStream.echoed += 1
+
+    def close(self):
+        self.poller.stop_receive(self.receive_side.fd)
+        self.poller.stop_transmit(self.transmit_side.fd)
+        self.receive_side.close()
+        self.transmit_side.close()
+
+
+def run(klass, pairs):
+    poller = klass()
+    poller._epoll = CountingEpoll(poller._epoll)
+    streams = [EchoStream(poller, sock) for sock, _ in pairs]
+
+    def burst(active):
+        for i in active:
+            pairs[i][1].send(MSG)
+        target = EchoStream.echoed + len(active)
+        while EchoStream.echoed < target:
+            for side, func in poller.poll(1.0):
+                func(None)
+        for i in active:
+            pairs[i][1].recv(len(MSG))
+
+    # Absorb first-use registration of every stream.
+    burst(range(len(pairs)))
+
+    rand = random.Random(0)
+    poller._epoll.ctl = 0
+    t0 = time.time()
+    for x in range(ROUNDS):
+        burst(rand.sample(range(len(pairs)), ACTIVE))
+    elapsed = time.time() - t0
+    ctl = poller._epoll.ctl
+
+    for stream in streams:
+        stream.close()
+    poller.close()
+    return elapsed / ROUNDS, ctl / float(ROUNDS)
+
+
+def main():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = 4 * STREAMS + 100
+    if hard != resource.RLIM_INFINITY:
+        want = min(want, hard)
+    if soft < want:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+
+    pairs = [socket.socketpair() for x in range(STREAMS)]
+    print('%d streams, %d active per round' % (STREAMS, ACTIVE))
+    print('%-16s %12s %14s' % ('poller', 'usec/round', 'epoll_ctl/round'))
+    for klass in mitogen.parent.EpollPoller, mitogen.parent.EdgeEpollPoller:
+        per_round, ctl = run(klass, pairs)
+        print('%-16s %12.1f %14.1f' % (klass.__name__, 1e6 * per_round, ctl))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,46 @@
 """
-Measure latency of .fork() setup/teardown.
+Measure latency of .fork(), and of taking a ready child from a
+mitogen.fork.Pool, along with the latency of the first call made to the new
+context. The pool has `work_ms` of simulated task time between requests in
+which to fork replacements.
+
+    fork.py [count [work_ms]]
 """
 
-import mitogen
+import os
+import sys
 import time
 
+import mitogen
+import mitogen.fork
+
+
+def run(router, count, work, get):
+    get_secs = 0.0
+    call_secs = 0.0
+    for x in range(count):
+        t0 = time.time()
+        context = get()
+        t1 = time.time()
+        context.call(os.getpid)
+        t2 = time.time()
+        get_secs += t1 - t0
+        call_secs += t2 - t1
+        time.sleep(work)
+        context.shutdown(wait=True)
+    return 1000 * get_secs / count, 1000 * call_secs / count
+
+
 @mitogen.main()
 def main(router):
-    t0 = time.time()
-    for x in xrange(200):
-        t = time.time()
-        ctx = router.fork()
-        ctx.shutdown(wait=True)
-    print '++', 1000 * ((time.time() - t0) / (1.0+x))
+    count = int((sys.argv[1:2] or ['200'])[0])
+    work = float((sys.argv[2:3] or ['20'])[0]) / 1000
+    print('%-6s %12s %12s' % ('', 'get msec', 'call msec'))
+    print('%-6s %12.3f %12.3f' % (('fork',) +
+                                 run(router, count, work, router.fork)))
+    pool = mitogen.fork.Pool(router, size=2)
+    try:
+        print('%-6s %12.3f %12.3f' % (('pool',) +
+                                     run(router, count, work, pool.get)))
+    finally:
+        pool.close()
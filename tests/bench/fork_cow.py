@@ -0,0 +1,59 @@
+"""
+Measure memory private to forked children of a parent with a large heap,
+with and without freeze_gc. Each child runs a full garbage collection, as a
+task would eventually trigger, then reports its proportional (PSS) and unique
+(USS) set sizes from /proc/self/smaps_rollup.
+
+    fork_cow.py [count [heap_objects]]
+"""
+
+import gc
+import sys
+
+import mitogen
+import mitogen.fork
+
+#: Stand-in for module state imported by the fork parent, such as
+#: ansible.module_utils.basic.
+heap = None
+
+
+def get_private_kb():
+    gc.collect()
+    stats = {}
+    for line in open('/proc/self/smaps_rollup'):
+        bits = line.split()
+        if len(bits) == 3:
+            stats[bits[0].rstrip(':')] = int(bits[1])
+    return stats['Pss'], stats['Private_Clean'] + stats['Private_Dirty']
+
+
+def run(router, count, freeze_gc):
+    pss = 0
+    uss = 0
+    for x in range(count):
+        context = router.fork(freeze_gc=freeze_gc)
+        child_pss, child_uss = context.call(get_private_kb)
+        pss += child_pss
+        uss += child_uss
+        context.shutdown(wait=True)
+    return pss / count / 1024.0, uss / count / 1024.0
+
+
+@mitogen.main()
+def main(router):
+    global heap
+    count = int((sys.argv[1:2] or ['10'])[0])
+    objects = int((sys.argv[2:3] or ['500000'])[0])
+    heap = [{'index': x, 'items': [x]} for x in range(objects)]
+
+    print('%-16s %10s %10s' % ('', 'PSS MiB', 'USS MiB'))
+    modes = [False]
+    if hasattr(gc, 'freeze'):
+        modes.append(True)
+    for freeze_gc in modes:
+        print('%-16s %10.1f %10.1f' % (
+            ('freeze_gc=%s' % (freeze_gc,),) +
+            run(router, count, freeze_gc)
+        ))
+        sys.stdout.flush()
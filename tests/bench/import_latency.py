@@ -0,0 +1,66 @@
+"""
+Measure GET_MODULE round-trips and wall time for a cold import in a new local
+context, with every module response delayed to simulate a slow link.
+
+    import_latency.py [module [latency_secs]]
+
+The module must be importable by the master, but not by the child.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import mitogen
+import mitogen.core
+import mitogen.master
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, 'data'))
+
+
+class SlowResponder(mitogen.master.ModuleResponder):
+    latency = 0.1
+
+    def __init__(self, router):
+        super(SlowResponder, self).__init__(router)
+        self.requests = []
+
+    def _on_get_module(self, msg):
+        if not msg.is_dead:
+            self.requests.append(time.time())
+        timer = threading.Timer(self.latency, self._router.broker.defer,
+            args=(super(SlowResponder, self)._on_get_module, msg))
+        timer.start()
+
+    def round_trips(self):
+        rounds = 0
+        last = None
+        for t in self.requests:
+            if last is None or t - last > self.latency / 2:
+                rounds += 1
+            last = t
+        return rounds
+
+
+def do_import(name):
+    __import__(name)
+
+
+@mitogen.main()
+def main(router):
+    name = (sys.argv[1:2] or ['chain_pkg_a'])[0]
+    SlowResponder.latency = float((sys.argv[2:3] or ['0.1'])[0])
+    __import__(name)
+
+    router.responder = SlowResponder(router)
+    context = router.local()
+    t0 = time.time()
+    context.call(do_import, name)
+    print('%s: %d requests in %d round-trips, %.2fs at %dms latency' % (
+        name,
+        len(router.responder.requests),
+        router.responder.round_trips(),
+        time.time() - t0,
+        1000 * SlowResponder.latency,
+    ))
@@ -0,0 +1,87 @@
+"""
+Measure per-instance size and construction rate of mitogen.core.Message,
+comparing the __slots__ implementation with the previous __dict__-based one.
+"""
+
+import sys
+import time
+
+import mitogen
+import mitogen.core
+from mitogen.core import b
+
+COUNT = 500000
+
+
+class DictMessage(object):
+    """
+    The Message prior to __slots__: attributes are class-level defaults, and
+    the constructor updates the instance __dict__.
+    """
+    dst_id = None
+    src_id = None
+    auth_id = None
+    handle = None
+    reply_to = None
+    data = b('')
+    router = None
+    receiver = None
+
+    def __init__(self, **kwargs):
+        self.src_id = mitogen.context_id
+        self.auth_id = mitogen.context_id
+        vars(self).update(kwargs)
+        assert isinstance(self.data, mitogen.core.BytesType)
+
+
+def old_receive(router, data):
+    # As previously done by Stream._receive_one().
+    msg = DictMessage()
+    msg.router = router
+    (msg.dst_id, msg.src_id, msg.auth_id,
+     msg.handle, msg.reply_to) = (1, 2, 3, 4, 5)
+    msg.data = data
+    return msg
+
+
+def new_receive(router, data):
+    return mitogen.core.Message._new(1, 2, 3, 4, 5, data, router)
+
+
+def sizeof(msg):
+    size = sys.getsizeof(msg)
+    if hasattr(msg, '__dict__'):
+        size += sys.getsizeof(msg.__dict__)
+    return size
+
+
+def rate(func, *args):
+    t0 = time.time()
+    for x in range(COUNT):
+        func(*args)
+    return COUNT / (time.time() - t0)
+
+
+def main():
+    router = object()
+    data = b('x') * 64
+    print('%-10s %-8s %12s' % ('path', 'impl', 'value'))
+    for name, old, new in [
+        ('kwargs/s', lambda: DictMessage(handle=123, data=data),
+                     lambda: mitogen.core.Message(handle=123, data=data)),
+        ('receive/s', lambda: old_receive(router, data),
+                      lambda: new_receive(router, data)),
+    ]:
+        print('%-10s %-8s %12d' % (name, 'dict', rate(old)))
+        print('%-10s %-8s %12d' % (name, 'slots', rate(new)))
+        sys.stdout.flush()
+
+    if hasattr(sys, 'getsizeof'):
+        print('%-10s %-8s %12d' % ('bytes', 'dict',
+                                   sizeof(old_receive(router, data))))
+        print('%-10s %-8s %12d' % ('bytes', 'slots',
+                                   sizeof(new_receive(router, data))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Measure LOAD_MODULE bytes sent to new local contexts importing a set of
+modules, first with an empty module cache, then with the cache filled by the
+previous context.
+
+    module_cache.py [count]
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+
+import mitogen
+import mitogen.core
+
+MODULES = [
+    'mitogen.parent',
+    'mitogen.master',
+    'mitogen.service',
+    'mitogen.select',
+    'mitogen.ssh',
+    'mitogen.sudo',
+    'mitogen.fork',
+    'mitogen.utils',
+]
+
+
+def do_import(names):
+    for name in names:
+        __import__(name)
+
+
+def instrument(router):
+    stats = {'bytes': 0}
+    real = router.responder._send_tuples
+
+    def _send_tuples(stream, tups):
+        stats['bytes'] += len(mitogen.core.Message.pickled(tups).data)
+        real(stream, tups)
+
+    router.responder._send_tuples = _send_tuples
+    return stats
+
+
+def run(router, stats, path):
+    stats['bytes'] = 0
+    t0 = time.time()
+    context = router.local(module_cache_dir=path)
+    context.call(do_import, MODULES)
+    context.shutdown(wait=True)
+    return stats['bytes'], 1000 * (time.time() - t0)
+
+
+@mitogen.main()
+def main(router):
+    count = int((sys.argv[1:2] or ['5'])[0])
+    stats = instrument(router)
+    path = tempfile.mkdtemp(prefix='mitogen_module_cache.')
+    try:
+        print('%-8s %12s %12s' % ('', 'bytes', 'msec'))
+        print('%-8s %12d %12.1f' % (('cold',) + run(router, stats, path)))
+        for x in range(count):
+            print('%-8s %12d %12.1f' % (('warm',) + run(router, stats, path)))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(path)
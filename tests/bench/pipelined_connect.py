@@ -0,0 +1,89 @@
+"""
+Measure local() connect latency over a simulated slow link, with and without
+pipelined bootstrap. The child interpreter is run via a proxy that delays
+traffic in each direction by half the round-trip time.
+
+    pipelined_connect.py [count [rtt_secs]]
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import mitogen
+
+
+def pump(rfd, wfd, delay):
+    """
+    Copy data from `rfd` to `wfd`, delivering each chunk `delay` seconds
+    after it was read.
+    """
+    q = queue.Queue()
+
+    def writer():
+        while True:
+            deadline, buf = q.get()
+            if not buf:
+                os.close(wfd)
+                return
+            time.sleep(max(0, deadline - time.time()))
+            while buf:
+                buf = buf[os.write(wfd, buf):]
+
+    th = threading.Thread(target=writer)
+    th.start()
+    while True:
+        buf = os.read(rfd, 65536)
+        q.put((time.time() + delay, buf))
+        if not buf:
+            break
+    th.join()
+
+
+def proxy(delay, argv):
+    proc = subprocess.Popen(argv, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE)
+    th = threading.Thread(target=pump,
+                          args=(0, proc.stdin.fileno(), delay))
+    th.setDaemon(True)
+    th.start()
+    pump(proc.stdout.fileno(), 1, delay)
+    sys.exit(proc.wait())
+
+
+def run(router, count, rtt, pipelined):
+    python_path = [sys.executable, __file__, 'proxy', str(rtt / 2),
+                   sys.executable]
+    t0 = time.time()
+    for x in range(count):
+        context = router.local(python_path=python_path, pipelined=pipelined)
+        context.shutdown(wait=True)
+    return 1000 * (time.time() - t0) / count
+
+
+def main():
+    count = int((sys.argv[1:2] or ['10'])[0])
+    rtt = float((sys.argv[2:3] or ['0.1'])[0])
+
+    @mitogen.main()
+    def bench(router):
+        print('%d connects at %dms RTT' % (count, 1000 * rtt))
+        for pipelined in False, True:
+            print('pipelined=%-5s %8.1f ms per connect' % (
+                pipelined, run(router, count, rtt, pipelined),
+            ))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['proxy']:
+        proxy(float(sys.argv[2]), sys.argv[3:])
+    else:
+        main()
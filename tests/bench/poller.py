@@ -0,0 +1,86 @@
+"""
+Measure the cost of one broker loop iteration as the number of registered
+idle streams grows, comparing the select()-based Poller, the poll()-based
+PollPoller, and the OS-specific poller installed by mitogen.parent.
+
+Each iteration wakes one active stream out of N registered ones, which is the
+common case for a parent managing many mostly-idle children.
+"""
+
+import resource
+import socket
+import sys
+import time
+
+import mitogen.core
+import mitogen.parent
+
+COUNTS = [10, 100, 500, 1000, 2000, 5000]
+ITERATIONS = 2000
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = 2 * max(COUNTS) + 100
+    if hard != resource.RLIM_INFINITY:
+        want = min(want, hard)
+    if soft < want:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+
+
+def make_pairs(count):
+    return [socket.socketpair() for x in range(count)]
+
+
+def run(klass, pairs):
+    poller = klass()
+    try:
+        for rsock, wsock in pairs:
+            poller.start_receive(rsock.fileno(), rsock)
+        rsock, wsock = pairs[-1]
+        wsock.send(mitogen.core.b('x'))
+
+        t0 = time.time()
+        for x in range(ITERATIONS):
+            for sock in poller.poll(0):
+                pass
+        return (time.time() - t0) / ITERATIONS
+    finally:
+        poller.close()
+
+
+def main():
+    raise_fd_limit()
+    klasses = [mitogen.core.Poller]
+    if mitogen.core.PollPoller is not mitogen.core.Poller:
+        klasses.append(mitogen.core.PollPoller)
+    if mitogen.parent.PREFERRED_POLLER not in klasses:
+        klasses.append(mitogen.parent.PREFERRED_POLLER)
+
+    print('%-8s %s' % ('streams', ' '.join(
+        '%14s' % (klass.__name__,) for klass in klasses
+    )))
+    for count in COUNTS:
+        try:
+            pairs = make_pairs(count)
+        except socket.error:
+            print('%-8d (out of file descriptors)' % (count,))
+            break
+
+        cols = []
+        for klass in klasses:
+            if klass is mitogen.core.Poller and pairs[-1][1].fileno() >= 1024:
+                # select() cannot wait on fds at or above FD_SETSIZE.
+                cols.append('%14s' % ('n/a',))
+                continue
+            cols.append('%11.2f us' % (1e6 * run(klass, pairs),))
+        print('%-8d %s' % (count, ' '.join(cols)))
+        sys.stdout.flush()
+
+        for rsock, wsock in pairs:
+            rsock.close()
+            wsock.close()
+
+
+if __name__ == '__main__':
+    main()
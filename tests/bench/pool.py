@@ -0,0 +1,87 @@
+"""
+Measure messages/sec handled by a mitogen.service.Pool under burst load,
+comparing workers that take one message per wake (batch_size=1) with the
+default batch size. Each burst delivers CALL_SERVICE messages for a trivial
+no-reply method directly to the pool's receiver, as the broker would.
+"""
+
+import sys
+import threading
+import time
+
+import mitogen.core
+import mitogen.master
+import mitogen.service
+
+BURST = 2000
+BURSTS = 25
+POOL_SIZE = 4
+
+
+class CountService(mitogen.service.Service):
+    def __init__(self, **kwargs):
+        super(CountService, self).__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.target = 0
+        self.done = threading.Event()
+
+    @mitogen.service.expose(policy=mitogen.service.AllowAny())
+    @mitogen.service.no_reply()
+    def bump(self):
+        self.lock.acquire()
+        try:
+            self.count += 1
+            if self.count == self.target:
+                self.done.set()
+        finally:
+            self.lock.release()
+
+
+def make_msg():
+    msg = mitogen.core.Message.pickled(
+        (CountService.name(), 'bump', {}),
+        handle=mitogen.core.CALL_SERVICE,
+    )
+    msg.src_id = mitogen.context_id
+    msg.auth_id = mitogen.context_id
+    return msg
+
+
+def run(router, batch_size):
+    klass = type('Pool', (mitogen.service.Pool,), {
+        'batch_size': batch_size,
+    })
+    service = CountService(router=router)
+    pool = klass(router, [service], size=POOL_SIZE)
+    try:
+        msgs = [make_msg() for x in range(BURST * BURSTS)]
+        t0 = time.time()
+        for x in range(BURSTS):
+            service.done.clear()
+            service.target = BURST * (x + 1)
+            for msg in msgs[BURST * x:BURST * (x + 1)]:
+                pool._receiver._on_receive(msg)
+            service.done.wait()
+        return len(msgs) / (time.time() - t0)
+    finally:
+        pool.stop()
+
+
+def main():
+    broker = mitogen.master.Broker()
+    router = mitogen.master.Router(broker)
+    try:
+        print('%d threads, %d bursts of %d messages' % (POOL_SIZE, BURSTS,
+                                                         BURST))
+        for batch_size in 1, mitogen.service.Pool.batch_size:
+            print('batch_size=%-4d %10.0f msg/sec' % (batch_size,
+                                                     run(router, batch_size)))
+            sys.stdout.flush()
+    finally:
+        broker.shutdown()
+        broker.join()
+
+
+if __name__ == '__main__':
+    main()
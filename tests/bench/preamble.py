@@ -0,0 +1,47 @@
+"""
+Connect many local contexts one after another, reporting time per connect
+spent generating the boot command and preamble, and overall.
+
+    preamble.py [count]
+"""
+
+import sys
+import time
+
+import mitogen
+import mitogen.parent
+
+
+def instrument(name, stats):
+    real = getattr(mitogen.parent.Stream, name)
+
+    def wrapper(self):
+        t0 = time.time()
+        try:
+            return real(self)
+        finally:
+            stats[name] = stats.get(name, 0.0) + time.time() - t0
+
+    setattr(mitogen.parent.Stream, name, wrapper)
+
+
+@mitogen.main()
+def main(router):
+    count = int((sys.argv[1:2] or ['500'])[0])
+    stats = {}
+    for name in 'get_boot_command', 'get_preamble':
+        instrument(name, stats)
+
+    t0 = time.time()
+    for x in range(count):
+        context = router.local()
+        context.shutdown(wait=True)
+    total = time.time() - t0
+
+    # get_boot_command() includes a call to get_preamble().
+    preamble = stats['get_preamble']
+    boot = stats['get_boot_command']
+    print('%d connects, per connect: %.3f ms preamble, %.3f ms boot '
+          'command, %.3f ms total' % (count, 1000 * preamble / count,
+                                      1000 * boot / count,
+                                      1000 * total / count))
@@ -0,0 +1,84 @@
+"""
+Measure throughput of mitogen.core.Stream's receive path, comparing the
+bytearray-based zero_copy_receive engine with the original deque engine.
+"""
+
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+import mitogen.core
+
+TOTAL_BYTES = 256 * 1048576
+
+
+class Router(object):
+    max_message_size = 128 * 1048576
+    count = 0
+
+    def _async_route(self, msg, stream):
+        self.count += 1
+
+
+def make_stream(zero_copy_receive, fd):
+    klass = type('Stream', (mitogen.core.Stream,), {
+        'zero_copy_receive': zero_copy_receive,
+    })
+    stream = klass(Router(), 1)
+    stream.receive_side = mitogen.core.Side(stream, fd)
+    return stream
+
+
+def writer(sock, pkt, count):
+    for x in range(count):
+        sock.sendall(pkt)
+    sock.close()
+
+
+def run(zero_copy_receive, size):
+    rsock, wsock = socket.socketpair()
+    stream = make_stream(zero_copy_receive, os.dup(rsock.fileno()))
+    rsock.close()
+
+    pkt = struct.pack(stream.HEADER_FMT, 0, 0, 0, 0, 0, size) + (
+        mitogen.core.b(' ') * size
+    )
+    count = max(1, TOTAL_BYTES // len(pkt))
+    th = threading.Thread(target=writer, args=(wsock, pkt, count))
+    th.start()
+
+    poller = mitogen.core.Poller()
+    poller.start_receive(stream.receive_side.fd)
+    t0 = time.time()
+    while stream._router.count < count:
+        list(poller.poll())
+        stream.on_receive(None)
+    t1 = time.time()
+    th.join()
+    stream.receive_side.close()
+    return count, t1 - t0
+
+
+def main():
+    engines = [False]
+    if mitogen.core.HAVE_MEMORYVIEW:
+        engines.append(True)
+
+    print('%-10s %-8s %12s %12s' % ('size', 'engine', 'msgs/sec', 'MiB/sec'))
+    for size in 64, 4096, 65536, 1048576, 16 * 1048576:
+        for zero_copy_receive in engines:
+            count, elapsed = run(zero_copy_receive, size)
+            print('%-10d %-8s %12d %12.1f' % (
+                size,
+                zero_copy_receive and 'buffer' or 'deque',
+                count / elapsed,
+                (count * size) / elapsed / 1048576,
+            ))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Measure message size and serialization rate of typical payloads for each
+pickle protocol a stream may negotiate.
+"""
+
+import os
+import sys
+import time
+import zlib
+
+import mitogen.core
+from mitogen.core import b
+
+COUNT = 2000
+
+
+def module_result():
+    # Shape of a typical Ansible "command" module result.
+    return {
+        u'changed': True,
+        u'rc': 0,
+        u'cmd': [u'/bin/echo', u'hello'],
+        u'stdout': u'hello world\n' * 20,
+        u'stderr': u'',
+        u'stdout_lines': [u'hello world'] * 20,
+        u'stderr_lines': [],
+        u'start': u'2018-07-01 12:00:00.000000',
+        u'end': u'2018-07-01 12:00:00.100000',
+        u'delta': u'0:00:00.100000',
+        u'invocation': {
+            u'module_args': {
+                u'_raw_params': u'echo hello',
+                u'_uses_shell': False,
+                u'warn': True,
+                u'chdir': None,
+                u'executable': None,
+                u'creates': None,
+                u'removes': None,
+                u'stdin': None,
+            },
+        },
+        u'_ansible_parsed': True,
+    }
+
+
+def load_module():
+    # Shape of a LOAD_MODULE message.
+    path = os.path.splitext(mitogen.core.__file__)[0] + '.py'
+    fp = open(path, 'rb')
+    try:
+        compressed = zlib.compress(fp.read(), 9)
+    finally:
+        fp.close()
+    return (u'mitogen.core', None, path, mitogen.core.Blob(compressed), [])
+
+
+def file_chunk():
+    # Shape of a FileService chunk.
+    return mitogen.core.Blob(os.urandom(mitogen.core.CHUNK_SIZE))
+
+
+def rate(func):
+    t0 = time.time()
+    for x in range(COUNT):
+        func()
+    return COUNT / (time.time() - t0)
+
+
+def main():
+    protocols = range(2, mitogen.core.pickle.HIGHEST_PROTOCOL + 1)
+    print('%-14s %-6s %10s %12s %12s' % (
+        'payload', 'proto', 'bytes', 'encode/s', 'decode/s'))
+    for name, obj in [
+        ('module_result', module_result()),
+        ('load_module', load_module()),
+        ('file_chunk', file_chunk()),
+    ]:
+        for protocol in protocols:
+            data = mitogen.core.Message.pickled(obj, protocol=protocol).data
+            assert mitogen.core.Message(data=data).unpickle() == obj
+            print('%-14s %-6d %10d %12d %12d' % (
+                name,
+                protocol,
+                len(data),
+                rate(lambda: mitogen.core.Message.pickled(obj,
+                                                          protocol=protocol)),
+                rate(lambda: mitogen.core.Message(data=data).unpickle()),
+            ))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
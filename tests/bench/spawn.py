@@ -0,0 +1,51 @@
+"""
+Measure local() connect latency as the master's resident memory grows,
+starting children with subprocess.Popen, and with os.posix_spawnp where the
+Python version provides it.
+
+    spawn.py [count [rss_mb ...]]
+"""
+
+import os
+import sys
+import time
+
+import mitogen
+import mitogen.parent
+
+
+def get_rss_mb():
+    for line in open('/proc/self/status'):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1]) // 1024
+    return 0
+
+
+def run(router, count, use_posix_spawn):
+    mitogen.parent.USE_POSIX_SPAWN = use_posix_spawn
+    t0 = time.time()
+    for x in range(count):
+        router.local().shutdown(wait=True)
+    return 1000 * (time.time() - t0) / count
+
+
+@mitogen.main()
+def main(router):
+    count = int((sys.argv[1:2] or ['20'])[0])
+    sizes = [int(s) for s in sys.argv[2:]] or [0, 512, 2048]
+    modes = [False]
+    if mitogen.parent.USE_POSIX_SPAWN:
+        modes.append(True)
+
+    ballast = []
+    print('%-10s %16s %16s' % ('rss MiB', 'Popen msec', 'posix_spawn msec'))
+    for size in sizes:
+        # Touched pages, so the master's page tables really grow.
+        ballast.append(b'x' * (max(0, size - get_rss_mb()) << 20))
+        results = [run(router, count, mode) for mode in modes]
+        print('%-10d %16.1f %16s' % (
+            get_rss_mb(),
+            results[0],
+            (len(results) > 1 and '%.1f' % (results[1],)) or 'n/a',
+        ))
+        sys.stdout.flush()
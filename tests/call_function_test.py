@@ -30,6 +30,12 @@ def func_accepts_returns_context(context):
     return context
 
 
+def send_chunks_then_return(sender, n):
+    for x in range(n):
+        sender.send(mitogen.core.Blob(mitogen.core.b('x') * 65536))
+    return n
+
+
 def func_accepts_returns_sender(sender):
     sender.send(123)
     sender.close()
@@ -54,6 +60,15 @@ class CallFunctionTest(testlib.RouterMixin, testlib.TestCase):
     def test_succeeds(self):
         self.assertEqual(3, self.local.call(function_that_adds_numbers, 1, 2))
 
+    def test_reply_follows_sender_data(self):
+        # Everything the function sent must arrive before its return value.
+        recv = mitogen.core.Receiver(self.router)
+        n = 64
+        self.assertEqual(n, self.local.call(send_chunks_then_return,
+                                            recv.to_sender(), n))
+        for x in range(n):
+            self.assertEqual(65536, len(recv.get(block=False).unpickle()))
+
     def test_succeeds_class_method(self):
         self.assertEqual(
             self.local.call(TargetClass.add_numbers_with_offset, 1, 2),
@@ -0,0 +1,6 @@
+# Imports a chain of packages, used to count GET_MODULE round-trips.
+import chain_pkg_b
+
+
+def func():
+    return chain_pkg_b.func() + 1
@@ -0,0 +1,5 @@
+import chain_pkg_b.sub
+
+
+def func():
+    return chain_pkg_b.sub.func() + 1
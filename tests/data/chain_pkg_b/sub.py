@@ -0,0 +1,5 @@
+import chain_pkg_c
+
+
+def func():
+    return chain_pkg_c.func() + 1
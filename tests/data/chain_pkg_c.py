@@ -0,0 +1,3 @@
+
+def func():
+    return 1
@@ -1,12 +1,16 @@
 
 import ctypes
+import gc
 import os
 import random
 import ssl
 import struct
 import sys
+import threading
+import time
 
 import mitogen
+import mitogen.fork
 import unittest2
 
 import testlib
@@ -46,6 +50,10 @@ def RAND_pseudo_bytes(n=32):
     return buf[:]
 
 
+def get_freeze_count():
+    return gc.get_freeze_count()
+
+
 def exercise_importer(n):
     """
     Ensure the forked child has a sensible importer.
@@ -84,6 +92,48 @@ class ForkTest(testlib.RouterMixin, unittest2.TestCase):
         context = self.router.fork(on_start=on_start)
         self.assertEquals(123, recv.get().unpickle())
 
+class FreezeGcTest(testlib.RouterMixin, unittest2.TestCase):
+    def tearDown(self):
+        gc.unfreeze()
+        super(FreezeGcTest, self).tearDown()
+
+    def test_frozen_in_child(self):
+        context = self.router.fork(freeze_gc=True)
+        self.assertTrue(context.call(get_freeze_count) > 0)
+
+    def test_default_not_frozen(self):
+        context = self.router.fork()
+        self.assertEqual(0, context.call(get_freeze_count))
+
+    def test_parent_not_frozen(self):
+        before = gc.get_freeze_count()
+        for x in range(3):
+            context = self.router.fork(freeze_gc=True)
+            context.call(get_freeze_count)
+            self.assertEqual(before, gc.get_freeze_count())
+
+    def test_caller_freeze_kept(self):
+        mitogen.fork.freeze_gc()
+        context = self.router.fork(freeze_gc=True)
+        self.assertTrue(context.call(get_freeze_count) > 0)
+        self.assertTrue(gc.get_freeze_count() > 0)
+
+    def test_caller_freeze_new_objects_frozen(self):
+        mitogen.fork.freeze_gc()
+        before = gc.get_freeze_count()
+        objs = [[] for x in range(1000)]
+        context = self.router.fork(freeze_gc=True)
+        # Frozen objects freed by reference counting leave the count too.
+        count = context.call(get_freeze_count)
+        self.assertTrue(count > before + len(objs) // 2)
+        self.assertTrue(gc.get_freeze_count() >= before)
+
+FreezeGcTest = unittest2.skipIf(
+    condition=not hasattr(gc, 'freeze'),
+    reason='gc.freeze() requires Python 3.7'
+)(FreezeGcTest)
+
+
 class DoubleChildTest(testlib.RouterMixin, unittest2.TestCase):
     def test_okay(self):
         # When forking from the master process, Mitogen had nothing to do with
@@ -106,5 +156,89 @@ class DoubleChildTest(testlib.RouterMixin, unittest2.TestCase):
         self.assertEqual(2, c2.call(exercise_importer, 1))
 
 
+class PoolTest(testlib.RouterMixin, unittest2.TestCase):
+    def setUp(self):
+        super(PoolTest, self).setUp()
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool:
+            self.pool.close()
+        super(PoolTest, self).tearDown()
+
+    def wait_ready(self, n, timeout=10.0):
+        deadline = time.time() + timeout
+        while len(self.pool._ready) != n:
+            self.assertTrue(time.time() < deadline)
+            time.sleep(0.01)
+        return [context for context, _ in self.pool._ready]
+
+    def test_get(self):
+        self.pool = mitogen.fork.Pool(self.router, size=2)
+        ready = self.wait_ready(2)
+        context = self.pool.get()
+        self.assertTrue(context is ready[0])
+        self.assertEqual(123, context.call(ping))
+        self.assertFalse(context in self.wait_ready(2))
+
+    def test_get_removes_listener(self):
+        self.pool = mitogen.fork.Pool(self.router, size=1)
+        self.wait_ready(1)
+        context, on_disconnect = self.pool._ready[0]
+        self.assertTrue(context is self.pool.get())
+        signals = vars(context)['_signals']
+        self.assertFalse(on_disconnect in signals['disconnect'])
+
+    def test_get_waits_for_refill_thread(self):
+        threads = []
+        fork = self.router.fork
+        def record_fork(**kwargs):
+            threads.append(threading.currentThread())
+            return fork(**kwargs)
+        self.router.fork = record_fork
+        try:
+            self.pool = mitogen.fork.Pool(self.router, size=0)
+            self.assertEqual(123, self.pool.get().call(ping))
+        finally:
+            del self.router.fork
+        self.assertEqual([self.pool._thread], threads)
+
+    def test_fork_failure_raised(self):
+        self.pool = mitogen.fork.Pool(self.router, size=0, bad_kwarg=1)
+        self.assertRaises(TypeError, lambda: self.pool.get())
+
+    def test_get_after_close(self):
+        self.pool = mitogen.fork.Pool(self.router, size=0)
+        self.pool.close()
+        self.assertRaises(mitogen.core.Error, lambda: self.pool.get())
+
+    def test_on_start_runs_before_get(self):
+        recv = mitogen.core.Receiver(self.router)
+        def on_start(econtext):
+            sender = mitogen.core.Sender(econtext.parent, recv.handle)
+            sender.send(mitogen.context_id)
+        self.pool = mitogen.fork.Pool(self.router, size=1, on_start=on_start)
+        context_id = recv.get().unpickle()
+        self.assertEqual(context_id, self.pool.get().context_id)
+
+    def test_disconnected_child_replaced(self):
+        self.pool = mitogen.fork.Pool(self.router, size=1)
+        context, = self.wait_ready(1)
+        context.shutdown(wait=True)
+        self.wait_ready(0)
+        self.assertEqual(123, self.pool.get().call(ping))
+        replacement, = self.wait_ready(1)
+        self.assertFalse(replacement is context)
+
+    def test_close(self):
+        self.pool = mitogen.fork.Pool(self.router, size=1)
+        context, = self.wait_ready(1)
+        latch = mitogen.core.Latch()
+        mitogen.core.listen(context, 'disconnect', lambda: latch.put(None))
+        self.pool.close()
+        latch.get(timeout=10.0)
+        self.assertEqual([], self.pool._ready)
+
+
 if __name__ == '__main__':
     unittest2.main()
@@ -1,5 +1,6 @@
 
 import email.utils
+import marshal
 import sys
 import threading
 import types
@@ -143,6 +144,59 @@ class LoadModulePackageTest(ImporterMixin, testlib.TestCase):
         self.assertEquals(mod.func.__module__, self.modname)
 
 
+class LoadModuleBundleTest(ImporterMixin, testlib.TestCase):
+    data = zlib.compress(b("data = 1\n\n"))
+    modname = 'fake_bundle_a'
+    # 0:fullname 1:pkg_present 2:path 3:compressed 4:related
+    response = [
+        (modname, None, 'fake_bundle_a.py', data, ['fake_bundle_b']),
+        ('fake_bundle_b', None, 'fake_bundle_b.py', data, []),
+    ]
+
+    def test_related_module_cached(self):
+        self.set_get_module_response(self.response)
+        self.importer.load_module(self.modname)
+        self.assertTrue('fake_bundle_b' in self.importer._cache)
+
+    def test_single_request_sent(self):
+        msgs = []
+        def on_context_send(msg):
+            msgs.append(msg)
+            self.importer._on_load_module(
+                mitogen.core.Message.pickled(self.response)
+            )
+        self.context.send = on_context_send
+        self.importer.load_module(self.modname)
+        self.assertEquals(1, len(msgs))
+        self.assertEquals(([self.modname], mitogen.core.BYTECODE_TAG, {}),
+                          mitogen.core.parse_module_request(msgs[0].data))
+
+
+class LoadModuleBytecodeTest(ImporterMixin, testlib.TestCase):
+    data = zlib.compress(b("data = 1\n\n"))
+    bytecode = zlib.compress(marshal.dumps(compile("data = 2\n", "x", "exec")))
+    path = 'fake_module.py'
+    modname = 'fake_module'
+
+    def get_data(self, bytecode):
+        # 0:fullname 1:pkg_present 2:path 3:compressed 4:related 5:bytecode
+        self.set_get_module_response(
+            (self.modname, None, self.path, self.data, [], bytecode)
+        )
+        return self.importer.load_module(self.modname).data
+
+    def test_bytecode_used(self):
+        bytecode = (mitogen.core.BYTECODE_TAG, self.bytecode)
+        self.assertEquals(2, self.get_data(bytecode))
+
+    def test_other_tag_ignored(self):
+        self.assertEquals(1, self.get_data((u'1-0', self.bytecode)))
+
+    def test_bad_bytecode_ignored(self):
+        bytecode = (mitogen.core.BYTECODE_TAG, zlib.compress(b('junk')))
+        self.assertEquals(1, self.get_data(bytecode))
+
+
 class EmailParseAddrSysTest(testlib.RouterMixin, testlib.TestCase):
     @pytest.fixture(autouse=True)
     def initdir(self, caplog):
@@ -1,6 +1,7 @@
 
 import sys
 import threading
+import time
 
 import unittest2
 
@@ -55,6 +56,51 @@ class GetTest(testlib.TestCase):
         self.assertEquals(obj, latch.get(timeout=0))
 
 
+class GetManyTest(testlib.TestCase):
+    klass = mitogen.core.Latch
+
+    def test_empty_noblock(self):
+        latch = self.klass()
+        self.assertRaises(mitogen.core.TimeoutError,
+            lambda: latch.get_many(block=False))
+
+    def test_bad_max_items(self):
+        latch = self.klass()
+        self.assertRaises(ValueError, lambda: latch.get_many(0))
+
+    def test_all(self):
+        latch = self.klass()
+        for x in range(5):
+            latch.put(x)
+        self.assertEquals(list(range(5)), latch.get_many())
+        self.assertTrue(latch.empty())
+
+    def test_max_items(self):
+        latch = self.klass()
+        for x in range(5):
+            latch.put(x)
+        self.assertEquals([0, 1, 2], latch.get_many(3))
+        self.assertEquals([3, 4], latch.get_many(3, block=False))
+
+    def test_until(self):
+        latch = self.klass()
+        for x in 1, 2, None, None, 3:
+            latch.put(x)
+        until = lambda x: x is None
+        self.assertEquals([1, 2], latch.get_many(until=until))
+        self.assertEquals([None], latch.get_many(until=until))
+        self.assertEquals([None], latch.get_many(until=until))
+        self.assertEquals([3], latch.get_many(until=until))
+
+    def test_requeue(self):
+        latch = self.klass()
+        for x in range(4):
+            latch.put(x)
+        items = latch.get_many(3)
+        latch.requeue(items[1:])
+        self.assertEquals([1, 2, 3], latch.get_many())
+
+
 class ThreadedGetTest(testlib.TestCase):
     klass = mitogen.core.Latch
 
@@ -207,6 +253,113 @@ class ThreadedCloseTest(testlib.TestCase):
             self.assertTrue(isinstance(exc, mitogen.core.LatchError))
 
 
+class SocketpairLatch(mitogen.core.Latch):
+    use_eventfd = False
+
+
+class EventfdLatch(mitogen.core.Latch):
+    use_eventfd = True
+
+
+class SleepMixin(object):
+    def test_timeout(self):
+        latch = self.klass()
+        self.assertRaises(mitogen.core.TimeoutError,
+            lambda: latch.get(timeout=0.05))
+        # The wake handle remains usable by the next sleep.
+        th = threading.Timer(0.05, latch.put, args=('x',))
+        th.start()
+        self.assertEquals('x', latch.get(timeout=3.0))
+        th.join()
+
+    def test_timeout_does_not_leak(self):
+        # Count the wake handles the class allocated rather than the process'
+        # open files, which other tests' threads may still be changing.
+        def count_handles():
+            return (len(self.klass._cls_all_sockets) +
+                    len(self.klass._cls_all_eventfds))
+        latch = self.klass()
+        self.assertRaises(mitogen.core.TimeoutError,
+            lambda: latch.get(timeout=0.001))
+        before = count_handles()
+        for x in range(200):
+            self.assertRaises(mitogen.core.TimeoutError,
+                lambda: latch.get(timeout=0.001))
+        self.assertEquals(before, count_handles())
+
+    def test_get_many_wake(self):
+        latch = self.klass()
+        def put():
+            latch.put('x')
+            latch.put('y')
+        th = threading.Timer(0.05, put)
+        th.start()
+        items = latch.get_many(timeout=3.0)
+        th.join()
+        if len(items) == 1:
+            items.extend(latch.get_many(block=False))
+        self.assertEquals(['x', 'y'], items)
+
+    def test_get_many_sleepers_not_starved(self):
+        latch = self.klass()
+        results = []
+        th = threading.Thread(target=lambda: results.append(latch.get(3.0)))
+        th.start()
+        while not latch._sleeping:
+            time.sleep(0.01)
+        latch.put('x')
+        latch.put('y')
+        # 'x' is promised to the sleeping thread.
+        self.assertEquals(['y'], latch.get_many(block=False))
+        th.join()
+        self.assertEquals(['x'], results)
+
+
+class SocketpairSleepTest(SleepMixin, testlib.TestCase):
+    klass = SocketpairLatch
+
+
+class SocketpairThreadedGetTest(ThreadedGetTest):
+    klass = SocketpairLatch
+
+
+class SocketpairThreadedCloseTest(ThreadedCloseTest):
+    klass = SocketpairLatch
+
+
+class EventfdSleepTest(SleepMixin, testlib.TestCase):
+    klass = EventfdLatch
+
+    def test_reuses_eventfd(self):
+        latch = self.klass()
+        th = threading.Timer(0.05, latch.put, args=('x',))
+        th.start()
+        latch.get(timeout=3.0)
+        th.join()
+        fd, poller = self.klass._cls_idle_eventfds[-1]
+        th = threading.Timer(0.05, latch.put, args=('y',))
+        th.start()
+        latch.get(timeout=3.0)
+        th.join()
+        self.assertEquals((fd, poller), self.klass._cls_idle_eventfds[-1])
+
+
+class EventfdThreadedGetTest(ThreadedGetTest):
+    klass = EventfdLatch
+
+
+class EventfdThreadedCloseTest(ThreadedCloseTest):
+    klass = EventfdLatch
+
+
+skip_no_eventfd = unittest2.skipIf(
+    condition=mitogen.core._eventfd is None,
+    reason='os.eventfd() unavailable',
+)
+EventfdSleepTest = skip_no_eventfd(EventfdSleepTest)
+EventfdThreadedGetTest = skip_no_eventfd(EventfdThreadedGetTest)
+EventfdThreadedCloseTest = skip_no_eventfd(EventfdThreadedCloseTest)
+
 
 if __name__ == '__main__':
     unittest2.main()
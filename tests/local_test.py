@@ -5,6 +5,7 @@ import sys
 import unittest2
 
 import mitogen
+import mitogen.parent
 import mitogen.ssh
 import mitogen.utils
 
@@ -59,5 +60,26 @@ class PythonPathTest(testlib.RouterMixin, unittest2.TestCase):
         self.assertEquals('1', env['EXECUTED_VIA_ENV_WRAPPER'])
 
 
+
+class PipelinedTest(testlib.RouterMixin, unittest2.TestCase):
+    def test_okay(self):
+        context = self.router.local(pipelined=True)
+        self.assertEquals(256, context.call(plain_old_module.pow, 2, 8))
+
+    def test_via(self):
+        c1 = self.router.local(pipelined=True)
+        c2 = self.router.local(via=c1, pipelined=True)
+        self.assertEquals(256, c2.call(plain_old_module.pow, 2, 8))
+
+    def test_class_default(self):
+        class PipelinedStream(mitogen.parent.Stream):
+            pipelined = True
+        stream = PipelinedStream(self.router, 1234, max_message_size=100)
+        self.assertTrue(stream.pipelined)
+        stream = PipelinedStream(self.router, 1234, max_message_size=100,
+                                 pipelined=False)
+        self.assertFalse(stream.pipelined)
+
+
 if __name__ == '__main__':
     unittest2.main()
@@ -0,0 +1,95 @@
+import unittest2
+
+import mitogen
+import mitogen.core
+from mitogen.core import b
+
+import testlib
+
+
+class ConstructorTest(testlib.TestCase):
+    klass = mitogen.core.Message
+
+    def test_defaults(self):
+        msg = self.klass()
+        self.assertEquals(None, msg.dst_id)
+        self.assertEquals(mitogen.context_id, msg.src_id)
+        self.assertEquals(mitogen.context_id, msg.auth_id)
+        self.assertEquals(None, msg.handle)
+        self.assertEquals(None, msg.reply_to)
+        self.assertEquals(b(''), msg.data)
+        self.assertEquals(None, msg.router)
+        self.assertEquals(None, msg.receiver)
+
+    def test_kwargs(self):
+        msg = self.klass(dst_id=1, src_id=2, auth_id=3, handle=4,
+                         reply_to=5, data=b('x'))
+        self.assertEquals((1, 2, 3, 4, 5, b('x')),
+            (msg.dst_id, msg.src_id, msg.auth_id, msg.handle,
+             msg.reply_to, msg.data))
+
+    def test_unknown_kwarg(self):
+        self.assertRaises(TypeError, lambda: self.klass(dave=1))
+
+    def test_no_dict(self):
+        msg = self.klass()
+        self.assertFalse(hasattr(msg, '__dict__'))
+        self.assertRaises(AttributeError,
+                          lambda: setattr(msg, 'dave', 1))
+
+    def test_new(self):
+        router = object()
+        msg = self.klass._new(1, 2, 3, 4, 5, b('x'), router)
+        self.assertEquals((1, 2, 3, 4, 5, b('x')),
+            (msg.dst_id, msg.src_id, msg.auth_id, msg.handle,
+             msg.reply_to, msg.data))
+        self.assertEquals(router, msg.router)
+        self.assertEquals(None, msg.receiver)
+
+
+class Unpicklable(object):
+    def __reduce__(self):
+        raise mitogen.core.pickle.PicklingError('unpicklable')
+
+
+class PickledTest(testlib.TestCase):
+    klass = mitogen.core.Message
+
+    def test_roundtrip(self):
+        msg = self.klass.pickled([1, 2, 3], handle=123, dst_id=1)
+        self.assertEquals(123, msg.handle)
+        self.assertEquals(1, msg.dst_id)
+        self.assertEquals([1, 2, 3], msg.unpickle())
+
+    def test_unpickle_cached(self):
+        msg = self.klass.pickled([1, 2, 3])
+        self.assertTrue(msg.unpickle() is msg.unpickle())
+
+    def test_unpicklable(self):
+        msg = self.klass.pickled(Unpicklable())
+        self.assertRaises(mitogen.core.CallError, lambda: msg.unpickle())
+
+
+class FakeRouter(object):
+    def get_pickle_protocol(self, dst_id):
+        return 2
+
+
+class ReplyTest(testlib.TestCase):
+    klass = mitogen.core.Message
+
+    def test_reply(self):
+        routed = []
+        router = FakeRouter()
+        router.route = routed.append
+        msg = self.klass(src_id=2, reply_to=123, router=router)
+        msg.reply(456, reply_to=789)
+        reply, = routed
+        self.assertEquals(2, reply.dst_id)
+        self.assertEquals(123, reply.handle)
+        self.assertEquals(789, reply.reply_to)
+        self.assertEquals(456, reply.unpickle())
+
+
+if __name__ == '__main__':
+    unittest2.main()
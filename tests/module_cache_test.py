@@ -0,0 +1,190 @@
+
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+import unittest2
+
+import mitogen.core
+import mitogen.master
+from mitogen.core import b
+
+import testlib
+import plain_old_module
+
+
+def make_tuple(fullname, source):
+    # 0:fullname 1:pkg_present 2:path 3:compressed 4:related
+    return (fullname, None, fullname + '.py', zlib.compress(b(source)), [])
+
+
+def elide(tup):
+    return tup[:3] + (None,) + tup[4:5]
+
+
+class CacheMixin(object):
+    def setUp(self):
+        super(CacheMixin, self).setUp()
+        self.path = tempfile.mkdtemp(prefix='mitogen_module_cache_test.')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(CacheMixin, self).tearDown()
+
+
+class ModuleCacheTest(CacheMixin, testlib.TestCase):
+    def test_put_get(self):
+        tup = make_tuple('fake_module', 'data = 1\n')
+        cache = mitogen.core.ModuleCache(self.path)
+        cache.put(tup)
+
+        cache = mitogen.core.ModuleCache(self.path)
+        self.assertEquals(
+            {'fake_module': mitogen.core.module_digest(tup[3])},
+            cache.digests(),
+        )
+        self.assertEquals(tup, cache.get(elide(tup)))
+
+    def test_bytecode(self):
+        bytecode = (mitogen.core.BYTECODE_TAG, b('code'))
+        tup = make_tuple('fake_module', 'data = 1\n') + (bytecode,)
+        mitogen.core.ModuleCache(self.path).put(tup)
+        cache = mitogen.core.ModuleCache(self.path)
+        self.assertEquals(tup, cache.get(elide(tup)))
+
+    def test_bytecode_damaged(self):
+        bytecode = (mitogen.core.BYTECODE_TAG, b('code'))
+        tup = make_tuple('fake_module', 'data = 1\n') + (bytecode,)
+        mitogen.core.ModuleCache(self.path).put(tup)
+        path = os.path.join(self.path, 'fake_module@%s@%s' % (
+            mitogen.core.module_digest(tup[3]),
+            mitogen.core.BYTECODE_TAG,
+        ))
+        fp = open(path, 'rb')
+        data = fp.read()
+        fp.close()
+        fp = open(path, 'wb')
+        fp.write(data[:-1])
+        fp.close()
+
+        # The source is still used, and the code is discarded.
+        cache = mitogen.core.ModuleCache(self.path)
+        self.assertEquals(tup[:5], cache.get(elide(tup)))
+        self.assertFalse(os.path.exists(path))
+
+    def test_damaged(self):
+        tup = make_tuple('fake_module', 'data = 1\n')
+        mitogen.core.ModuleCache(self.path).put(tup)
+        for filename in os.listdir(self.path):
+            fp = open(os.path.join(self.path, filename), 'wb')
+            fp.write(b('junk'))
+            fp.close()
+
+        cache = mitogen.core.ModuleCache(self.path)
+        self.assertEquals(None, cache.get(elide(tup)))
+
+    def test_newest_copy_offered(self):
+        old = make_tuple('fake_module', 'data = 1\n')
+        new = make_tuple('fake_module', 'data = 2\n')
+        cache = mitogen.core.ModuleCache(self.path)
+        cache.put(old)
+        now = time.time()
+        os.utime(os.path.join(self.path, os.listdir(self.path)[0]),
+                 (now - 60, now - 60))
+        cache.put(new)
+
+        cache = mitogen.core.ModuleCache(self.path)
+        self.assertEquals(mitogen.core.module_digest(new[3]),
+                          cache.digests()['fake_module'])
+
+    def test_eviction(self):
+        cache = mitogen.core.ModuleCache(self.path)
+        now = time.time()
+        for x in range(10):
+            tup = make_tuple('fake_module%d' % (x,), 'data = "%s"\n' % (
+                'x' * 1000 * x,
+            ))
+            cache.put(tup)
+            path = os.path.join(self.path, 'fake_module%d@%s' % (
+                x, mitogen.core.module_digest(tup[3])
+            ))
+            os.utime(path, (now - 100 + x, now - 100 + x))
+
+        sizes = [os.path.getsize(os.path.join(self.path, name))
+                 for name in os.listdir(self.path)]
+        max_bytes = sum(sizes) - 1
+        cache = mitogen.core.ModuleCache(self.path, max_bytes=max_bytes)
+        # Only the least recently used module is evicted.
+        self.assertEquals(9, len(os.listdir(self.path)))
+        self.assertFalse('fake_module0' in cache.digests())
+
+    def test_writable_by_others(self):
+        os.chmod(self.path, int('0777', 8))
+        self.assertRaises(OSError,
+            lambda: mitogen.core.ModuleCache(self.path))
+
+
+class LocalContextTest(CacheMixin, testlib.RouterMixin, testlib.TestCase):
+    def record_tuples(self):
+        sent = []
+        real = self.router.responder._send_tuples
+        def _send_tuples(stream, tups):
+            sent.extend(tups)
+            real(stream, tups)
+        self.router.responder._send_tuples = _send_tuples
+        return sent
+
+    def call(self):
+        context = self.router.local(module_cache_dir=self.path)
+        try:
+            return context.call(plain_old_module.pow, 2, 8)
+        finally:
+            context.shutdown(wait=True)
+
+    def test_second_context_uses_cache(self):
+        sent = self.record_tuples()
+        self.assertEquals(256, self.call())
+        self.assertTrue(sent[-1][3] is not None)
+
+        del sent[:]
+        self.assertEquals(256, self.call())
+        self.assertEquals('plain_old_module', sent[-1][0])
+        self.assertTrue(sent[-1][3] is None)
+
+    def test_damaged_cache_refetched(self):
+        self.assertEquals(256, self.call())
+        for filename in os.listdir(self.path):
+            fp = open(os.path.join(self.path, filename), 'wb')
+            fp.write(b('junk'))
+            fp.close()
+
+        sent = self.record_tuples()
+        self.assertEquals(256, self.call())
+        self.assertTrue(sent[-1][3] is not None)
+
+
+@mitogen.core.takes_router
+def get_module_digests(context_id, router):
+    return sorted(router.stream_by_id(context_id).module_digests)
+
+
+class ForwarderTest(CacheMixin, testlib.RouterMixin, testlib.TestCase):
+    def call(self, via):
+        # The intermediary's ModuleForwarder answers the child's requests.
+        context = self.router.local(via=via, module_cache_dir=self.path)
+        try:
+            self.assertEquals(256, context.call(plain_old_module.pow, 2, 8))
+            return via.call(get_module_digests, context.context_id)
+        finally:
+            context.shutdown(wait=True)
+
+    def test_second_context_uses_cache(self):
+        c1 = self.router.local()
+        self.assertEquals([], self.call(c1))
+        self.assertTrue('plain_old_module' in self.call(c1))
+
+
+if __name__ == '__main__':
+    unittest2.main()
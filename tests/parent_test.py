@@ -3,13 +3,16 @@ import os
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+import zlib
 
 import mock
 import unittest2
 import testlib
 
 import mitogen.parent
+from mitogen.core import b
 
 
 def wait_for_child(pid, timeout=1.0):
@@ -44,6 +47,88 @@ class GetDefaultRemoteNameTest(testlib.TestCase):
         self.assertEquals("ECORP_Administrator@box:123", self.func())
 
 
+class PreambleTest(testlib.RouterMixin, testlib.TestCase):
+    def make_stream(self, remote_id):
+        return mitogen.parent.Stream(self.router, remote_id,
+                                     max_message_size=123)
+
+    def test_contents(self):
+        stream = self.make_stream(1234)
+        source = zlib.decompress(stream.get_preamble()).decode('utf-8')
+        core_source = mitogen.parent.get_core_source()
+        self.assertTrue(source.startswith(core_source))
+        trailer = source[len(core_source):]
+        self.assertTrue(trailer.startswith('\nExternalContext({'))
+        self.assertTrue("'context_id': 1234" in trailer)
+
+    def test_core_source_compressed_once(self):
+        prefix, _ = mitogen.parent.get_core_compressor()
+        for remote_id in 1, 2:
+            preamble = self.make_stream(remote_id).get_preamble()
+            self.assertTrue(preamble.startswith(prefix))
+        self.assertIs(prefix, mitogen.parent.get_core_compressor()[0])
+
+    def test_cached_per_stream(self):
+        stream = self.make_stream(1234)
+        self.assertIs(stream.get_preamble(), stream.get_preamble())
+
+
+class DiscardUntilTest(testlib.TestCase):
+    def test_marker_split_across_reads(self):
+        rfd, wfd = os.pipe()
+        try:
+            def write_rest():
+                time.sleep(0.1)
+                os.write(wfd, b('001\n'))
+            th = threading.Thread(target=write_rest)
+            os.write(wfd, b('banner\nMITO000\nMITO'))
+            th.start()
+            mitogen.parent.discard_until(rfd, mitogen.parent.Stream.EC1_MARKER,
+                                         time.time() + 5.0)
+            th.join()
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+
+    def test_marker_followed_by_output(self):
+        rfd, wfd = os.pipe()
+        try:
+            os.write(wfd, b('banner\nMITO001\ntrailing'))
+            mitogen.parent.discard_until(rfd, mitogen.parent.Stream.EC1_MARKER,
+                                         time.time() + 5.0)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+
+class BootstrapMarkerTest(testlib.TestCase):
+    def make_stream(self, pipelined):
+        stream = mitogen.parent.Stream.__new__(mitogen.parent.Stream)
+        stream.pipelined = pipelined
+        stream.received_ec0 = []
+        stream._ec0_received = lambda: stream.received_ec0.append(True)
+        return stream
+
+    def test_ec0_split_across_reads(self):
+        stream = self.make_stream(pipelined=False)
+        self.assertFalse(stream._bootstrap_marker_received(b('motd\nMIT')))
+        self.assertFalse(stream.received_ec0)
+        self.assertTrue(stream._bootstrap_marker_received(b('O000\n')))
+        self.assertEquals([True], stream.received_ec0)
+
+    def test_ec1_split_across_reads(self):
+        stream = self.make_stream(pipelined=True)
+        self.assertFalse(stream._bootstrap_marker_received(b('MITO000\nMI')))
+        self.assertTrue(stream._bootstrap_marker_received(b('TO001\n')))
+        self.assertEquals([], stream.received_ec0)
+
+    def test_ec1_followed_by_output(self):
+        stream = self.make_stream(pipelined=True)
+        self.assertTrue(stream._bootstrap_marker_received(
+            b('MITO000\nMITO001\nmore')))
+
+
 class ReapChildTest(testlib.RouterMixin, testlib.TestCase):
     def test_connect_timeout(self):
         # Ensure the child process is reaped if the connection times out.
@@ -151,6 +236,64 @@ class TtyCreateChildTest(unittest2.TestCase):
             tf.close()
 
 
+class CreateChildTest(unittest2.TestCase):
+    def test_inheritable_fd_not_leaked(self):
+        rfd, wfd = os.pipe()
+        try:
+            if hasattr(os, 'set_inheritable'):
+                os.set_inheritable(wfd, True)
+            pid, fd, _ = mitogen.parent.create_child([
+                'bash', '-c', 'echo $(cd /proc/self/fd; echo *)'
+            ])
+            deadline = time.time() + 5.0
+            for line in mitogen.parent.iter_read([fd], deadline):
+                # The shell's stdio and the directory being listed.
+                self.assertEquals(b('0 1 2 3\n'), line)
+                break
+            os.close(fd)
+            os.waitpid(pid, 0)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+CreateChildTest = unittest2.skipIf(
+    condition=not os.path.exists('/proc/self/fd'),
+    reason='requires /proc/self/fd'
+)(CreateChildTest)
+
+
+class GetInheritableFdsTest(unittest2.TestCase):
+    def test_inheritable(self):
+        rfd, wfd = os.pipe()
+        try:
+            os.set_inheritable(wfd, True)
+            fds = mitogen.parent.get_inheritable_fds()
+            self.assertTrue(wfd in fds)
+            self.assertFalse(rfd in fds)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+GetInheritableFdsTest = unittest2.skipIf(
+    condition=not hasattr(os, 'set_inheritable'),
+    reason='requires Python 3.4'
+)(GetInheritableFdsTest)
+
+
+class PopenTtyCreateChildTest(TtyCreateChildTest):
+    def setUp(self):
+        self.old_use_posix_spawn = mitogen.parent.USE_POSIX_SPAWN
+        mitogen.parent.USE_POSIX_SPAWN = False
+
+    def tearDown(self):
+        mitogen.parent.USE_POSIX_SPAWN = self.old_use_posix_spawn
+
+PopenTtyCreateChildTest = unittest2.skipIf(
+    condition=not mitogen.parent.USE_POSIX_SPAWN,
+    reason='TtyCreateChildTest already uses subprocess.Popen'
+)(PopenTtyCreateChildTest)
+
+
 class IterReadTest(unittest2.TestCase):
     func = staticmethod(mitogen.parent.iter_read)
 
@@ -0,0 +1,267 @@
+
+import os
+import resource
+import select
+import socket
+
+import unittest2
+
+import mitogen.core
+import mitogen.parent
+
+import testlib
+
+
+class PollerMixin(object):
+    klass = None
+
+    def setUp(self):
+        super(PollerMixin, self).setUp()
+        self.p = self.klass()
+        self.rsock, self.wsock = socket.socketpair()
+
+    def tearDown(self):
+        self.p.close()
+        self.rsock.close()
+        self.wsock.close()
+        super(PollerMixin, self).tearDown()
+
+    def fill(self, sock):
+        sock.setblocking(False)
+        try:
+            while True:
+                sock.send(mitogen.core.b('x') * 65536)
+        except socket.error:
+            pass
+
+
+class ReceiveMixin(PollerMixin):
+    def test_empty(self):
+        self.p.start_receive(self.rsock.fileno())
+        self.assertEquals([], list(self.p.poll(0)))
+
+    def test_readable(self):
+        self.p.start_receive(self.rsock.fileno(), 'data')
+        self.wsock.send(mitogen.core.b('x'))
+        self.assertEquals(['data'], list(self.p.poll(0)))
+
+    def test_default_data(self):
+        fd = self.rsock.fileno()
+        self.p.start_receive(fd)
+        self.wsock.send(mitogen.core.b('x'))
+        self.assertEquals([fd], list(self.p.poll(0)))
+
+    def test_stop_receive(self):
+        self.p.start_receive(self.rsock.fileno())
+        self.wsock.send(mitogen.core.b('x'))
+        self.p.stop_receive(self.rsock.fileno())
+        self.assertEquals([], list(self.p.poll(0)))
+        self.assertEquals([], self.p.readers)
+
+    def test_stop_receive_unknown(self):
+        self.p.stop_receive(self.rsock.fileno())
+        self.assertEquals([], self.p.readers)
+
+    def test_hangup(self):
+        self.p.start_receive(self.rsock.fileno(), 'data')
+        self.wsock.close()
+        self.assertEquals(['data'], list(self.p.poll(0)))
+
+    def test_readers(self):
+        self.p.start_receive(self.rsock.fileno(), 'data')
+        self.assertEquals([(self.rsock.fileno(), 'data')], self.p.readers)
+
+
+class TransmitMixin(PollerMixin):
+    def test_writable(self):
+        self.p.start_transmit(self.wsock.fileno(), 'data')
+        self.assertEquals(['data'], list(self.p.poll(0)))
+
+    def test_full(self):
+        self.fill(self.wsock)
+        self.p.start_transmit(self.wsock.fileno(), 'data')
+        self.assertEquals([], list(self.p.poll(0)))
+
+    def test_stop_transmit(self):
+        self.p.start_transmit(self.wsock.fileno(), 'data')
+        self.p.stop_transmit(self.wsock.fileno())
+        self.assertEquals([], list(self.p.poll(0)))
+        self.assertEquals([], self.p.writers)
+
+    def test_both_directions(self):
+        fd = self.rsock.fileno()
+        self.p.start_receive(fd, 'r')
+        self.p.start_transmit(fd, 'w')
+        self.assertEquals(['w'], list(self.p.poll(0)))
+        self.wsock.send(mitogen.core.b('x'))
+        self.assertEquals(set(['r', 'w']), set(self.p.poll(0)))
+        self.p.stop_transmit(fd)
+        self.assertEquals(['r'], list(self.p.poll(0)))
+
+
+class TimeoutMixin(PollerMixin):
+    def test_timeout(self):
+        self.p.start_receive(self.rsock.fileno())
+        self.assertEquals([], list(self.p.poll(0.05)))
+
+
+class AllMixin(ReceiveMixin, TransmitMixin, TimeoutMixin):
+    pass
+
+
+class SelectTest(AllMixin, testlib.TestCase):
+    klass = mitogen.core.Poller
+
+
+class PollTest(AllMixin, testlib.TestCase):
+    klass = mitogen.core.PollPoller
+
+    def test_many_fds(self):
+        # poll() is not limited by FD_SETSIZE.
+        if resource.getrlimit(resource.RLIMIT_NOFILE)[0] < 1200:
+            raise unittest2.SkipTest('RLIMIT_NOFILE too low')
+        fds = [os.open(os.devnull, os.O_RDONLY) for x in range(1100)]
+        try:
+            self.p.start_receive(fds[-1], 'data')
+            self.assertEquals(['data'], list(self.p.poll(0)))
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def test_closed_fd_yielded(self):
+        # The owner must be woken so it notices the close and disconnects.
+        rsock, wsock = socket.socketpair()
+        fd = rsock.fileno()
+        self.p.start_receive(fd, 'rdata')
+        self.p.start_transmit(fd, 'wdata')
+        rsock.close()
+        wsock.close()
+        self.assertEquals(['rdata', 'wdata'], list(self.p.poll(0)))
+        self.assertEquals([(fd, 'rdata')], self.p.readers)
+
+    def test_closed_side_disconnects(self):
+        class ReadStream(mitogen.core.BasicStream):
+            def on_receive(self, broker):
+                if not self.receive_side.read():
+                    self.on_disconnect(broker)
+
+        broker = mitogen.core.Broker(poller_class=self.klass)
+        try:
+            rsock, wsock = socket.socketpair()
+            stream = ReadStream()
+            stream.receive_side = mitogen.core.Side(stream, rsock.detach())
+            disconnected = mitogen.core.Latch()
+            mitogen.core.listen(stream, 'disconnect',
+                                lambda: disconnected.put(None))
+            broker.start_receive(stream)
+            testlib.sync_with_broker(broker)
+            # Closed from outside the broker while still registered, then
+            # woken, since closing an fd does not interrupt a sleeping poll().
+            stream.receive_side.close()
+            testlib.sync_with_broker(broker)
+            disconnected.get(timeout=10.0)
+            self.assertFalse(stream.receive_side.fd in
+                             dict(broker.poller.readers))
+            wsock.close()
+        finally:
+            broker.shutdown()
+            broker.join()
+
+PollTest = unittest2.skipIf(
+    condition=not hasattr(select, 'poll'),
+    reason='select.poll() not available',
+)(PollTest)
+
+
+class DefaultTest(testlib.TestCase):
+    def test_broker_default(self):
+        self.assertTrue(mitogen.core.Broker.poller_class is
+                        mitogen.core.DEFAULT_POLLER)
+
+
+class EpollTest(AllMixin, testlib.TestCase):
+    klass = getattr(mitogen.parent, 'EpollPoller', None)
+
+EpollTest = unittest2.skipIf(
+    condition=not hasattr(select, 'epoll'),
+    reason='select.epoll() not available',
+)(EpollTest)
+
+
+
+class EdgeEpollTest(AllMixin, testlib.TestCase):
+    klass = getattr(mitogen.parent, 'EdgeEpollPoller', None)
+
+    def side(self, sock):
+        return mitogen.core.Side(None, os.dup(sock.fileno()))
+
+    def test_write_readiness_cached(self):
+        side = self.side(self.wsock)
+        self.p.start_transmit(side.fd, (side, 'w'))
+        self.assertEquals([(side, 'w')], list(self.p.poll(0)))
+        self.p.stop_transmit(side.fd)
+        self.assertEquals([], list(self.p.poll(0)))
+        # No new edge arrives, but the descriptor is known to be writeable.
+        self.p.start_transmit(side.fd, (side, 'w'))
+        self.assertEquals([(side, 'w')], list(self.p.poll(0)))
+        side.close()
+
+    def test_write_would_block(self):
+        side = self.side(self.wsock)
+        self.p.start_transmit(side.fd, (side, 'w'))
+        for data in self.p.poll(0):
+            while side.write(mitogen.core.b('x') * 65536):
+                pass
+        self.assertTrue(side.would_block)
+        self.assertEquals([], list(self.p.poll(0)))
+        # Draining the peer produces a new edge.
+        self.rsock.setblocking(False)
+        try:
+            while self.rsock.recv(65536):
+                pass
+        except socket.error:
+            pass
+        self.assertEquals([(side, 'w')], list(self.p.poll(1.0)))
+        side.close()
+
+    def test_partial_read_rearmed(self):
+        side = self.side(self.rsock)
+        self.p.start_receive(side.fd, (side, 'r'))
+        self.wsock.send(mitogen.core.b('xy'))
+        for data in self.p.poll(0):
+            self.assertEquals(mitogen.core.b('x'), side.read(1))
+        self.assertFalse(side.would_block)
+        # Input remains, so the kernel reports it again.
+        for data in self.p.poll(0):
+            self.assertEquals(mitogen.core.b('y'), side.read(2))
+        self.assertTrue(side.would_block)
+        self.assertEquals([], list(self.p.poll(0)))
+        side.close()
+
+    def test_fd_reused(self):
+        side = self.side(self.wsock)
+        self.p.start_transmit(side.fd, (side, 'w'))
+        list(self.p.poll(0))
+        self.p.stop_transmit(side.fd)
+
+        rsock, wsock = socket.socketpair()
+        try:
+            side.close()
+            side2 = self.side(rsock)
+            self.assertEquals(side.fd, side2.fd)
+            self.p.start_receive(side2.fd, (side2, 'r'))
+            wsock.send(mitogen.core.b('x'))
+            self.assertEquals([(side2, 'r')], list(self.p.poll(0)))
+            side2.close()
+        finally:
+            rsock.close()
+            wsock.close()
+
+EdgeEpollTest = unittest2.skipIf(
+    condition=not hasattr(select, 'epoll'),
+    reason='select.epoll() not available',
+)(EdgeEpollTest)
+
+
+if __name__ == '__main__':
+    unittest2.main()
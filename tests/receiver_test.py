@@ -36,5 +36,53 @@ class IterationTest(testlib.RouterMixin, testlib.TestCase):
         self.assertEquals(10, ret.get().unpickle())
 
 
+class GetManyTest(testlib.RouterMixin, testlib.TestCase):
+    def test_empty_noblock(self):
+        recv = mitogen.core.Receiver(self.router)
+        self.assertRaises(mitogen.core.TimeoutError,
+            lambda: recv.get_many(block=False))
+
+    def test_max_items(self):
+        recv = mitogen.core.Receiver(self.router)
+        for x in range(5):
+            recv._on_receive(mitogen.core.Message.pickled(x))
+        msgs = recv.get_many(3)
+        self.assertEquals([0, 1, 2], [m.unpickle() for m in msgs])
+        msgs = recv.get_many()
+        self.assertEquals([3, 4], [m.unpickle() for m in msgs])
+
+    def test_dead_ends_batch(self):
+        recv = mitogen.core.Receiver(self.router)
+        recv._on_receive(mitogen.core.Message.pickled(1))
+        recv._on_receive(mitogen.core.Message.pickled(2))
+        recv.close()
+        msgs = recv.get_many()
+        self.assertEquals([1, 2], [m.unpickle() for m in msgs])
+        self.assertRaises(mitogen.core.ChannelError,
+            lambda: recv.get_many())
+
+    def test_dead_with_max_items(self):
+        recv = mitogen.core.Receiver(self.router)
+        for x in range(3):
+            recv._on_receive(mitogen.core.Message.pickled(x))
+        recv._on_receive(mitogen.core.Message.dead())
+        recv._on_receive(mitogen.core.Message.pickled(4))
+        msgs = recv.get_many(2)
+        self.assertEquals([0, 1], [m.unpickle() for m in msgs])
+        msgs = recv.get_many(5)
+        self.assertEquals([2], [m.unpickle() for m in msgs])
+        self.assertRaises(mitogen.core.ChannelError,
+            lambda: recv.get_many(5))
+        msgs = recv.get_many(5)
+        self.assertEquals([4], [m.unpickle() for m in msgs])
+
+    def test_dead_no_throw(self):
+        recv = mitogen.core.Receiver(self.router)
+        recv.close()
+        msgs = recv.get_many(throw_dead=False)
+        self.assertEquals(1, len(msgs))
+        self.assertTrue(msgs[0].is_dead)
+
+
 if __name__ == '__main__':
     unittest2.main()
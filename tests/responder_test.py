@@ -1,13 +1,18 @@
 
+import marshal
 import mock
 import subprocess
 import sys
+import threading
+import time
+import zlib
 
 import unittest2
 
 import mitogen.master
 import testlib
 
+import chain_pkg_a
 import plain_old_module
 import simple_pkg.a
 
@@ -34,6 +39,67 @@ class GoodModulesTest(testlib.RouterMixin, unittest2.TestCase):
         self.assertEquals(output, "['__main__', 50]\n")
 
 
+class SlowResponder(mitogen.master.ModuleResponder):
+    """
+    Delay every GET_MODULE response, as if the child were on a slow link, and
+    record when each request arrived.
+    """
+    latency = 0.2
+
+    def __init__(self, router):
+        super(SlowResponder, self).__init__(router)
+        self.requests = []
+
+    def _on_get_module(self, msg):
+        if msg.is_dead:
+            return
+        names, _, _ = mitogen.core.parse_module_request(msg.data)
+        self.requests.append((time.time(), names))
+        timer = threading.Timer(self.latency, self._router.broker.defer,
+            args=(super(SlowResponder, self)._on_get_module, msg))
+        timer.start()
+
+    def round_trips(self, prefix):
+        """
+        Count sequential rounds of requests for modules beginning with
+        `prefix`. Requests made together arrive within a fraction of the
+        latency; a request made after a response arrived is a new round.
+        """
+        rounds = 0
+        last = None
+        for t, names in self.requests:
+            if not any(name.startswith(prefix) for name in names):
+                continue
+            if last is None or t - last > self.latency / 2:
+                rounds += 1
+            last = t
+        return rounds
+
+
+class SlowRouter(mitogen.master.Router):
+    def upgrade(self):
+        super(SlowRouter, self).upgrade()
+        self.responder = SlowResponder(self)
+
+
+class RoundTripTest(testlib.RouterMixin, testlib.TestCase):
+    router_class = SlowRouter
+
+    def test_related_packages_prefetched(self):
+        # chain_pkg_a imports chain_pkg_b, whose submodule imports
+        # chain_pkg_c. Each is requested when its importer runs, so without
+        # prefetching, this costs one round-trip per package.
+        context = self.router.local()
+        self.assertEquals(4, context.call(chain_pkg_a.func))
+        self.assertEquals(2, self.router.responder.round_trips('chain_pkg'))
+
+    def test_via_forwarder(self):
+        c1 = self.router.local()
+        c2 = self.router.local(via=c1)
+        self.assertEquals(4, c2.call(chain_pkg_a.func))
+        self.assertEquals(2, self.router.responder.round_trips('chain_pkg'))
+
+
 class BrokenModulesTest(unittest2.TestCase):
     def test_obviously_missing(self):
         # Ensure we don't crash in the case of a module legitimately being
@@ -41,6 +107,7 @@ class BrokenModulesTest(unittest2.TestCase):
 
         stream = mock.Mock()
         stream.sent_modules = set()
+        stream.pickle_protocol = 2
         router = mock.Mock()
         router.stream_by_id = lambda n: stream
 
@@ -70,6 +137,7 @@ class BrokenModulesTest(unittest2.TestCase):
 
         stream = mock.Mock()
         stream.sent_modules = set()
+        stream.pickle_protocol = 2
         router = mock.Mock()
         router.stream_by_id = lambda n: stream
 
@@ -89,6 +157,58 @@ class BrokenModulesTest(unittest2.TestCase):
         self.assertIsInstance(msg.unpickle(), tuple)
 
 
+class BytecodeTest(unittest2.TestCase):
+    def get_module(self, tag, ship_bytecode=True):
+        stream = mock.Mock()
+        stream.sent_modules = set()
+        stream.pickle_protocol = 2
+        router = mock.Mock()
+        router.stream_by_id = lambda n: stream
+
+        data = u'plain_old_module'
+        if tag:
+            data += u'\x00@' + tag
+        msg = mitogen.core.Message(data=data.encode(), reply_to=50)
+        msg.router = router
+
+        responder = mitogen.master.ModuleResponder(router)
+        responder.ship_bytecode = ship_bytecode
+        responder._on_get_module(msg)
+        call = router._async_route.mock_calls[0]
+        msg, = call[1]
+        return msg.unpickle()
+
+    def test_matching_tag(self):
+        tup = self.get_module(mitogen.core.BYTECODE_TAG)
+        tag, compressed = tup[5]
+        self.assertEquals(mitogen.core.BYTECODE_TAG, tag)
+        code = marshal.loads(zlib.decompress(compressed))
+        self.assertEquals('master:' + tup[2], code.co_filename)
+
+    def test_other_tag(self):
+        tup = self.get_module(u'1-0')
+        self.assertEquals(5, len(tup))
+
+    def test_no_tag(self):
+        tup = self.get_module(None)
+        self.assertEquals(5, len(tup))
+
+    def test_disabled(self):
+        tup = self.get_module(mitogen.core.BYTECODE_TAG, ship_bytecode=False)
+        self.assertEquals(5, len(tup))
+
+    def test_local_context(self):
+        router = mitogen.master.Router()
+        try:
+            context = router.local()
+            self.assertEquals(256, context.call(plain_old_module.pow, 2, 8))
+            stream = router.stream_by_id(context.context_id)
+            self.assertEquals(mitogen.core.BYTECODE_TAG, stream.bytecode_tag)
+        finally:
+            router.broker.shutdown()
+            router.broker.join()
+
+
 class BlacklistTest(unittest2.TestCase):
     @unittest2.skip('implement me')
     def test_whitelist_no_blacklist(self):
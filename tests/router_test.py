@@ -1,11 +1,15 @@
 import logging
+import os
 import subprocess
+import tempfile
+import threading
 import time
 
 import unittest2
 
 import testlib
 import mitogen.master
+from mitogen.core import b
 import mitogen.parent
 import mitogen.utils
 
@@ -30,8 +34,70 @@ def return_router_max_message_size(router):
     return router.max_message_size
 
 
+@mitogen.core.takes_econtext
+def return_parent_pickle_protocol(econtext):
+    return econtext.stream.pickle_protocol
+
+
+@mitogen.core.takes_econtext
+def return_parent_compression(s, econtext):
+    stream = econtext.stream
+    return (s, stream.compression_level, stream.compression_threshold,
+            stream.tx_compressed)
+
+
+@mitogen.core.takes_router
+def lower_pickle_protocol(context_id, router):
+    router.stream_by_id(context_id).pickle_protocol = 2
+
+
+class Unwhitelisted(object):
+    pass
+
+
+def echo(s):
+    return s
+
+
+@mitogen.core.takes_router
+def return_fragment_stats(router):
+    return (len(router._fragments),
+            sum(stream.tx_fragments
+                for stream in router._stream_by_id.values()))
+
+
 def send_n_sized_reply(sender, n):
     sender.send(' ' * n)
+
+
+@mitogen.core.takes_router
+def make_sink(router):
+    handle = router.add_handler(fn=lambda msg: None, persist=True)
+    return mitogen.core.Sender(
+        mitogen.core.Context(router, mitogen.context_id),
+        handle,
+    )
+
+
+@mitogen.core.takes_router
+def stall_broker(stalled_path, go_path, router):
+    # Stop reading from the parent, creating `stalled_path`, until `go_path`
+    # exists.
+    def wait():
+        open(stalled_path, 'w').close()
+        while not os.path.exists(go_path):
+            time.sleep(0.05)
+    router.broker.defer(wait)
+
+
+@mitogen.core.takes_router
+def send_first_fragment(sender, router):
+    router.route(mitogen.core.Message(
+        dst_id=sender.context.context_id,
+        handle=sender.dst_handle,
+        data=b('x') * 100,
+        more=True,
+    ))
     return 123
 
 
@@ -189,6 +255,37 @@ class AddHandlerTest(unittest2.TestCase):
         self.assertTrue(queue.get(timeout=5).is_dead)
 
 
+class RespondentTest(testlib.RouterMixin, testlib.TestCase):
+    def listeners(self, context):
+        return len(context._signals['disconnect'])
+
+    def test_reply_removes_listener(self):
+        c1 = self.router.fork()
+        c1.call(ping)
+        count = self.listeners(c1)
+        for x in range(20):
+            c1.call(ping)
+        self.assertEquals(count, self.listeners(c1))
+        self.assertEquals({}, self.router._respondent_by_handle)
+
+    def test_del_handler_removes_listener(self):
+        c1 = self.router.fork()
+        c1.call(ping)
+        count = self.listeners(c1)
+        recv = mitogen.core.Receiver(self.router, respondent=c1)
+        self.assertEquals(count + 1, self.listeners(c1))
+        recv.close()
+        self.assertEquals(count, self.listeners(c1))
+
+    def test_disconnect_still_delivers_dead(self):
+        c1 = self.router.fork()
+        recv = mitogen.core.Receiver(self.router, respondent=c1)
+        c1.shutdown(wait=True)
+        self.assertRaises(mitogen.core.ChannelError,
+            lambda: recv.get(timeout=5.0))
+        self.assertEquals({}, self.router._respondent_by_handle)
+
+
 class MessageSizeTest(testlib.BrokerMixin, unittest2.TestCase):
     klass = mitogen.master.Router
 
@@ -228,6 +325,422 @@ class MessageSizeTest(testlib.BrokerMixin, unittest2.TestCase):
         self.assertTrue(expect in logs.stop())
 
 
+class PickleProtocolTest(testlib.RouterMixin, testlib.TestCase):
+    highest = mitogen.core.pickle.HIGHEST_PROTOCOL
+    #: Protocol 4 pickle missing the argument of its first opcode.
+    truncated_pickle = mitogen.core.BytesType(bytearray([0x80, 0x04, 0x4b]))
+
+    def test_negotiated(self):
+        # Both ends run the same interpreter, so the highest protocol is used.
+        child = self.router.fork()
+        self.assertEquals(self.highest,
+                          child.call(return_parent_pickle_protocol))
+        stream = self.router.stream_by_id(child.context_id)
+        self.assertEquals(self.highest, stream.pickle_protocol)
+        self.assertEquals(self.highest,
+                          self.router.get_pickle_protocol(child.context_id))
+
+    def test_local_and_unknown(self):
+        self.assertEquals(self.highest,
+                          self.router.get_pickle_protocol(mitogen.context_id))
+        self.assertEquals(2, self.router.get_pickle_protocol(1234))
+
+    def test_transcode(self):
+        obj = (mitogen.core.Blob(os.urandom(16)), u'x', [1, None])
+        msg = mitogen.core.Message.pickled(obj, protocol=self.highest)
+        self.router._transcode(msg, 2)
+        self.assertEquals(2, ord(msg.data[1:2]))
+        self.assertEquals(obj, msg.unpickle())
+
+    def test_transcode_not_pickle(self):
+        data = mitogen.core.BytesType(bytearray([0x80, 0x7f])) + b('garbage')
+        msg = mitogen.core.Message(data=data)
+        self.router._transcode(msg, 2)
+        self.assertEquals(data, msg.data)
+
+    def test_transcode_same_protocol(self):
+        # Not unpickled at all, so not even the whitelist is consulted.
+        msg = mitogen.core.Message.pickled(Unwhitelisted(),
+                                           protocol=self.highest)
+        data = msg.data
+        self.router._transcode(msg, self.highest)
+        self.assertTrue(data is msg.data)
+
+    def test_transcode_truncated(self):
+        msg = mitogen.core.Message(data=self.truncated_pickle)
+        e = self.assertRaises(mitogen.core.StreamError,
+                              lambda: self.router._transcode(msg, 2))
+        self.assertTrue('only supports pickle protocol 2' in str(e))
+
+    def test_relay_refuses_untranscodable(self):
+        relay = self.router.fork()
+        child = self.router.fork(via=relay)
+        relay.call(lower_pickle_protocol, child.context_id)
+        recv = mitogen.core.Receiver(self.router)
+        self.router.route(mitogen.core.Message.pickled(
+            Unwhitelisted(),
+            protocol=self.highest,
+            dst_id=child.context_id,
+            handle=12345,
+            reply_to=recv.handle,
+        ))
+        e = self.assertRaises(mitogen.core.CallError,
+                              lambda: recv.get().unpickle())
+        self.assertTrue('only supports pickle protocol 2' in str(e))
+        self.assertEquals(1, child.call(echo, 1))
+
+    @unittest2.skipIf(condition=testlib.get_python2() is None,
+                      reason='no working Python 2 interpreter found')
+    def test_relay_survives_truncated_pickle(self):
+        # The relay must transcode for its Python 2 child, which can only
+        # read protocol 2.
+        relay = self.router.local()
+        child = self.router.local(via=relay,
+                                  python_path=testlib.get_python2())
+        recv = mitogen.core.Receiver(self.router)
+        self.router.route(mitogen.core.Message(
+            dst_id=child.context_id,
+            handle=12345,
+            data=self.truncated_pickle,
+            reply_to=recv.handle,
+        ))
+        self.assertRaises(mitogen.core.CallError,
+                          lambda: recv.get().unpickle())
+        self.assertEquals(1, child.call(echo, 1))
+        self.assertEquals(2, relay.call(echo, 2))
+
+PickleProtocolTest = unittest2.skipIf(
+    condition=mitogen.core.pickle.HIGHEST_PROTOCOL == 2,
+    reason='pickle protocol 2 is the highest available',
+)(PickleProtocolTest)
+
+
+class CompressionTest(testlib.RouterMixin, testlib.TestCase):
+    def test_configured(self):
+        child = self.router.fork(compression_level=6,
+                                 compression_threshold=1000)
+        stream = self.router.stream_by_id(child.context_id)
+        s = ' ' * 10000
+        self.assertEquals((s, 6, 1000, 0),
+                          child.call(return_parent_compression, s))
+        self.assertEquals(1, stream.tx_compressed)
+        # The child compressed its reply to the previous call.
+        self.assertEquals(1, child.call(return_parent_compression, '')[3])
+
+    def test_default_disabled(self):
+        child = self.router.fork()
+        stream = self.router.stream_by_id(child.context_id)
+        s = ' ' * 10000
+        self.assertEquals((s, 0, stream.compression_threshold, 0),
+                          child.call(return_parent_compression, s))
+        self.assertEquals(0, stream.tx_compressed)
+
+
+class FragmentTest(testlib.RouterMixin, testlib.TestCase):
+    size = 2 * mitogen.core.Stream.fragment_size + 1
+
+    def test_roundtrip(self):
+        child = self.router.fork()
+        stream = self.router.stream_by_id(child.context_id)
+        s = 'x' * self.size
+        self.assertEquals(s, child.call(echo, s))
+        self.assertEquals(3, stream.tx_fragments)
+        # The reply was fragmented by the child and reassembled here.
+        self.assertEquals((0, 3), child.call(return_fragment_stats))
+        self.assertEquals({}, self.router._fragments)
+
+    def test_relayed(self):
+        child1 = self.router.fork()
+        child2 = self.router.fork(via=child1)
+        # Ensure child1 learned child2's pickle protocol, otherwise it must
+        # reassemble messages to transcode them.
+        child2.call(echo, '')
+        s = 'x' * self.size
+        self.assertEquals(s, child2.call(echo, s))
+        # child1 forwarded fragments without reassembling or splitting them.
+        self.assertEquals((0, 0), child1.call(return_fragment_stats))
+
+    def test_relayed_sender_dies(self):
+        child1 = self.router.fork()
+        child2 = self.router.fork(via=child1)
+        recv = mitogen.core.Receiver(self.router)
+        child2.call(send_first_fragment, recv.to_sender())
+        self.sync_with_broker()
+        self.assertEquals(1, len(self.router._fragments))
+
+        # child1 stays connected, but sends DEL_ROUTE for child2.
+        latch = mitogen.core.Latch()
+        mitogen.core.listen(child2, 'disconnect', lambda: latch.put(None))
+        child2.call_no_reply(os._exit, 0)
+        latch.get(timeout=10.0)
+        self.sync_with_broker()
+        self.assertEquals({}, self.router._fragments)
+        self.assertEquals(1, child1.call(echo, 1))
+
+    def test_receiver_fragments(self):
+        child = self.router.fork()
+        recv = mitogen.core.Receiver(self.router, fragments=True)
+        child.call(send_n_sized_reply, recv.to_sender(), self.size)
+        msgs = [recv.get(), recv.get(), recv.get()]
+        self.assertEquals([True, True, False], [msg.more for msg in msgs])
+        msg = mitogen.core.Message(data=b('').join(m.data for m in msgs))
+        self.assertEquals(' ' * self.size, msg.unpickle())
+
+    def test_max_message_size_exceeded(self):
+        self.router.max_message_size = 1000
+        recv = mitogen.core.Receiver(self.router)
+        logs = testlib.LogCapturer()
+        logs.start()
+        for more in True, True, False:
+            self.router.route(mitogen.core.Message(
+                dst_id=mitogen.context_id,
+                handle=recv.handle,
+                data=b('x') * 400,
+                more=more,
+            ))
+        sem = mitogen.core.Latch()
+        self.router.broker.defer(sem.put, ' ')
+        sem.get()
+        self.assertTrue('fragmented message too large' in logs.stop())
+        self.assertEquals({}, self.router._fragments)
+        self.assertTrue(recv.empty())
+
+    def test_priority_interleaved(self):
+        recv = mitogen.core.Receiver(self.router)
+        for data, more, priority in ((b('a'), True, False),
+                                     (b('p'), False, True),
+                                     (b('b'), False, False)):
+            self.router.route(mitogen.core.Message(
+                dst_id=mitogen.context_id,
+                handle=recv.handle,
+                data=data,
+                more=more,
+                priority=priority,
+            ))
+        # The priority message is not taken as the bulk message's last
+        # fragment.
+        self.assertEquals(b('p'), recv.get().data)
+        self.assertEquals(b('ab'), recv.get().data)
+        self.assertEquals({}, self.router._fragments)
+
+
+class FakeStream(object):
+    pickle_protocol = 2
+    low_watermark = 100
+    congested = False
+    pending = 0
+
+    def __init__(self):
+        self.transmit_side = mitogen.core.Side(self, os.open('/dev/null',
+                                                             os.O_WRONLY))
+        self.sent = []
+        self.tx_waits = 0
+
+    def pending_bytes(self):
+        return self.pending
+
+    def _send(self, msg):
+        self.sent.append(msg)
+
+
+class FlowControlTest(testlib.RouterMixin, testlib.TestCase):
+    def setUp(self):
+        super(FlowControlTest, self).setUp()
+        self.stream = FakeStream()
+        self.router._stream_by_id[1234] = self.stream
+
+    def tearDown(self):
+        self.stream.transmit_side.close()
+        super(FlowControlTest, self).tearDown()
+
+    def msg(self, **kwargs):
+        return mitogen.core.Message(dst_id=1234, handle=999, **kwargs)
+
+    def test_not_congested(self):
+        self.router.route(self.msg(), block=True, timeout=0)
+
+    def test_default_nonblocking(self):
+        self.stream.congested = True
+        self.router.route(self.msg())
+        self.assertEquals(0, self.stream.tx_waits)
+
+    def test_would_block(self):
+        self.stream.congested = True
+        self.assertRaises(mitogen.core.TimeoutError,
+            lambda: self.router.route(self.msg(), block=True, timeout=0))
+
+    def test_timeout(self):
+        self.stream.congested = True
+        self.assertRaises(mitogen.core.TimeoutError,
+            lambda: self.router.route(self.msg(), block=True, timeout=0.1))
+        self.assertEquals(1, self.stream.tx_waits)
+        self.assertEquals(0, self.router._flow_waiters)
+
+    def test_priority_not_blocked(self):
+        self.stream.congested = True
+        self.router.route(self.msg(priority=True), block=True, timeout=0)
+        self.router.route(mitogen.core.Message(dst_id=1234,
+                                               handle=mitogen.core.ADD_ROUTE),
+                          block=True, timeout=0)
+
+    def test_wakes_when_drained(self):
+        self.stream.congested = True
+        latch = mitogen.core.Latch()
+        def send():
+            self.router.route(self.msg(), block=True)
+            latch.put(True)
+        th = threading.Thread(target=send)
+        th.start()
+        try:
+            self.assertRaises(mitogen.core.TimeoutError,
+                              lambda: latch.get(timeout=0.1))
+            self.stream.congested = False
+            self.router._notify_writable()
+            self.assertTrue(latch.get(timeout=5.0))
+        finally:
+            th.join()
+
+    def test_wakes_on_disconnect(self):
+        self.stream.congested = True
+        latch = mitogen.core.Latch()
+        def send():
+            self.router.route(self.msg(), block=True)
+            latch.put(True)
+        th = threading.Thread(target=send)
+        th.start()
+        try:
+            self.stream.transmit_side.close()
+            self.router._notify_writable()
+            self.assertTrue(latch.get(timeout=5.0))
+        finally:
+            th.join()
+
+    def test_budget(self):
+        self.router.max_queued_bytes = 1000
+        self.router._queued_bytes = 1001
+        self.stream.pending = 1001
+        self.assertRaises(mitogen.core.TimeoutError,
+            lambda: self.router.route(self.msg(), block=True, timeout=0))
+        # Streams holding less than their low watermark are not blocked.
+        other = FakeStream()
+        other.pending = 50
+        self.router._stream_by_id[5678] = other
+        try:
+            self.router.route(mitogen.core.Message(dst_id=5678, handle=999),
+                              block=True, timeout=0)
+        finally:
+            other.transmit_side.close()
+        self.router.max_queued_bytes = 0
+        self.router.route(self.msg(), block=True, timeout=0)
+        self.router._queued_bytes = 0
+
+
+class CongestionTest(testlib.RouterMixin, testlib.TestCase):
+    chunk = mitogen.core.Blob(b('x') * 65536)
+
+    def test_disconnect_clears_congested(self):
+        child = self.router.fork()
+        stream = self.router.stream_by_id(child.context_id)
+        stream.congested = True
+        self.broker.defer(stream.on_disconnect, self.broker)
+        self.sync_with_broker()
+        self.assertFalse(stream.congested)
+
+    def test_producer_stalls_and_resumes(self):
+        child = self.router.fork()
+        stream = self.router.stream_by_id(child.context_id)
+        stream.high_watermark = 1048576
+        stream.low_watermark = 262144
+        sender = child.call(make_sink)
+
+        tmpdir = tempfile.mkdtemp()
+        stalled_path = os.path.join(tmpdir, 'stalled')
+        go_path = os.path.join(tmpdir, 'go')
+        stalled = child.call_async(stall_broker, stalled_path, go_path)
+        deadline = time.time() + 10.0
+        while not os.path.exists(stalled_path) and time.time() < deadline:
+            time.sleep(0.05)
+
+        resumed_at = []
+        def produce():
+            # Messages are queued by the broker after send() returns, so the
+            # producer only notices congestion once it caught up.
+            while not resumed_at:
+                waits = stream.tx_waits
+                sender.send(self.chunk, block=True)
+                if stream.tx_waits != waits:
+                    resumed_at.append(stream.pending_bytes())
+        th = threading.Thread(target=produce)
+        th.start()
+        try:
+            while not stream.tx_waits and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertEquals(1, stream.tx_waits)
+            # Let the broker queue messages sent before the producer blocked.
+            self.sync_with_broker()
+            self.assertTrue(stream.congested)
+            queued = stream.pending_bytes()
+            self.assertTrue(queued > stream.high_watermark)
+            time.sleep(0.2)
+            # The producer is blocked, so nothing more was queued.
+            self.assertEquals(queued, stream.pending_bytes())
+            self.assertEquals([], resumed_at)
+        finally:
+            open(go_path, 'w').close()
+            th.join(10.0)
+            os.unlink(go_path)
+            os.unlink(stalled_path)
+            os.rmdir(tmpdir)
+
+        self.assertFalse(th.is_alive())
+        stalled.get()
+        # It resumed once the stream drained to its low watermark, plus at
+        # most one chunk queued by the broker since.
+        self.assertTrue(resumed_at[0] <= stream.low_watermark +
+                        len(self.chunk) + 64)
+        self.assertEquals(1, child.call(echo, 1))
+
+
+class DisconnectTest(testlib.RouterMixin, testlib.TestCase):
+    def add_contexts(self, stream, ids):
+        disconnected = []
+        for context_id in ids:
+            context = mitogen.core.Context(self.router, context_id)
+            mitogen.core.listen(context, 'disconnect',
+                lambda context_id=context_id: disconnected.append(context_id))
+            self.router._context_by_id[context_id] = context
+            self.router._add_route(context_id, stream)
+        return disconnected
+
+    def test_only_affected_contexts(self):
+        stream1 = object()
+        stream2 = object()
+        gone = self.add_contexts(stream1, range(1000, 3000))
+        kept = self.add_contexts(stream2, range(3000, 3010))
+        self.router.on_stream_disconnect(stream1)
+        self.assertEquals(list(range(1000, 3000)), sorted(gone))
+        self.assertEquals([], kept)
+        self.assertEquals(None, self.router._stream_by_id.get(1000))
+        self.assertEquals(stream2, self.router._stream_by_id[3000])
+        self.assertFalse(stream1 in self.router._ids_by_stream)
+
+    def test_rerouted_context_not_disconnected(self):
+        stream1 = object()
+        stream2 = object()
+        gone = self.add_contexts(stream1, [1000, 1001])
+        self.router._add_route(1001, stream2)
+        self.router.on_stream_disconnect(stream1)
+        self.assertEquals([1000], gone)
+        self.assertEquals(stream2, self.router._stream_by_id[1001])
+
+    def test_del_route(self):
+        stream = object()
+        self.add_contexts(stream, [1000])
+        self.router._del_route(1000)
+        self.assertEquals({}, self.router._ids_by_stream)
+        self.assertRaises(KeyError, lambda: self.router._del_route(1000))
+
+
 class NoRouteTest(testlib.RouterMixin, testlib.TestCase):
     def test_invalid_handle_returns_dead(self):
         # Verify sending a message to an invalid handle yields a dead message
@@ -314,5 +827,70 @@ class UnidirectionalTest(testlib.RouterMixin, testlib.TestCase):
         self.assertTrue('policy refused message: ' in logs.stop())
 
 
+class ConnectManyTest(testlib.RouterMixin, testlib.TestCase):
+    def test_one_receiver_per_spec(self):
+        recvs = self.router.connect_many([(u'local', {})] * 4,
+                                         max_parallel=2)
+        self.assertEquals(4, len(recvs))
+        for x, recv in enumerate(recvs):
+            context = recv.get().unpickle()
+            self.assertEquals(context, self.router.context_by_id(
+                context.context_id))
+            self.assertEquals(x, context.call(int, x))
+
+    def test_failure_does_not_abort_batch(self):
+        recvs = self.router.connect_many([
+            (u'local', {'python_path': '/nonexistent/python'}),
+            (u'local', {}),
+        ])
+        e = self.assertRaises(mitogen.core.CallError,
+                              lambda: recvs[0].get().unpickle())
+        self.assertTrue('/nonexistent/python' in str(e))
+        context = recvs[1].get().unpickle()
+        self.assertEquals(1, context.call(int, 1))
+
+    def test_select(self):
+        import mitogen.select
+        recvs = self.router.connect_many([(u'local', {})] * 3)
+        select = mitogen.select.Select(recvs)
+        contexts = [msg.unpickle() for msg in select]
+        self.assertEquals(3, len(set(c.context_id for c in contexts)))
+
+    def test_broker_shutdown(self):
+        recvs = self.router.connect_many([(u'local', {})] * 4,
+                                         max_parallel=1)
+        recvs[0].get().unpickle()
+        prefix = 'mitogen.parent.Router.%x.connector-' % (id(self.router),)
+        threads = [th for th in threading.enumerate()
+                   if th.getName().startswith(prefix)]
+        self.broker.shutdown()
+        self.broker.join()
+        for th in threads:
+            th.join(10.0)
+            self.assertFalse(th.is_alive())
+        self.assertRaises(mitogen.core.ChannelError, recvs[-1].get)
+
+    def test_registered_context(self):
+        recvs = self.router.connect_many([(u'local', {})])
+        context = recvs[0].get().unpickle()
+        self.assertTrue(context is self.router.context_by_id(
+            context.context_id))
+        latch = mitogen.core.Latch()
+        mitogen.core.listen(context, 'disconnect', lambda: latch.put(None))
+        context.shutdown(wait=True)
+        latch.get(timeout=10.0)
+
+    def test_bad_max_parallel(self):
+        self.assertRaises(ValueError,
+            lambda: self.router.connect_many([], max_parallel=0))
+
+    def test_empty_specs(self):
+        signals = vars(self.broker).get('_signals', {})
+        before = list(signals.get('shutdown', []))
+        self.assertEquals([], self.router.connect_many([]))
+        signals = vars(self.broker).get('_signals', {})
+        self.assertEquals(before, signals.get('shutdown', []))
+
+
 if __name__ == '__main__':
     unittest2.main()
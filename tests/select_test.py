@@ -269,5 +269,76 @@ class GetTest(testlib.RouterMixin, testlib.TestCase):
             lambda: select.get(timeout=0.0))
 
 
+class GetManyTest(testlib.RouterMixin, testlib.TestCase):
+    klass = mitogen.select.Select
+
+    def test_no_receivers(self):
+        select = self.klass()
+        exc = self.assertRaises(mitogen.select.Error,
+            lambda: select.get_many())
+        self.assertEquals(str(exc), self.klass.empty_msg)
+
+    def test_zero_timeout(self):
+        recv = mitogen.core.Receiver(self.router)
+        select = self.klass([recv])
+        self.assertRaises(mitogen.core.TimeoutError,
+            lambda: select.get_many(timeout=0.0))
+
+    def test_several_receivers(self):
+        recv1 = mitogen.core.Receiver(self.router)
+        recv2 = mitogen.core.Receiver(self.router)
+        select = self.klass([recv1, recv2], oneshot=False)
+        recv1._on_receive(mitogen.core.Message.pickled(1))
+        recv2._on_receive(mitogen.core.Message.pickled(2))
+        recv1._on_receive(mitogen.core.Message.pickled(3))
+        msgs = select.get_many()
+        self.assertEquals([1, 3, 2], [m.unpickle() for m in msgs])
+        self.assertEquals([recv1, recv1, recv2], [m.receiver for m in msgs])
+        self.assertTrue(select.empty())
+
+    def test_max_items(self):
+        recv = mitogen.core.Receiver(self.router)
+        select = self.klass([recv], oneshot=False)
+        for x in range(3):
+            recv._on_receive(mitogen.core.Message.pickled(x))
+        self.assertEquals([0, 1], [m.unpickle() for m in select.get_many(2)])
+        self.assertEquals([2], [m.unpickle() for m in select.get_many(2)])
+
+    def test_oneshot(self):
+        recv = mitogen.core.Receiver(self.router)
+        select = self.klass([recv])
+        recv._on_receive(mitogen.core.Message.pickled(1))
+        recv._on_receive(mitogen.core.Message.pickled(2))
+        self.assertEquals([1], [m.unpickle() for m in select.get_many()])
+        self.assertEquals([], select._receivers)
+
+    def test_dead_after_messages(self):
+        recv1 = mitogen.core.Receiver(self.router)
+        recv2 = mitogen.core.Receiver(self.router)
+        select = self.klass([recv1, recv2], oneshot=False)
+        recv1._on_receive(mitogen.core.Message.pickled(1))
+        recv2._on_receive(mitogen.core.Message.dead())
+        msgs = select.get_many()
+        self.assertEquals([1], [m.unpickle() for m in msgs])
+        self.assertRaises(mitogen.core.ChannelError,
+            lambda: select.get_many(timeout=0.0))
+
+    def test_dead_with_max_items(self):
+        recv1 = mitogen.core.Receiver(self.router)
+        recv2 = mitogen.core.Receiver(self.router)
+        select = self.klass([recv1, recv2], oneshot=False)
+        recv1._on_receive(mitogen.core.Message.pickled(1))
+        recv1._on_receive(mitogen.core.Message.dead())
+        recv2._on_receive(mitogen.core.Message.pickled(2))
+        recv1._on_receive(mitogen.core.Message.pickled(3))
+        recv2._on_receive(mitogen.core.Message.pickled(4))
+        msgs = select.get_many(3)
+        self.assertEquals([1, 2], [m.unpickle() for m in msgs])
+        self.assertRaises(mitogen.core.ChannelError,
+            lambda: select.get_many(timeout=0.0))
+        msgs = select.get_many(timeout=0.0)
+        self.assertEquals([3, 4], [m.unpickle() for m in msgs])
+
+
 if __name__ == '__main__':
     unittest2.main()
@@ -11,6 +11,8 @@ import unittest2
 import mitogen.core
 from mitogen.core import b
 
+import testlib
+
 
 def roundtrip(v):
     msg = mitogen.core.Message.pickled(v)
@@ -33,5 +35,46 @@ class BlobTest(unittest2.TestCase):
         self.assertEquals(b(''), roundtrip(v))
 
 
+class OutOfBandTest(testlib.RouterMixin, testlib.TestCase):
+    def roundtrip(self, v):
+        msg = mitogen.core.Message.pickled(v, protocol=5)
+        return msg, mitogen.core.Message(data=msg.data).unpickle()
+
+    def test_large_blob(self):
+        v = (mitogen.core.Blob(b('x') * 65536), mitogen.core.Blob(b('y')))
+        msg, result = self.roundtrip(v)
+        self.assertEquals(mitogen.core._OOB_PREFIX,
+                          msg.data[:mitogen.core._OOB_PREFIX_LEN])
+        self.assertEquals(v, result)
+        self.assertEquals(mitogen.core.Blob, type(result[0]))
+        self.assertEquals(mitogen.core.Blob, type(result[1]))
+
+    def test_small_blob_inband(self):
+        v = mitogen.core.Blob(b('x') * 10)
+        msg, result = self.roundtrip(v)
+        self.assertEquals(5, ord(msg.data[1:2]))
+        self.assertEquals(v, result)
+
+    def test_truncated(self):
+        msg = mitogen.core.Message.pickled(
+            mitogen.core.Blob(b('x') * 65536),
+            protocol=5,
+        )
+        msg = mitogen.core.Message(data=msg.data[:1000])
+        self.assertRaises(mitogen.core.StreamError, msg.unpickle)
+
+    def test_transcode(self):
+        v = [mitogen.core.Blob(b('x') * 65536)]
+        msg = mitogen.core.Message.pickled(v, protocol=5)
+        self.router._transcode(msg, 4)
+        self.assertEquals(4, ord(msg.data[1:2]))
+        self.assertEquals(v, msg.unpickle())
+
+OutOfBandTest = unittest2.skipIf(
+    condition=mitogen.core.pickle.HIGHEST_PROTOCOL < 5,
+    reason='pickle protocol 5 unavailable',
+)(OutOfBandTest)
+
+
 if __name__ == '__main__':
     unittest2.main()
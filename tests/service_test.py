@@ -1,3 +1,8 @@
+import os
+import sys
+import tempfile
+import time
+
 import unittest2
 
 import mitogen.core
@@ -32,10 +37,69 @@ class MyService2(MyService):
     """
 
 
+class BlockingService(mitogen.service.Service):
+    def __init__(self, router):
+        super(BlockingService, self).__init__(router)
+        self.gate = mitogen.core.Latch()
+        self.ready = mitogen.core.Latch()
+        self.done = mitogen.core.Latch()
+
+    @mitogen.service.expose(policy=mitogen.service.AllowAny())
+    @mitogen.service.no_reply()
+    def hold(self):
+        self.gate.get(timeout=5.0)
+
+    @mitogen.service.expose(policy=mitogen.service.AllowAny())
+    @mitogen.service.no_reply()
+    def wait(self):
+        self.done.put(self.ready.get(timeout=5.0))
+
+    @mitogen.service.expose(policy=mitogen.service.AllowAny())
+    @mitogen.service.no_reply()
+    def release(self):
+        self.ready.put('released')
+
+
 def call_service_in(context, service_name, method_name):
     return context.call_service(service_name, method_name)
 
 
+@mitogen.core.takes_router
+def get_file_from_parent(path, router):
+    fp = tempfile.TemporaryFile()
+    try:
+        context = mitogen.core.Context(router, mitogen.parent_id)
+        ok, metadata = mitogen.service.FileService.get(context, path, fp)
+        fp.seek(0)
+        return ok, metadata['size'], fp.read()
+    finally:
+        fp.close()
+
+
+@mitogen.core.takes_router
+def send_to_parent(handle, router):
+    recv = mitogen.core.Receiver(router)
+    router.route(
+        mitogen.core.Message(
+            dst_id=mitogen.parent_id,
+            handle=handle,
+            reply_to=recv.handle,
+        )
+    )
+    try:
+        recv.get().unpickle()
+    except mitogen.core.CallError:
+        e = sys.exc_info()[1]
+        return str(e)
+
+
+@mitogen.core.takes_router
+def get_pushed_file(path, router):
+    pool = mitogen.service.get_or_create_pool(router=router)
+    service = pool.get_service(mitogen.service.PushFileService.name())
+    return service.get(path)
+
+
 class ActivationTest(testlib.RouterMixin, testlib.TestCase):
     def test_parent_can_activate(self):
         l1 = self.router.fork()
@@ -89,5 +153,106 @@ class PermissionTest(testlib.RouterMixin, testlib.TestCase):
         self.assertTrue(msg in exc.args[0])
 
 
+class PoolBatchTest(testlib.RouterMixin, testlib.TestCase):
+    def message(self, method_name):
+        msg = mitogen.core.Message.pickled(
+            (BlockingService.name(), method_name, {}),
+            handle=mitogen.core.CALL_SERVICE,
+        )
+        msg.src_id = mitogen.context_id
+        msg.auth_id = mitogen.context_id
+        return msg
+
+    def call(self, pool, method_name):
+        pool._receiver._on_receive(self.message(method_name))
+
+    def test_blocked_method_does_not_delay_batch(self):
+        service = BlockingService(self.router)
+        pool = mitogen.service.Pool(self.router, [service], size=2)
+        try:
+            # Occupy both workers, so wait() and release() queue up and are
+            # taken together by whichever worker is freed first.
+            self.call(pool, 'hold')
+            self.call(pool, 'hold')
+            self.call(pool, 'wait')
+            self.call(pool, 'release')
+            service.gate.put(None)
+            service.gate.put(None)
+            self.assertEquals('released', service.done.get(timeout=5.0))
+        finally:
+            pool.stop()
+
+    def test_backlog_wakes_idle_worker(self):
+        service = BlockingService(self.router)
+        pool = mitogen.service.Pool(self.router, [service], size=1)
+        try:
+            deadline = time.time() + 5.0
+            while pool._idle != 1 and time.time() < deadline:
+                time.sleep(0.01)
+            # Act as a second worker that took a batch, leaving the rest for
+            # the sleeping worker, which only the handoff can wake.
+            pool._backlog_lock.acquire()
+            pool._idle += 1
+            pool._backlog_lock.release()
+            msg = self.message('release')
+            msg.receiver = pool._receiver
+            pool._extend_backlog([msg])
+            self.assertEquals('released', service.ready.get(timeout=5.0))
+        finally:
+            pool.stop()
+
+    def test_handoff_refuses_network(self):
+        pool = mitogen.service.Pool(self.router, [])
+        try:
+            child = self.router.fork()
+            e = child.call(send_to_parent, pool._handoff.handle)
+            self.assertTrue(self.router.refused_msg in e)
+        finally:
+            pool.stop()
+
+
+class FileServiceTest(testlib.RouterMixin, testlib.TestCase):
+    def test_get(self):
+        # Several windows' worth, so the transfer depends on acknowledgements.
+        data = os.urandom(3 * mitogen.service.FileService.window_size_bytes)
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, data)
+            os.close(fd)
+            service = mitogen.service.FileService(self.router)
+            service.register(path)
+            pool = mitogen.service.Pool(self.router, [service])
+            try:
+                child = self.router.fork()
+                self.assertEquals((True, len(data), data),
+                                  child.call(get_file_from_parent, path))
+            finally:
+                pool.stop()
+        finally:
+            os.unlink(path)
+
+
+class PushFileServiceTest(testlib.RouterMixin, testlib.TestCase):
+    def test_congested_child_does_not_stall(self):
+        data = os.urandom(4096)
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, data)
+            os.close(fd)
+            service = mitogen.service.PushFileService(router=self.router)
+            service.forward_timeout = 0.1
+            child = self.router.fork()
+            stream = self.router.stream_by_id(child.context_id)
+            # Never drains while nothing is sent, so the wait must time out.
+            stream.congested = True
+            t0 = time.time()
+            service.propagate_to(child, path)
+            self.assertTrue(time.time() - t0 < 5.0)
+            self.assertEquals(1, stream.tx_waits)
+            self.assertEquals(data, child.call(get_pushed_file, path))
+        finally:
+            os.unlink(path)
+
+
 if __name__ == '__main__':
     unittest2.main()
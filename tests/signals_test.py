@@ -0,0 +1,51 @@
+
+import unittest2
+
+import mitogen.core
+
+import testlib
+
+
+class Thing(object):
+    pass
+
+
+class ListenFireTest(testlib.TestCase):
+    def test_no_listeners(self):
+        self.assertEquals([], mitogen.core.fire(Thing(), 'event'))
+
+    def test_fired_in_order(self):
+        thing = Thing()
+        mitogen.core.listen(thing, 'event', lambda x: ('a', x))
+        mitogen.core.listen(thing, 'event', lambda x: ('b', x))
+        self.assertEquals([('a', 1), ('b', 1)],
+                          mitogen.core.fire(thing, 'event', 1))
+
+
+class UnlistenTest(testlib.TestCase):
+    def test_unlisten(self):
+        thing = Thing()
+        func = lambda: 'a'
+        mitogen.core.listen(thing, 'event', func)
+        mitogen.core.listen(thing, 'event', lambda: 'b')
+        mitogen.core.unlisten(thing, 'event', func)
+        self.assertEquals(['b'], mitogen.core.fire(thing, 'event'))
+
+    def test_not_registered(self):
+        thing = Thing()
+        self.assertRaises(ValueError,
+            lambda: mitogen.core.unlisten(thing, 'event', lambda: None))
+
+    def test_unlisten_while_firing(self):
+        thing = Thing()
+        def first():
+            mitogen.core.unlisten(thing, 'event', first)
+            return 'a'
+        mitogen.core.listen(thing, 'event', first)
+        mitogen.core.listen(thing, 'event', lambda: 'b')
+        self.assertEquals(['a', 'b'], mitogen.core.fire(thing, 'event'))
+        self.assertEquals(['b'], mitogen.core.fire(thing, 'event'))
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,71 @@
+"""
+Connect thousands of contexts, then tear them all down, reporting time spent
+in Router.on_stream_disconnect(). Before the router kept an index of contexts
+by stream, each disconnect scanned every known context, so a mass disconnect
+cost O(n^2).
+
+    disconnect.py [count [fork|local]]
+"""
+
+import resource
+import sys
+import time
+
+import mitogen
+import mitogen.core
+
+# Exclude time the broker thread spends preempted, where possible.
+clock = getattr(time, 'thread_time', time.time)
+
+
+def raise_fd_limit(count):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = 4 * count + 100
+    if hard != resource.RLIM_INFINITY:
+        want = min(want, hard)
+    if soft < want:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+
+
+def instrument(router):
+    stats = {'calls': 0, 'secs': 0.0}
+    real = router.on_stream_disconnect
+
+    def on_stream_disconnect(stream):
+        t0 = clock()
+        try:
+            return real(stream)
+        finally:
+            stats['calls'] += 1
+            stats['secs'] += clock() - t0
+
+    router.on_stream_disconnect = on_stream_disconnect
+    return stats
+
+
+@mitogen.main()
+def main(router):
+    count = int((sys.argv[1:2] or ['2000'])[0])
+    method = (sys.argv[2:3] or ['fork'])[0]
+    raise_fd_limit(count)
+    stats = instrument(router)
+
+    t0 = time.time()
+    contexts = []
+    for x in range(count):
+        contexts.append(getattr(router, method)())
+    print('connected %d contexts in %.2fs' % (count, time.time() - t0))
+    sys.stdout.flush()
+
+    latch = mitogen.core.Latch()
+    for context in contexts:
+        mitogen.core.listen(context, 'disconnect', lambda: latch.put(None))
+
+    t0 = time.time()
+    for context in contexts:
+        context.shutdown()
+    for context in contexts:
+        latch.get()
+    print('disconnected in %.2fs, %d on_stream_disconnect() calls '
+          'took %.1f ms total' % (time.time() - t0, stats['calls'],
+                                  1000 * stats['secs']))
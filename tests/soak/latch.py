@@ -2,50 +2,151 @@
 Used for stressing Latch.get/put. Swap the number of producer/consumer threads
 below to try both -- there are many conditions in the Latch code that require
 testing of both.
+
+    latch.py                        Compare socketpair and eventfd wake engines.
+    latch.py stress [socketpair|eventfd]
+                                    Stress one engine until interrupted.
 """
 
 import logging
+import os
 import random
+import sys
 import threading
 import time
 import mitogen.core
 import mitogen.utils
 
-mitogen.utils.log_to_file()
-mitogen.core.IOLOG.setLevel(logging.DEBUG)
-mitogen.core._v = True
-mitogen.core._vv = True
+LOG = logging.getLogger(__name__)
+
+
+class SocketpairLatch(mitogen.core.Latch):
+    use_eventfd = False
+
+
+class EventfdLatch(mitogen.core.Latch):
+    use_eventfd = True
+
+
+ENGINES = {
+    'socketpair': SocketpairLatch,
+    'eventfd': EventfdLatch,
+}
 
-l = mitogen.core.Latch()
-consumed = 0
-produced = 0
-crash = 0
 
-def cons():
-    global consumed, crash
-    try:
+def stress(klass):
+    mitogen.utils.log_to_file()
+    mitogen.core.IOLOG.setLevel(logging.DEBUG)
+    mitogen.core._v = True
+    mitogen.core._vv = True
+
+    l = klass()
+    state = {'consumed': 0, 'produced': 0, 'crash': 0}
+
+    def cons():
+        try:
+            while 1:
+                g = l.get()
+                print('got=%s consumed=%s produced=%s crash=%s' % (
+                    g, state['consumed'], state['produced'], state['crash']
+                ))
+                state['consumed'] += 1
+                time.sleep(g)
+                for x in range(int(g * 1000)):
+                    pass
+        except Exception:
+            LOG.exception('consumer crashed')
+            state['crash'] += 1
+
+    def prod():
         while 1:
-            g = l.get()
-            print('got=%s consumed=%s produced=%s crash=%s' % (g, consumed, produced, crash))
-            consumed += 1
-            time.sleep(g)
-            for x in range(int(g * 1000)):
-                pass
-    except:
-        crash += 1
-
-def prod():
-    global produced
+            l.put(random.random()/10)
+            state['produced'] += 1
+            time.sleep(random.random()/10)
+
+    allc = [threading.Thread(target=cons) for x in range(64)]
+    allp = [threading.Thread(target=prod) for x in range(8)]
+    for th in allc+allp:
+        th.setDaemon(True)
+        th.start()
+
     while 1:
-        l.put(random.random()/10)
-        produced += 1
-        time.sleep(random.random()/10)
-
-allc = [threading.Thread(target=cons) for x in range(64)]
-allp = [threading.Thread(target=prod) for x in range(8)]
-for th in allc+allp:
-    th.setDaemon(True)
+        time.sleep(1)
+
+
+def count_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def ping_pong(klass, count=20000):
+    """
+    Bounce an item between two threads, so every get() sleeps.
+    """
+    ping = klass()
+    pong = klass()
+
+    def echo():
+        for x in range(count):
+            pong.put(ping.get())
+
+    th = threading.Thread(target=echo)
     th.start()
+    t0 = time.time()
+    for x in range(count):
+        ping.put(x)
+        pong.get()
+    elapsed = time.time() - t0
+    th.join()
+    return 1e6 * elapsed / count
+
+
+def fan_out(klass, threads=32, count=2000):
+    """
+    Many consumers sleeping on one latch, as in a service pool.
+    """
+    latch = klass()
+    done = klass()
+    fds = []
+
+    def consume():
+        for x in range(count):
+            latch.get()
+        done.put(None)
+
+    ths = [threading.Thread(target=consume) for x in range(threads)]
+    for th in ths:
+        th.start()
+    t0 = time.time()
+    for x in range(count * threads):
+        latch.put(x)
+        if x == 100:
+            fds.append(count_fds())
+    for th in ths:
+        done.get()
+    elapsed = time.time() - t0
+    for th in ths:
+        th.join()
+    return 1e6 * elapsed / (count * threads), fds[0]
+
+
+def compare():
+    print('%-12s %16s %16s %12s' % ('engine', 'ping-pong usec',
+                                   'fan-out usec', 'fds in use'))
+    for name in 'socketpair', 'eventfd':
+        if name == 'eventfd' and not mitogen.core._eventfd:
+            print('%-12s (os.eventfd() unavailable)' % (name,))
+            continue
+        klass = ENGINES[name]
+        base = count_fds()
+        latency = ping_pong(klass)
+        per_item, fds = fan_out(klass)
+        print('%-12s %16.1f %16.1f %12d' % (name, latency, per_item,
+                                           fds - base))
+        sys.stdout.flush()
+
 
-raw_input()
-exit()
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['stress']:
+        stress(ENGINES[(sys.argv[2:3] or ['socketpair'])[0]])
+    else:
+        compare()
@@ -0,0 +1,39 @@
+"""
+Make many calls to one long-lived context, reporting the number of disconnect
+listeners registered on it and the process's peak RSS as calls complete. Both
+should remain flat: every call registers a listener for its reply handle, and
+must remove it once the reply arrives.
+
+    listeners.py [calls]
+"""
+
+import resource
+import sys
+import time
+
+import mitogen
+
+
+def do_nothing():
+    pass
+
+
+def report(context, calls, t0):
+    print('calls=%-8d listeners=%-4d maxrss=%-8d kB  %.1f us/call' % (
+        calls,
+        len(context._signals.get('disconnect', ())),
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        1e6 * (time.time() - t0) / max(1, calls),
+    ))
+    sys.stdout.flush()
+
+
+@mitogen.main()
+def main(router):
+    total = int((sys.argv[1:2] or ['200000'])[0])
+    context = router.fork()
+    t0 = time.time()
+    for x in range(total):
+        context.call(do_nothing)
+        if (x + 1) % (total // 10 or 1) == 0:
+            report(context, x + 1, t0)
@@ -0,0 +1,597 @@
+import os
+import select
+import socket
+import struct
+import threading
+import zlib
+
+import unittest2
+
+import mitogen.core
+from mitogen.core import b
+
+import testlib
+
+
+class FakeRouter(object):
+    max_message_size = 128 * 1048576
+    _flow_waiters = 0
+    _queued_bytes = 0
+
+    def __init__(self):
+        self.received = []
+        self.broker = FakeBroker()
+
+    def _async_route(self, msg, stream):
+        self.received.append(msg)
+
+
+class FakeBroker(object):
+    def stop_receive(self, stream):
+        pass
+
+    def _start_transmit(self, stream):
+        pass
+
+    def _stop_transmit(self, stream):
+        pass
+
+
+def frame(data, handle=123, dst_id=1, src_id=2, auth_id=3, reply_to=4,
+          flag=0):
+    return struct.pack(mitogen.core.Stream.HEADER_FMT,
+                       dst_id, src_id, auth_id, handle, reply_to,
+                       len(data) | flag) + data
+
+
+def compressed_frame(data, **kwargs):
+    return frame(zlib.compress(data), flag=mitogen.core.Stream.COMPRESSED_FLAG,
+                 **kwargs)
+
+
+class ZeroCopyStream(mitogen.core.Stream):
+    zero_copy_receive = True
+
+
+class DequeStream(mitogen.core.Stream):
+    zero_copy_receive = False
+
+
+class ReceiveMixin(object):
+    klass = None
+
+    def setUp(self):
+        super(ReceiveMixin, self).setUp()
+        self.router = FakeRouter()
+        self.broker = FakeBroker()
+        self.stream = self.klass(self.router, 1)
+        self.rsock, self.wsock = socket.socketpair()
+        self.stream.receive_side = mitogen.core.Side(
+            self.stream, os.dup(self.rsock.fileno())
+        )
+
+    def tearDown(self):
+        self.stream.receive_side.close()
+        self.rsock.close()
+        self.wsock.close()
+        super(ReceiveMixin, self).tearDown()
+
+    def wait_readable(self):
+        select.select([self.stream.receive_side.fd], [], [], 5.0)
+
+    def send_and_receive(self, s, count, step=None):
+        # Write from a thread, since `s` may exceed the socket buffer size.
+        def write():
+            for i in range(0, len(s), step or len(s)):
+                self.wsock.sendall(s[i:i+(step or len(s))])
+        th = threading.Thread(target=write)
+        th.start()
+        try:
+            while len(self.router.received) < count:
+                self.assertFalse(self.stream.receive_side.closed)
+                self.wait_readable()
+                self.stream.on_receive(self.broker)
+        finally:
+            th.join()
+        return self.router.received
+
+    def test_single(self):
+        msgs = self.send_and_receive(frame(b('hello')), 1)
+        msg, = msgs
+        self.assertEquals(b('hello'), msg.data)
+        self.assertTrue(isinstance(msg.data, mitogen.core.BytesType))
+        self.assertEquals((1, 2, 3, 123, 4),
+            (msg.dst_id, msg.src_id, msg.auth_id, msg.handle, msg.reply_to))
+        self.assertEquals(self.router, msg.router)
+
+    def test_empty_body(self):
+        msg, = self.send_and_receive(frame(b('')), 1)
+        self.assertEquals(b(''), msg.data)
+
+    def test_many_in_one_read(self):
+        datas = [b(str(i)) * i for i in range(100)]
+        s = b('').join(frame(data, handle=i) for i, data in enumerate(datas))
+        msgs = self.send_and_receive(s, len(datas))
+        self.assertEquals(datas, [msg.data for msg in msgs])
+        self.assertEquals(list(range(100)), [msg.handle for msg in msgs])
+
+    def test_split_header(self):
+        # Header and body arrive one byte at a time.
+        datas = [b('a') * 10, b('b') * 3]
+        s = b('').join(frame(data) for data in datas)
+        msgs = self.send_and_receive(s, len(datas), step=1)
+        self.assertEquals(datas, [msg.data for msg in msgs])
+
+    def test_larger_than_buffer(self):
+        data = os.urandom(5 * mitogen.core.CHUNK_SIZE + 13)
+        s = frame(b('x')) + frame(data) + frame(b('y'))
+        msgs = self.send_and_receive(s, 3, step=40000)
+        self.assertEquals([b('x'), data, b('y')], [msg.data for msg in msgs])
+
+    def test_max_message_size_exceeded(self):
+        self.router.max_message_size = 4
+        log = testlib.LogCapturer()
+        log.start()
+        self.wsock.sendall(frame(b('12345')))
+        self.wait_readable()
+        self.stream.on_receive(self.broker)
+        self.assertEquals([], self.router.received)
+        self.assertTrue('Maximum message size exceeded' in log.stop())
+
+    def test_compressed(self):
+        data = b('x') * 100000
+        s = frame(b('a')) + compressed_frame(data) + frame(b('b'))
+        msgs = self.send_and_receive(s, 3, step=1000)
+        self.assertEquals([b('a'), data, b('b')], [msg.data for msg in msgs])
+
+    def test_compressed_max_message_size_exceeded(self):
+        self.router.max_message_size = 1000
+        log = testlib.LogCapturer()
+        log.start()
+        self.wsock.sendall(compressed_frame(b('x') * 1001))
+        self.wait_readable()
+        self.stream.on_receive(self.broker)
+        self.assertEquals([], self.router.received)
+        self.assertTrue('Maximum message size exceeded' in log.stop())
+        self.assertTrue(self.stream.receive_side.closed)
+
+    def test_compressed_corrupt(self):
+        log = testlib.LogCapturer()
+        log.start()
+        self.wsock.sendall(frame(b('junk'),
+                                 flag=mitogen.core.Stream.COMPRESSED_FLAG))
+        self.wait_readable()
+        self.stream.on_receive(self.broker)
+        self.assertEquals([], self.router.received)
+        self.assertTrue('corrupt compressed message' in log.stop())
+        self.assertTrue(self.stream.receive_side.closed)
+
+    def test_more(self):
+        s = (frame(b('a'), flag=mitogen.core.Stream.MORE_FLAG) +
+             frame(b('b')))
+        msgs = self.send_and_receive(s, 2)
+        self.assertEquals([(b('a'), True), (b('b'), False)],
+                          [(msg.data, msg.more) for msg in msgs])
+
+    def test_priority(self):
+        s = (frame(b('a'), flag=mitogen.core.Stream.PRIORITY_FLAG) +
+             frame(b('b')))
+        msgs = self.send_and_receive(s, 2)
+        self.assertEquals([(b('a'), True), (b('b'), False)],
+                          [(msg.data, msg.priority) for msg in msgs])
+
+    def test_disconnect(self):
+        disconnected = []
+        mitogen.core.listen(self.stream, 'disconnect',
+                            lambda: disconnected.append(True))
+        self.wsock.close()
+        self.wait_readable()
+        self.stream.on_receive(self.broker)
+        self.assertEquals([True], disconnected)
+
+
+class ZeroCopyReceiveTest(ReceiveMixin, testlib.TestCase):
+    klass = ZeroCopyStream
+
+    def test_buffer_shrinks_after_large_message(self):
+        data = b('x') * (4 * self.stream.INPUT_BUF_SIZE)
+        self.send_and_receive(frame(data), 1)
+        self.assertTrue(len(self.stream._input_buf) > len(data))
+        self.send_and_receive(frame(b('y')), 2)
+        self.assertEquals(self.stream.INPUT_BUF_SIZE,
+                          len(self.stream._input_buf))
+
+ZeroCopyReceiveTest = unittest2.skipIf(
+    condition=not mitogen.core.HAVE_MEMORYVIEW,
+    reason='memoryview unavailable',
+)(ZeroCopyReceiveTest)
+
+
+class DequeReceiveTest(ReceiveMixin, testlib.TestCase):
+    klass = DequeStream
+
+
+class VectoredStream(mitogen.core.Stream):
+    vectored_transmit = True
+
+
+class SingleStream(mitogen.core.Stream):
+    vectored_transmit = False
+
+
+class TransmitMixin(object):
+    klass = None
+
+    def setUp(self):
+        super(TransmitMixin, self).setUp()
+        self.router = FakeRouter()
+        self.broker = FakeBroker()
+        self.stream = self.klass(self.router, 1)
+        self.rsock, self.wsock = socket.socketpair()
+        self.stream.transmit_side = mitogen.core.Side(
+            self.stream, os.dup(self.wsock.fileno())
+        )
+
+    def tearDown(self):
+        self.stream.transmit_side.close()
+        self.rsock.close()
+        self.wsock.close()
+        super(TransmitMixin, self).tearDown()
+
+    def send(self, datas):
+        for i, data in enumerate(datas):
+            self.stream._send(mitogen.core.Message(
+                dst_id=1, src_id=2, auth_id=3, handle=i, reply_to=4,
+                data=data,
+            ))
+
+    def transmit_and_read(self, expect):
+        # Read from a thread, since the queue may exceed the socket buffer.
+        chunks = []
+        def read():
+            size = 0
+            while size < expect:
+                chunk = self.rsock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+        th = threading.Thread(target=read)
+        th.start()
+        try:
+            while self.stream.pending_bytes():
+                self.assertFalse(self.stream.transmit_side.closed)
+                select.select([], [self.stream.transmit_side.fd], [], 5.0)
+                self.stream.on_transmit(self.broker)
+        finally:
+            th.join()
+        return b('').join(chunks)
+
+    def test_framing(self):
+        datas = [b(str(i)) * i for i in range(100)]
+        expect = b('').join(frame(data, handle=i)
+                            for i, data in enumerate(datas))
+        self.send(datas)
+        self.assertEquals(len(datas), self.stream.tx_messages)
+        self.assertEquals(len(expect), self.stream.pending_bytes())
+        self.assertEquals(len(expect), self.router._queued_bytes)
+        self.assertEquals(expect, self.transmit_and_read(len(expect)))
+        self.assertEquals(0, self.stream.pending_bytes())
+        self.assertEquals(0, self.router._queued_bytes)
+
+    def test_empty_body(self):
+        self.send([b('')])
+        self.assertEquals(frame(b(''), handle=0),
+                          self.transmit_and_read(len(frame(b('')))))
+
+    def test_partial_write(self):
+        # Bodies larger than the socket buffer force short writes.
+        datas = [os.urandom(3 * mitogen.core.CHUNK_SIZE + i)
+                 for i in range(5)]
+        expect = b('').join(frame(data, handle=i)
+                            for i, data in enumerate(datas))
+        self.send(datas)
+        self.assertEquals(expect, self.transmit_and_read(len(expect)))
+
+    def test_disconnect(self):
+        disconnected = []
+        mitogen.core.listen(self.stream, 'disconnect',
+                            lambda: disconnected.append(True))
+        self.rsock.close()
+        self.send([b('x')])
+        self.stream.on_transmit(self.broker)
+        self.assertEquals([True], disconnected)
+        # Output that will never be written is no longer counted.
+        self.assertEquals(0, self.router._queued_bytes)
+
+    def test_would_block(self):
+        try:
+            while True:
+                self.wsock.send(b('x') * 65536)
+        except socket.error:
+            pass
+        self.send([b('x')])
+        size = self.stream.pending_bytes()
+        self.stream.on_transmit(self.broker)
+        self.assertFalse(self.stream.transmit_side.closed)
+        self.assertTrue(self.stream.transmit_side.would_block)
+        self.assertEquals(size, self.stream.pending_bytes())
+
+
+class VectoredTransmitTest(TransmitMixin, testlib.TestCase):
+    klass = VectoredStream
+
+    def test_coalesced(self):
+        datas = [b('x') * 10] * 100
+        expect = b('').join(frame(data, handle=i)
+                            for i, data in enumerate(datas))
+        self.send(datas)
+        self.transmit_and_read(len(expect))
+        self.assertTrue(self.stream.tx_syscalls < self.stream.tx_messages)
+
+VectoredTransmitTest = unittest2.skipIf(
+    condition=mitogen.core._writev is None,
+    reason='os.writev() unavailable',
+)(VectoredTransmitTest)
+
+
+class SingleTransmitTest(TransmitMixin, testlib.TestCase):
+    klass = SingleStream
+
+    def test_one_write_per_message(self):
+        self.send([b('x') * 10] * 10)
+        self.transmit_and_read(10 * len(frame(b('x') * 10)))
+        self.assertEquals(10, self.stream.tx_syscalls)
+
+
+class CompressTransmitTest(TransmitMixin, testlib.TestCase):
+    klass = mitogen.core.Stream
+
+    def setUp(self):
+        super(CompressTransmitTest, self).setUp()
+        self.stream.compression_level = 6
+
+    def parse(self, s):
+        fmt = mitogen.core.Stream.HEADER_FMT
+        hdr_len = mitogen.core.Stream.HEADER_LEN
+        msg_len = struct.unpack(fmt, s[:hdr_len])[-1]
+        return msg_len, s[hdr_len:]
+
+    def test_compressible(self):
+        data = b('hello world\n') * 1000
+        self.send([data])
+        msg_len, body = self.parse(self.transmit_and_read(1))
+        self.assertTrue(msg_len & mitogen.core.Stream.COMPRESSED_FLAG)
+        self.assertEquals(msg_len & ~mitogen.core.Stream.COMPRESSED_FLAG,
+                          len(body))
+        self.assertEquals(data, zlib.decompress(body))
+        self.assertEquals(1, self.stream.tx_compressed)
+        self.assertEquals(len(data) - len(body),
+                          self.stream.tx_compression_saved)
+
+    def test_below_threshold(self):
+        data = b('x') * (self.stream.compression_threshold - 1)
+        self.send([data])
+        self.assertEquals(frame(data, handle=0),
+                          self.transmit_and_read(len(frame(data))))
+        self.assertEquals(0, self.stream.tx_compressed)
+
+    def test_incompressible(self):
+        # Large enough to be rejected by sampling, and also small enough to
+        # be rejected after compressing the whole payload.
+        for size in 8192, 65536:
+            data = os.urandom(size)
+            self.send([data])
+            self.assertEquals(frame(data, handle=0),
+                              self.transmit_and_read(len(frame(data))))
+        self.assertEquals(0, self.stream.tx_compressed)
+
+    def test_disabled(self):
+        self.stream.compression_level = 0
+        data = b('x') * 10000
+        self.send([data])
+        self.assertEquals(frame(data, handle=0),
+                          self.transmit_and_read(len(frame(data))))
+
+
+class FragmentTransmitTest(TransmitMixin, testlib.TestCase):
+    klass = mitogen.core.Stream
+
+    def parse(self, s):
+        fmt = mitogen.core.Stream.HEADER_FMT
+        hdr_len = mitogen.core.Stream.HEADER_LEN
+        frames = []
+        while s:
+            msg_len = struct.unpack(fmt, s[:hdr_len])[-1]
+            size = msg_len & mitogen.core.Stream.LENGTH_MASK
+            more = (msg_len & mitogen.core.Stream.MORE_FLAG) != 0
+            frames.append((s[hdr_len:hdr_len+size], more))
+            s = s[hdr_len+size:]
+        return frames
+
+    def test_fragmented(self):
+        self.stream.fragment_size = 1000
+        data = os.urandom(2500)
+        self.send([data])
+        self.assertEquals(3, self.stream.tx_fragments)
+        self.assertEquals(1, self.stream.tx_messages)
+        s = self.transmit_and_read(self.stream.pending_bytes())
+        self.assertEquals([(data[:1000], True), (data[1000:2000], True),
+                           (data[2000:], False)], self.parse(s))
+
+    def test_exact_size(self):
+        self.stream.fragment_size = 1000
+        data = os.urandom(1000)
+        self.send([data])
+        self.assertEquals(frame(data, handle=0),
+                          self.transmit_and_read(len(frame(data))))
+        self.assertEquals(0, self.stream.tx_fragments)
+
+    def test_fragment_size_above_length_mask(self):
+        # A frame longer than LENGTH_MASK would set the flag bits above it.
+        self.stream.LENGTH_MASK = 1000
+        self.stream.fragment_size = 5000
+        data = os.urandom(2500)
+        self.send([data])
+        self.assertEquals(3, self.stream.tx_fragments)
+        s = self.transmit_and_read(self.stream.pending_bytes())
+        self.assertEquals([(data[:1000], True), (data[1000:2000], True),
+                           (data[2000:], False)], self.parse(s))
+
+    def test_forwarded_fragment(self):
+        self.stream.fragment_size = 1000
+        # A fragment forwarded onto a stream with a smaller fragment size
+        # keeps its flag on every piece.
+        data = os.urandom(1500)
+        self.stream._send(mitogen.core.Message(data=data, more=True,
+                                               dst_id=1, handle=0))
+        s = self.transmit_and_read(self.stream.pending_bytes())
+        self.assertEquals([(data[:1000], True), (data[1000:], True)],
+                          self.parse(s))
+
+    def test_compressed_fragments(self):
+        self.stream.fragment_size = 1000
+        self.stream.compression_level = 6
+        self.stream.compression_threshold = 100
+        data = b('hello world\n') * 200
+        self.send([data])
+        self.assertEquals(3, self.stream.tx_compressed)
+        frames = self.parse(self.transmit_and_read(self.stream.pending_bytes()))
+        self.assertEquals([True, True, False], [more for _, more in frames])
+        self.assertEquals(data, b('').join(zlib.decompress(body)
+                                           for body, _ in frames))
+
+
+class OutOfBandTransmitTest(TransmitMixin, testlib.TestCase):
+    klass = VectoredStream
+
+    def send_blob(self, blob):
+        msg = mitogen.core.Message.pickled((blob,), protocol=5, dst_id=1,
+                                           src_id=2, auth_id=3, handle=0,
+                                           reply_to=4)
+        self.stream._send(msg)
+        return msg
+
+    def test_not_copied(self):
+        blob = mitogen.core.Blob(os.urandom(65536))
+        msg = self.send_blob(blob)
+        self.assertTrue(any(isinstance(buf, memoryview) and buf.obj is blob
+                            for buf in self.stream._output_buf))
+        expect = frame(msg.data, handle=0)
+        self.assertEquals(expect, self.transmit_and_read(len(expect)))
+
+    def test_fragmented(self):
+        self.stream.fragment_size = 1000
+        blob = mitogen.core.Blob(os.urandom(2500))
+        msg = self.send_blob(blob)
+        hdr_len = mitogen.core.Stream.HEADER_LEN
+        s = self.transmit_and_read(self.stream.pending_bytes())
+        bodies = []
+        while s:
+            size = struct.unpack(mitogen.core.Stream.HEADER_FMT,
+                                 s[:hdr_len])[-1]
+            size &= mitogen.core.Stream.LENGTH_MASK
+            bodies.append(s[hdr_len:hdr_len+size])
+            s = s[hdr_len+size:]
+        self.assertEquals([1000, 1000], [len(body) for body in bodies[:2]])
+        data = b('').join(bodies)
+        self.assertEquals(msg.data, data)
+        self.assertEquals((blob,), mitogen.core.Message(data=data).unpickle())
+
+OutOfBandTransmitTest = unittest2.skipIf(
+    condition=(mitogen.core._writev is None or
+               mitogen.core.pickle.HIGHEST_PROTOCOL < 5),
+    reason='os.writev() or pickle protocol 5 unavailable',
+)(OutOfBandTransmitTest)
+
+
+class PriorityTransmitTest(TransmitMixin, testlib.TestCase):
+    klass = mitogen.core.Stream
+
+    def send_one(self, handle, data, priority=False):
+        self.stream._send(mitogen.core.Message(
+            dst_id=1, src_id=2, auth_id=3, handle=handle, reply_to=4,
+            data=data, priority=priority,
+        ))
+
+    def parse(self, s):
+        fmt = mitogen.core.Stream.HEADER_FMT
+        hdr_len = mitogen.core.Stream.HEADER_LEN
+        frames = []
+        while s:
+            hdr = struct.unpack(fmt, s[:hdr_len])
+            size = hdr[-1] & mitogen.core.Stream.LENGTH_MASK
+            priority = (hdr[-1] & mitogen.core.Stream.PRIORITY_FLAG) != 0
+            frames.append((hdr[3], priority))
+            s = s[hdr_len+size:]
+        return frames
+
+    def test_overtakes_bulk(self):
+        chunk = b('x') * mitogen.core.CHUNK_SIZE
+        budget = self.stream.WRITEV_BUDGET // len(chunk)
+        for i in range(2 * budget):
+            self.send_one(i, chunk)
+        self.send_one(1000, b('ack'), priority=True)
+        self.assertEquals((1, len(frame(b('ack'))), budget,
+                           budget * len(frame(chunk))),
+                          self.stream.pending_lanes())
+        frames = self.parse(self.transmit_and_read(
+            self.stream.pending_bytes()
+        ))
+        # The priority frame waits only for frames already being written.
+        expect = [(i, False) for i in range(2 * budget)]
+        expect.insert(budget, (1000, True))
+        self.assertEquals(expect, frames)
+        self.assertEquals(1, self.stream.tx_priority)
+        self.assertEquals((0, 0, 0, 0), self.stream.pending_lanes())
+
+    def test_priority_handle(self):
+        self.send_one(mitogen.core.ADD_ROUTE, b('x'))
+        self.assertEquals([(mitogen.core.ADD_ROUTE, True)],
+                          self.parse(self.transmit_and_read(1)))
+
+    def test_payload_handles_bulk(self):
+        for handle in (mitogen.core.CALL_FUNCTION, mitogen.core.CALL_SERVICE,
+                       mitogen.core.LOAD_MODULE):
+            self.send_one(handle, b('x'))
+        self.assertEquals(0, self.stream.tx_priority)
+
+    def test_bulk_not_starved(self):
+        chunk = b('x') * mitogen.core.CHUNK_SIZE
+        quantum = self.stream.PRIORITY_QUANTUM // len(chunk)
+        budget = self.stream.WRITEV_BUDGET // len(chunk)
+        for i in range(budget):
+            self.send_one(i, chunk)
+        self.send_one(50, chunk)
+        for i in range(2 * quantum):
+            self.send_one(200 + i, chunk, priority=True)
+        frames = self.parse(self.transmit_and_read(
+            self.stream.pending_bytes()
+        ))
+        handles = [handle for handle, _ in frames]
+        self.assertEquals(list(range(budget)), handles[:budget])
+        # The bulk frame follows one quantum of priority frames.
+        self.assertEquals(budget + quantum, handles.index(50))
+
+
+class CongestionTest(TransmitMixin, testlib.TestCase):
+    klass = mitogen.core.Stream
+
+    def test_congested(self):
+        self.stream.high_watermark = 1000
+        self.stream.low_watermark = 500
+        self.send([b('x') * 600])
+        self.assertFalse(self.stream.congested)
+        self.send([b('x') * 600])
+        self.assertTrue(self.stream.congested)
+        self.transmit_and_read(self.stream.pending_bytes())
+        self.assertFalse(self.stream.congested)
+
+    def test_disabled(self):
+        self.stream.high_watermark = 0
+        self.send([b('x') * 1000])
+        self.assertFalse(self.stream.congested)
+
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -57,6 +57,24 @@ if hasattr(subprocess, 'check_output'):
     subprocess__check_output = subprocess.check_output
 
 
+def get_python2():
+    """
+    Return the name of a working Python 2 interpreter on PATH, or
+    :data:`None` if none can be run.
+    """
+    fp = open(os.devnull, 'wb')
+    try:
+        for name in 'python2', 'python2.7':
+            try:
+                if subprocess.call([name, '-c', ''], stdout=fp,
+                                   stderr=fp) == 0:
+                    return name
+            except OSError:
+                pass
+    finally:
+        fp.close()
+
+
 def wait_for_port(
         host,
         port,
@@ -0,0 +1,130 @@
+import os
+import select
+import struct
+import threading
+
+import unittest2
+
+import mitogen.core
+
+import testlib
+
+
+class FakeBroker(object):
+    def __init__(self):
+        self.shutdown_calls = 0
+
+    def shutdown(self):
+        self.shutdown_calls += 1
+
+
+class PipeWaker(mitogen.core.Waker):
+    use_eventfd = False
+
+
+class EventfdWaker(mitogen.core.Waker):
+    use_eventfd = True
+
+
+class DeferMixin(object):
+    klass = None
+
+    def setUp(self):
+        super(DeferMixin, self).setUp()
+        self.broker = FakeBroker()
+        self.waker = self.klass(self.broker)
+
+    def tearDown(self):
+        self.waker.receive_side.close()
+        self.waker.transmit_side.close()
+        super(DeferMixin, self).tearDown()
+
+    def is_readable(self):
+        rfds, _, _ = select.select([self.waker.receive_side.fd], [], [], 0)
+        return bool(rfds)
+
+    def test_single_wake_per_burst(self):
+        results = []
+        for x in range(100):
+            self.waker.defer(results.append, x)
+        if self.waker.use_eventfd:
+            s = os.read(self.waker.receive_side.fd, 8)
+            self.assertEquals(1, struct.unpack('Q', s)[0])
+        else:
+            self.assertEquals(mitogen.core.b(' '),
+                              os.read(self.waker.receive_side.fd, 128))
+        self.assertEquals(100, self.waker.keep_alive)
+
+    def test_drains_whole_queue(self):
+        results = []
+        for x in range(100):
+            self.waker.defer(results.append, x)
+        self.waker.on_receive(self.broker)
+        self.assertEquals(list(range(100)), results)
+        self.assertEquals(0, self.waker.keep_alive)
+        self.assertFalse(self.is_readable())
+
+    def test_wakes_again_after_drain(self):
+        results = []
+        self.waker.defer(results.append, 1)
+        self.waker.on_receive(self.broker)
+        self.waker.defer(results.append, 2)
+        self.assertTrue(self.is_readable())
+        self.waker.on_receive(self.broker)
+        self.assertEquals([1, 2], results)
+
+    def test_crash_shuts_down_broker(self):
+        log = testlib.LogCapturer()
+        log.start()
+        self.waker.defer(lambda: 1/0)
+        self.waker.on_receive(self.broker)
+        self.assertTrue('defer() crashed' in log.stop())
+        self.assertEquals(1, self.broker.shutdown_calls)
+
+    def test_immediate_on_broker_thread(self):
+        self.waker.broker_ident = threading.currentThread().ident
+        self.assertEquals(123, self.waker.defer(lambda: 123))
+        self.assertFalse(self.is_readable())
+
+
+class PipeDeferTest(DeferMixin, testlib.TestCase):
+    klass = PipeWaker
+
+
+class EventfdDeferTest(DeferMixin, testlib.TestCase):
+    klass = EventfdWaker
+
+EventfdDeferTest = unittest2.skipIf(
+    condition=mitogen.core._eventfd is None,
+    reason='os.eventfd() unavailable',
+)(EventfdDeferTest)
+
+
+class ThreadedDeferTest(testlib.BrokerMixin, testlib.TestCase):
+    def test_many_producers(self):
+        # Every call from every thread runs exactly once, in order per thread.
+        results = []
+        latch = mitogen.core.Latch()
+
+        def produce(n):
+            for x in range(1000):
+                self.broker.defer(results.append, (n, x))
+            self.broker.defer(latch.put, n)
+
+        threads = [threading.Thread(target=produce, args=(n,))
+                   for n in range(16)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        for th in threads:
+            latch.get(timeout=10.0)
+
+        self.assertEquals(16 * 1000, len(results))
+        for n in range(16):
+            self.assertEquals(list(range(1000)),
+                              [x for m, x in results if m == n])
+
+
+if __name__ == '__main__':
+    unittest2.main()